@@ -1,13 +1,20 @@
-from flask import Flask, request, render_template, redirect, url_for, send_file, flash, jsonify, session
+from flask import Flask, request, render_template, redirect, url_for, send_file, flash, jsonify, session, g, Response, stream_with_context
 import os
 import time
-import glob
 import tempfile
-import shutil
-import threading
 import re
+import uuid
+import threading
+import urllib.parse
 from werkzeug.utils import secure_filename
-from pdf_logic import process_pdf
+import json
+from jobs import submit_job, get_job, list_jobs, queue_depth, wait_for_job
+import metrics
+import job_store
+import file_index
+import reaper
+import zip_stream
+from profiling import list_profiles, find_profile
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
@@ -20,10 +27,17 @@ ALLOWED_EXTENSIONS = {'pdf'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# 临时文件管理
-TEMP_FILES = {}  # 存储临时文件信息 {session_id: {'files': [], 'timestamp': time}}
+# 临时文件管理：每个session最近一次的结果文件和过期时间保存在job_store中，所有worker共用
 TEMP_CLEANUP_DELAY = 3600  # 1小时后清理未下载的文件
 
+# 任务进度SSE：没有新进度时每隔SSE_HEARTBEAT秒重发一次当前状态（带idle_seconds），
+# 连接保持SSE_MAX_SECONDS后断开，由浏览器的EventSource自动重连。
+# 每个SSE连接占用一个gunicorn同步线程，每个worker最多SSE_MAX_STREAMS个，超出时返回204，浏览器改为轮询
+SSE_HEARTBEAT = 10
+SSE_MAX_SECONDS = 25
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '2'))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -35,66 +49,47 @@ def get_session_id():
 
 def cleanup_temp_files(session_id):
     """清理指定session的临时文件"""
-    if session_id in TEMP_FILES:
-        temp_info = TEMP_FILES[session_id]
-        for file_path in temp_info.get('files', []):
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # 清理空的临时目录
-                temp_dir = os.path.dirname(file_path)
-                if os.path.exists(temp_dir) and not os.listdir(temp_dir):
-                    os.rmdir(temp_dir)
-            except Exception as e:
-                print(f"清理文件失败 {file_path}: {e}")
-        del TEMP_FILES[session_id]
-
-def schedule_cleanup(session_id, delay=TEMP_CLEANUP_DELAY):
-    """计划清理临时文件"""
-    def delayed_cleanup():
-        time.sleep(delay)
-        cleanup_temp_files(session_id)
-    
-    thread = threading.Thread(target=delayed_cleanup)
-    thread.daemon = True
-    thread.start()
+    reaper.remove_files(job_store.delete_session_files(session_id))
 
 def store_temp_files(session_id, file_paths):
-    """存储临时文件信息"""
-    TEMP_FILES[session_id] = {
-        'files': file_paths,
-        'timestamp': time.time()
-    }
-    
-    # 清理旧的temp_output目录
-    cleanup_old_temp_dirs()
+    """存储临时文件信息，到期后由后台清理线程删除（过期session、旧目录和磁盘配额都在reaper中处理）"""
+    expires_at = time.time() + TEMP_CLEANUP_DELAY
+    job_store.set_session_files(session_id, file_paths, expires_at)
+    reaper.schedule(expires_at)
 
-def cleanup_old_temp_dirs():
-    """清理超过2小时的临时输出目录"""
-    try:
-        temp_output_dir = os.path.join(os.getcwd(), 'temp_output')
-        if not os.path.exists(temp_output_dir):
-            return
-            
-        current_time = time.time()
-        for item in os.listdir(temp_output_dir):
-            item_path = os.path.join(temp_output_dir, item)
-            if os.path.isdir(item_path):
-                # 检查目录创建时间
-                dir_time = os.path.getctime(item_path)
-                if current_time - dir_time > 7200:  # 2小时 = 7200秒
-                    import shutil
-                    shutil.rmtree(item_path)
-                    print(f"🗑️ 清理过期目录: {item_path}", flush=True)
-    except Exception as e:
-        print(f"⚠️ 清理临时目录失败: {str(e)}", flush=True)
+def temp_output_usage():
+    """temp_output目录占用的字节数（/metrics抓取时计算）"""
+    total = 0
+    for root, _, files in os.walk(os.path.join(os.getcwd(), 'temp_output')):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # 计算过程中文件被清理
+    return [('temp_output_bytes', None, total)]
+
+metrics.register_collector(temp_output_usage)
+metrics.register_collector(lambda: [('temp_files_sessions', None, job_store.count_sessions())])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    reaper.ensure_started()
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由模板（而不是实际URL）记录请求数和耗时，避免文件名造成标签爆炸"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.record_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
 
 def get_recent_results():
     """获取当前session的处理结果"""
-    session_id = get_session_id()
-    if session_id in TEMP_FILES:
-        temp_info = TEMP_FILES[session_id]
-        files = temp_info.get('files', [])
+    temp_info = job_store.get_session_files(get_session_id())
+    if temp_info and temp_info['expires_at'] >= time.time():
+        files = temp_info['files']
         
         # 检查文件是否还存在
         existing_files = [f for f in files if os.path.exists(f)]
@@ -111,137 +106,304 @@ def get_recent_results():
                 else:
                     warehouse_files.append(file_path)
             
+            # 仓库模式的多个输出文件可以一次打包下载
+            entry = file_index.lookup_path(warehouse_files[0]) if len(warehouse_files) > 1 else None
             return {
-                'output_files': warehouse_files if warehouse_files else None,
-                'sorted_file': algin_file
+                'output_files': result_links(warehouse_files) if warehouse_files else None,
+                'sorted_file': result_links([algin_file])[0] if algin_file else None,
+                'archive_url': url_for('download_job_archive', job_id=entry['job_id'])
+                               if entry and entry['job_id'] else None
             }
     
-    return {'output_files': None, 'sorted_file': None}
+    return {'output_files': None, 'sorted_file': None, 'archive_url': None}
+
+def to_relative_path(file_path):
+    """转换绝对路径为相对路径用于下载链接"""
+    cwd = os.getcwd()
+    if file_path.startswith(cwd):
+        return os.path.relpath(file_path, cwd)
+    return file_path
+
+def result_links(paths):
+    """结果文件的名称、文件ID和下载链接（已登记到文件索引的按ID下载）"""
+    return [
+        {
+            'name': os.path.basename(path),
+            'path': to_relative_path(path),
+            'file_id': file_id,
+            'download_url': url_for('download_file', filename=file_id or to_relative_path(path)),
+        }
+        for path, file_id in zip(paths, file_index.file_ids(paths))
+    ]
+
+def send_output_file(entry):
+    """
+    发送输出文件：由send_file通过wsgi.file_wrapper流式发送（gunicorn下使用sendfile），不读入内存；
+    支持Range和If-None-Match/If-Range，ETag为登记时计算的内容SHA-256；
+    文件已被重新生成但还没有重新登记时，改用send_file按修改时间和大小生成的ETag
+    """
+    response = send_file(
+        entry['path'],
+        as_attachment=True,
+        download_name=entry['name'],
+        mimetype='application/pdf',
+        conditional=True,
+        etag=entry.get('etag') or True,
+    )
+    # 处理中文文件名的编码问题
+    encoded_filename = urllib.parse.quote(entry['name'], safe='')
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}"
+    # 浏览器和打印工作站可以缓存文件，再次下载时用ETag验证，未变化时只返回304；
+    # 不设置max-age，因为提前输出的组可能被重新生成、文件可能被重命名，而文件ID不变
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def resolve_output_file(filename):
+    """
+    按文件ID（或旧链接中的路径、文件名）在输出文件索引中查找，找不到时返回None；不扫描任何目录
+    文件ID是不可猜测的随机值，链接本身就是下载凭证；路径和文件名可以猜到，只能下载当前session的输出文件
+    """
+    if file_index.FILE_ID_PATTERN.match(filename):
+        return file_index.lookup(filename)
+    session_id = session.get('session_id')
+    if not session_id:
+        return None
+    abs_filename = filename if os.path.isabs(filename) else os.path.join(os.getcwd(), filename)
+    entry = file_index.lookup_path(abs_filename, session_id=session_id)
+    if entry is None or entry['session_id'] != session_id:
+        return None
+    return entry
+
+def job_to_dict(job):
+    """转换任务信息为JSON响应；运行中的仓库任务results为已提前写出的文件"""
+    return {
+        'job_id': job['id'],
+        'mode': job['mode'],
+        'filename': job['filename'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'error': job['error'],
+        'report': job.get('report'),
+        'profile': [
+            url_for('download_profile', job_id=job['id'], kind=os.path.splitext(path)[1][1:])
+            for path in job['profile'] if not path.endswith('.json')
+        ] if job.get('profile') else None,
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'results': result_links(job['results']),
+        'archive_url': url_for('download_job_archive', job_id=job['id'])
+                       if job['status'] == 'done' and job['results'] else None,
+    }
 
 @app.route('/')
 def index():
+    job_id = request.args.get('job')
+    if job_id:
+        # 显示指定任务的结果，未完成时由页面轮询任务状态
+        job = get_job(job_id)
+        if job and job['session_id'] == get_session_id():
+            if job['status'] == 'done':
+                results = result_links([f for f in job['results'] if os.path.exists(f)])
+                if job['mode'] == 'algin':
+                    return render_template('index.html', sorted_file=results[0] if results else None)
+                archive_url = url_for('download_job_archive', job_id=job_id) if len(results) > 1 else None
+                return render_template('index.html', output_files=results or None, archive_url=archive_url)
+            if job['status'] == 'failed':
+                flash(f"Error processing file: {job['error']}")
+                return redirect(url_for('index'))
+            return render_template('index.html', pending_job=job_to_dict(job))
+    
     # 检查是否有最近的处理结果
     recent = get_recent_results()
     return render_template('index.html', 
                          output_files=recent['output_files'], 
-                         sorted_file=recent['sorted_file'])
+                         sorted_file=recent['sorted_file'],
+                         archive_url=recent['archive_url'])
 
-@app.route('/', methods=['POST'])
-def upload_warehouse():
-    """处理仓库分拣功能"""
-    print("🔄 收到仓库分拣请求", flush=True)
-    if 'pdf_file' not in request.files:
-        flash('No file selected')
+def enqueue_upload(mode):
+    """保存上传文件并提交后台处理任务，立即返回任务ID"""
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    
+    def fail(message, status=400):
+        if wants_json:
+            return jsonify({'success': False, 'error': message}), status
+        flash(message)
         return redirect(url_for('index'))
     
+    if 'pdf_file' not in request.files:
+        return fail('No file selected')
+    
     file = request.files['pdf_file']
     if file.filename == '':
-        flash('No file selected')
-        return redirect(url_for('index'))
+        return fail('No file selected')
     
-    if file and file.filename and allowed_file(file.filename):
-        timestamp = str(int(time.time()))
-        filename = f"{timestamp}_{secure_filename(file.filename)}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filepath)
-        
-        try:
-            print(f"📁 创建临时目录处理文件: {filename}", flush=True)
-            # 使用应用内的输出目录，更可靠
-            new_timestamp = int(time.time())
-            temp_dir = os.path.join(os.getcwd(), 'temp_output', f"warehouse_{new_timestamp}")
-            os.makedirs(temp_dir, exist_ok=True)
-            print(f"📂 临时目录: {temp_dir}", flush=True)
-            results = process_pdf(filepath, temp_dir, mode="warehouse")
-            print(f"✅ 处理完成，生成了 {len(results)} 个文件", flush=True)
-            
-            # 存储临时文件信息
-            session_id = get_session_id()
-            store_temp_files(session_id, results)
-            
-            # 计划清理（1小时后）
-            schedule_cleanup(session_id, TEMP_CLEANUP_DELAY)
-            
-            # 转换绝对路径为相对路径用于下载链接
-            relative_results = []
-            cwd = os.getcwd()
-            for result in results:
-                if result.startswith(cwd):
-                    relative_path = os.path.relpath(result, cwd)
-                    relative_results.append(relative_path)
-                else:
-                    relative_results.append(result)
-            
-            flash(f'Successfully processed! Generated {len(results)} files.')
-            return render_template('index.html', output_files=relative_results)
-            
-        except Exception as e:
-            print(f"❌ Error processing warehouse file: {str(e)}", flush=True)
-            flash(f'Error processing file: {str(e)}')
-            return redirect(url_for('index'))
+    if not (file and file.filename and allowed_file(file.filename)):
+        return fail('Invalid file type. Please upload a PDF file.')
     
-    flash('Invalid file type. Please upload a PDF file.')
-    return redirect(url_for('index'))
+    timestamp = str(int(time.time()))
+    # 同一秒内上传的同名文件不能互相覆盖：处理中的输入PDF是内存映射的，被截断会导致进程崩溃
+    filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    file.save(filepath)
+    
+    # 使用应用内的输出目录，更可靠；同一秒内的多个上传需要独立目录
+    temp_root = os.path.join(os.getcwd(), 'temp_output')
+    os.makedirs(temp_root, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f"{mode}_{int(time.time())}_", dir=temp_root)
+    print(f"📂 临时目录: {temp_dir}", flush=True)
+    
+    session_id = get_session_id()
+    
+    def on_complete(job):
+        if job['status'] == 'done':
+            # 存储临时文件信息，1小时后由后台清理线程删除
+            store_temp_files(session_id, job['results'])
+    
+    # profile=1（表单字段或查询参数）对本次任务做性能分析；未指定时由PROFILE_JOBS决定
+    profile_flag = request.values.get('profile')
+    job_id = submit_job(filepath, temp_dir, mode, session_id=session_id,
+                        filename=file.filename, on_complete=on_complete,
+                        profile=profile_flag == '1' if profile_flag is not None else None)
+    
+    if wants_json:
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id),
+            'events_url': url_for('job_events', job_id=job_id),
+            'result_url': url_for('index', job=job_id),
+        }), 202
+    return redirect(url_for('index', job=job_id))
+
+@app.route('/', methods=['POST'])
+def upload_warehouse():
+    """处理仓库分拣功能"""
+    print("🔄 收到仓库分拣请求", flush=True)
+    return enqueue_upload('warehouse')
 
 @app.route('/sort_labels', methods=['POST'])
 def sort_labels():
     """处理ALGIN客户Label排序功能"""
     print("🔄 收到ALGIN排序请求", flush=True)
-    if 'pdf_file' not in request.files:
-        flash('No file selected')
-        return redirect(url_for('index'))
+    return enqueue_upload('algin')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """查询任务状态、进度和结果文件"""
+    job = get_job(job_id)
+    if not job or job['session_id'] != get_session_id():
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **job_to_dict(job)})
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent Events推送任务进度：progress事件包含阶段、页数、OCR页数、已用时间、预计剩余时间，
+    以及距上次进度更新的秒数（idle_seconds持续增长说明任务卡住，而不只是慢）和已经可以下载的文件；任务结束时发送done事件
+    """
+    job = get_job(job_id)
+    if not job or job['session_id'] != get_session_id():
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    result_url = url_for('index', job=job_id)
     
-    file = request.files['pdf_file']
-    if file.filename == '':
-        flash('No file selected')
-        return redirect(url_for('index'))
+    def event(name, job):
+        data = {
+            'status': job['status'],
+            'progress': job['progress'],
+            'error': job['error'],
+            'idle_seconds': round(time.time() - job['updated_at'], 1),
+            'results': result_links(job['results']),
+            'result_url': result_url,
+        }
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
     
-    if file and file.filename and allowed_file(file.filename):
-        timestamp = str(int(time.time()))
-        filename = f"{timestamp}_{secure_filename(file.filename)}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filepath)
-        
-        try:
-            print(f"📁 创建ALGIN临时目录处理文件: {filename}", flush=True)
-            # 使用应用内的输出目录，更可靠
-            new_timestamp = int(time.time())
-            temp_dir = os.path.join(os.getcwd(), 'temp_output', f"algin_{new_timestamp}")
-            os.makedirs(temp_dir, exist_ok=True)
-            print(f"📂 ALGIN临时目录: {temp_dir}", flush=True)
-            results = process_pdf(filepath, temp_dir, mode="algin")
-            print(f"✅ ALGIN处理完成，生成了 {len(results)} 个文件", flush=True)
-            
-            # 存储临时文件信息
-            session_id = get_session_id()
-            store_temp_files(session_id, results)
-            
-            # 计划清理（1小时后）
-            schedule_cleanup(session_id, TEMP_CLEANUP_DELAY)
-            
-            # 对于ALGIN排序，我们只返回第一个结果作为sorted_file
-            sorted_file = results[0] if results else None
-            
-            # 转换绝对路径为相对路径用于下载链接
-            if sorted_file:
-                cwd = os.getcwd()
-                if sorted_file.startswith(cwd):
-                    sorted_file = os.path.relpath(sorted_file, cwd)
-            
-            flash(f'Successfully processed! Generated {len(results)} files.')
-            return render_template('index.html', sorted_file=sorted_file)
-            
-        except Exception as e:
-            print(f"❌ Error processing ALGIN file: {str(e)}", flush=True)
-            flash(f'Error processing file: {str(e)}')
-            return redirect(url_for('index'))
+    def stream():
+        deadline = time.time() + SSE_MAX_SECONDS
+        current = job
+        yield "retry: 2000\n\n"
+        while current is not None:
+            if current['status'] in ('done', 'failed'):
+                yield event('done', current)
+                return
+            yield event('progress', current)
+            if time.time() > deadline:
+                return
+            current = wait_for_job(job_id, current['version'], SSE_HEARTBEAT)
+    
+    # 线程留给上传、查询和下载；SSE连接已满时返回204（EventSource不再重连），页面退回轮询
+    if not _sse_slots.acquire(blocking=False):
+        return Response(status=204)
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    released = []
+    
+    def release_slot():
+        if not released:
+            released.append(True)
+            _sse_slots.release()
+    
+    response.call_on_close(release_slot)
+    return response
+
+@app.route('/jobs/<job_id>/download.zip')
+def download_job_archive(job_id):
+    """把任务的所有输出文件打包成一个ZIP下载：存储模式（PDF不再压缩），边打包边发送，不生成临时压缩包"""
+    job = get_job(job_id)
+    if not job or job['session_id'] != get_session_id():
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'error': 'Job not finished'}), 409
+    
+    entries = [file_index.lookup_path(path) for path in job['results']]
+    files = [(entry['name'], entry['path']) for entry in entries if entry]
+    if not files:
+        return jsonify({'success': False, 'error': 'Output files have been cleaned up'}), 404
     
-    flash('Invalid file type. Please upload a PDF file.')
-    return redirect(url_for('index'))
+    archive_name = f"{os.path.splitext(job['filename'] or job_id)[0]}_{job['mode']}.zip"
+    encoded_filename = urllib.parse.quote(archive_name, safe='')
+    print(f"📦 打包下载: {job_id}，{len(files)} 个文件", flush=True)
+    return Response(zip_stream.iter_zip(files), mimetype='application/zip',
+                    headers={'Content-Disposition': f"attachment; filename*=UTF-8''{encoded_filename}",
+                             'Cache-Control': 'private, no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs')
+def list_session_jobs():
+    """列出当前session的所有任务"""
+    jobs = [job_to_dict(job) for job in list_jobs(get_session_id())]
+    return jsonify({'success': True, 'jobs': jobs, 'queue_depth': queue_depth()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus格式的运行指标（所有gunicorn worker的汇总）"""
+    if not metrics.METRICS_ENABLED:
+        return "Metrics disabled", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles')
+def list_job_profiles():
+    """列出当前session最近保存的慢任务性能分析"""
+    temp_root = os.path.join(os.getcwd(), 'temp_output')
+    profiles = [
+        {
+            **profile,
+            'pstats_url': url_for('download_profile', job_id=profile['job_id'], kind='pstats'),
+            'collapsed_url': url_for('download_profile', job_id=profile['job_id'], kind='collapsed'),
+        }
+        for profile in list_profiles(temp_root, get_session_id())
+    ]
+    return jsonify({'success': True, 'profiles': profiles})
+
+@app.route('/profiles/<job_id>.<kind>')
+def download_profile(job_id, kind):
+    """下载性能分析文件：pstats（python -m pstats / snakeviz）或collapsed（flamegraph.pl / speedscope）"""
+    path = find_profile(os.path.join(os.getcwd(), 'temp_output'), job_id, kind, get_session_id())
+    if not path:
+        return "Profile not found", 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path),
+                     mimetype='application/octet-stream' if kind == 'pstats' else 'text/plain')
 
 @app.route('/rename_file', methods=['POST'])
 def rename_file():
@@ -262,53 +424,21 @@ def rename_file():
         if re.search(r'[<>:"/\\|?*]', new_filename):
             return jsonify({'success': False, 'error': 'Filename contains invalid characters'})
         
-        # 使用session管理的临时文件信息
+        # 按文件ID（或当前session中的文件名）在输出文件索引中查找
         session_id = get_session_id()
+        file_id = data.get('file_id')
+        if file_id:
+            entry = file_index.lookup(file_id)
+        else:
+            entry = file_index.lookup_path(os.path.join(os.getcwd(), old_filename), session_id=session_id)
         
-        file_found = False
-        old_path = None
-        new_path = None
-        
-        # 首先在当前session的临时文件中查找
-        if session_id in TEMP_FILES:
-            temp_info = TEMP_FILES[session_id]
-            temp_files = temp_info.get('files', [])
-            
-            for file_path in temp_files:
-                file_basename = os.path.basename(file_path)
-                file_exists = os.path.exists(file_path)
-                
-                if file_basename == old_filename and file_exists:
-                    old_path = file_path
-                    new_path = os.path.join(os.path.dirname(file_path), new_filename)
-                    file_found = True
-                    break
-        
-        # 如果在session中没找到，搜索所有临时目录（安全fallback）
-        if not file_found:
-            # 搜索应用内的temp_output目录和系统临时目录
-            search_patterns = [
-                os.path.join(os.getcwd(), "temp_output", "algin_*"),
-                os.path.join(os.getcwd(), "temp_output", "warehouse_*"),
-                os.path.join(tempfile.gettempdir(), "algin_*"),
-                os.path.join(tempfile.gettempdir(), "warehouse_*")
-            ]
-            
-            for pattern in search_patterns:
-                matching_dirs = glob.glob(pattern)
-                
-                for dir_path in matching_dirs:
-                    potential_path = os.path.join(dir_path, old_filename)
-                    if os.path.exists(potential_path):
-                        old_path = potential_path
-                        new_path = os.path.join(dir_path, new_filename)
-                        file_found = True
-                        break
-                if file_found:
-                    break
-        
-        if not file_found:
+        if entry is None:
             return jsonify({'success': False, 'error': f'File "{old_filename}" not found. Please re-process your file.'})
+        if entry['session_id'] != session_id:
+            # 只能重命名自己session的输出文件
+            return jsonify({'success': False, 'error': f'File "{old_filename}" not found.'}), 404
+        old_path = entry['path']
+        new_path = os.path.join(os.path.dirname(old_path), new_filename)
         
         # 检查新文件名是否已存在
         if os.path.exists(new_path):
@@ -317,22 +447,20 @@ def rename_file():
         # 执行重命名
         os.rename(old_path, new_path)
         
-        # 更新临时文件信息
-        if session_id in TEMP_FILES:
-            temp_info = TEMP_FILES[session_id]
-            updated_files = []
-            for file_path in temp_info.get('files', []):
-                if file_path == old_path:
-                    updated_files.append(new_path)
-                else:
-                    updated_files.append(file_path)
-            TEMP_FILES[session_id]['files'] = updated_files
+        # 更新文件索引、临时文件信息和任务结果，文件ID和下载链接保持不变
+        file_index.rename(entry['id'], new_path)
+        job_store.replace_session_file(session_id, old_path, new_path)
+        job = get_job(entry['job_id']) if entry['job_id'] else None
+        if job and old_path in job['results']:
+            job_store.update_job(job['id'], results=[new_path if path == old_path else path for path in job['results']])
         
         return jsonify({
             'success': True, 
             'new_filename': new_filename,
             'old_path': old_path,
-            'new_path': new_path
+            'new_path': new_path,
+            'file_id': entry['id'],
+            'download_url': url_for('download_file', filename=entry['id'])
         })
         
     except PermissionError:
@@ -353,71 +481,16 @@ def download_file(filename):
     try:
         print(f"📥 下载请求: {filename}", flush=True)
         
-        # 处理文件路径 - 统一处理相对路径
-        if not os.path.isabs(filename):
-            # 相对路径直接在当前工作目录中查找
-            abs_filename = os.path.join(os.getcwd(), filename)
-            print(f"🔄 相对路径转绝对路径: {abs_filename}", flush=True)
-        else:
-            # 绝对路径直接使用
-            abs_filename = filename
-            print(f"🔄 使用绝对路径: {abs_filename}", flush=True)
-        
-        # 检查文件是否存在
-        if not os.path.exists(abs_filename):
-            print(f"❌ 文件不存在: {abs_filename}", flush=True)
-            print(f"📂 当前工作目录: {os.getcwd()}", flush=True)
-            
-            # 尝试在临时目录中查找
-            import glob
-            # 搜索应用内的temp_output目录和系统/tmp目录
-            temp_files = (
-                glob.glob(f"{os.getcwd()}/temp_output/*/*.pdf") + 
-                glob.glob(f"/tmp/*/*.pdf")
-            )
-            print(f"🔍 找到的临时文件: {temp_files}", flush=True)
-            
-            # 查找匹配的文件
-            target_filename = os.path.basename(filename)
-            print(f"🎯 查找目标文件名: {target_filename}", flush=True)
-            
-            matching_files = [f for f in temp_files if os.path.basename(f) == target_filename]
-            print(f"✅ 匹配的文件: {matching_files}", flush=True)
-            
-            if matching_files:
-                # 使用找到的第一个匹配文件
-                abs_filename = matching_files[0]
-                print(f"🔄 使用找到的文件: {abs_filename}", flush=True)
-            else:
-                flash('File not found')
-                return redirect(url_for('index'))
-        
-        print(f"✅ 开始下载文件: {abs_filename}", flush=True)
-        
-        # 获取文件名
-        filename_only = os.path.basename(abs_filename)
-        print(f"📝 下载文件名: {filename_only}", flush=True)
-        
-        # 发送文件，添加强制下载头
-        response = send_file(
-            abs_filename, 
-            as_attachment=True,
-            download_name=filename_only,
-            mimetype='application/pdf'
-        )
-        
-        # 处理中文文件名的编码问题
-        import urllib.parse
-        encoded_filename = urllib.parse.quote(filename_only, safe='')
-        
-        # 添加强制下载的响应头 - 使用双引号避免转义问题
-        response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}"
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        # 按文件ID（兼容旧的路径链接）在输出文件索引中查找
+        entry = resolve_output_file(filename)
+        if entry is None:
+            print(f"❌ 文件不存在: {filename}", flush=True)
+            flash('File not found')
+            return redirect(url_for('index'))
         
-        print(f"🔄 设置响应头: Content-Disposition=attachment; filename*=UTF-8''{encoded_filename}", flush=True)
+        print(f"✅ 开始下载文件: {entry['path']}", flush=True)
+        response = send_output_file(entry)
+        print(f"🔄 下载响应: {response.status_code} {entry['name']} ({entry['size']} bytes)", flush=True)
         return response
     except Exception as e:
         print(f"❌ 下载错误: {str(e)}", flush=True)
@@ -437,52 +510,14 @@ def force_download_file(filename):
     try:
         print(f"🔥 强制下载请求: {filename}", flush=True)
         
-        # 处理文件路径 - 统一处理相对路径
-        if not os.path.isabs(filename):
-            # 相对路径直接在当前工作目录中查找
-            abs_filename = os.path.join(os.getcwd(), filename)
-        else:
-            # 绝对路径直接使用
-            abs_filename = filename
-            
-        print(f"🔥 强制下载路径: {abs_filename}", flush=True)
-        
-        if not os.path.exists(abs_filename):
-            # 搜索临时文件
-            import glob
-            temp_files = glob.glob(f"{os.getcwd()}/temp_output/*/*.pdf")
-            target_filename = os.path.basename(filename)
-            matching_files = [f for f in temp_files if os.path.basename(f) == target_filename]
-            
-            if matching_files:
-                abs_filename = matching_files[0]
-                print(f"🔥 找到文件: {abs_filename}", flush=True)
-            else:
-                return "File not found", 404
-        
-        # 读取文件内容并直接返回
-        with open(abs_filename, 'rb') as f:
-            file_data = f.read()
-        
-        from flask import Response
-        import urllib.parse
-        filename_only = os.path.basename(abs_filename)
-        encoded_filename = urllib.parse.quote(filename_only, safe='')
-        
-        response = Response(
-            file_data,
-            mimetype='application/pdf',
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
-                'Content-Type': 'application/pdf',
-                'Content-Length': str(len(file_data)),
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            }
-        )
+        entry = resolve_output_file(filename)
+        if entry is None:
+            return "File not found", 404
+        print(f"🔥 强制下载路径: {entry['path']}", flush=True)
         
-        print(f"🔥 强制下载响应已创建: {filename_only}", flush=True)
+        # 流式发送，不把整个文件读入内存
+        response = send_output_file(entry)
+        print(f"🔥 强制下载响应已创建: {entry['name']}", flush=True)
         return response
         
     except Exception as e:
@@ -0,0 +1,136 @@
+"""
+命令行批量处理：不启动Flask，直接对一个目录或glob匹配到的PDF运行process_pdf
+
+用法:
+    python batch_process.py uploads/ --mode warehouse --jobs 4 --output batch_output
+    python batch_process.py "uploads/*UPS*.pdf" --mode algin
+
+输出目录结构为 <output>/<mode>/<PDF文件名>/，每个文件处理完后向summary.jsonl追加一行JSON：
+{"file", "mode", "status", "seconds", "pages", "output_dir", "outputs": [{"name", "pages"}], "report", "error"}
+其中report为process_pdf的处理报告（各阶段计时和计数器）
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pypdf import PdfReader
+
+from pdf_logic import process_pdf
+
+
+def collect_inputs(patterns):
+    """展开目录和glob，返回去重后的PDF路径列表（保持顺序）"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, '*.pdf'))))
+        else:
+            paths.extend(sorted(glob.glob(pattern)))
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def output_dirs(paths, output_root, mode):
+    """每个PDF对应 <output>/<mode>/<文件名>/，不同目录下的同名文件加序号区分"""
+    dirs = {}
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        suffix = 2
+        while name in used:
+            name = f"{stem}_{suffix}"
+            suffix += 1
+        used.add(name)
+        dirs[path] = os.path.join(output_root, mode, name)
+    return dirs
+
+
+def count_pages(path):
+    return len(PdfReader(path).pages)
+
+
+def process_one(input_pdf, output_dir, mode, quiet=False):
+    """在worker进程中处理单个PDF，返回summary记录"""
+    record = {
+        'file': input_pdf,
+        'mode': mode,
+        'status': 'done',
+        'seconds': 0.0,
+        'pages': None,
+        'output_dir': output_dir,
+        'outputs': [],
+        'report': None,
+        'error': None,
+    }
+    start = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            # 文件之间已经按进程并行，单个文件内不再开进程池
+            outputs, report = process_pdf(input_pdf, output_dir, mode=mode, workers=1, return_report=True)
+        record['outputs'] = [
+            {'name': os.path.basename(path), 'pages': count_pages(path)}
+            for path in outputs
+        ]
+        record['report'] = report.to_dict()
+        record['pages'] = record['report']['info'].get('pages')
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量处理PDF标签（不启动Web服务）")
+    parser.add_argument('inputs', nargs='+', help="PDF文件、目录或glob模式")
+    parser.add_argument('--mode', choices=['warehouse', 'algin'], default='warehouse',
+                        help="处理模式（默认warehouse）")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="并行处理的文件数（默认CPU核数）")
+    parser.add_argument('--output', '-o', default='batch_output', help="输出根目录（默认batch_output）")
+    parser.add_argument('--summary', help="JSON lines汇总文件（默认<output>/summary.jsonl）")
+    parser.add_argument('--quiet', '-q', action='store_true', help="不显示process_pdf的逐页日志")
+    args = parser.parse_args(argv)
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("❌ 没有找到PDF文件", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+    summary_path = args.summary or os.path.join(args.output, 'summary.jsonl')
+    dirs = output_dirs(paths, args.output, args.mode)
+    jobs = max(1, min(args.jobs, len(paths)))
+    print(f"📦 批量处理: {len(paths)} 个PDF, 模式 {args.mode}, {jobs} 个进程", file=sys.stderr)
+
+    failed = 0
+    start = time.perf_counter()
+    with open(summary_path, 'a', encoding='utf-8') as summary, \
+            ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(process_one, path, dirs[path], args.mode, args.quiet) for path in paths]
+        for future in as_completed(futures):
+            record = future.result()
+            summary.write(json.dumps(record, ensure_ascii=False) + '\n')
+            summary.flush()
+            if record['status'] == 'failed':
+                failed += 1
+                print(f"❌ {os.path.basename(record['file'])}: {record['error']}", file=sys.stderr)
+            else:
+                groups = ', '.join(f"{output['name']} {output['pages']}页" for output in record['outputs'])
+                print(f"✅ {os.path.basename(record['file'])} ({record['seconds']:.1f}s): {groups}",
+                      file=sys.stderr)
+
+    print(f"🏁 完成 {len(paths) - failed}/{len(paths)} 个文件, 用时 {time.perf_counter() - start:.1f}s, "
+          f"汇总: {summary_path}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
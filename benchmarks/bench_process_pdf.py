@@ -0,0 +1,147 @@
+"""
+process_pdf的基准测试：对真实样本和合成标签PDF分别运行仓库模式和ALGIN模式
+
+用法:
+    python benchmarks/bench_process_pdf.py [PDF文件或目录 ...] [--synthetic 10,100,1000,5000]
+        [--modes warehouse,algin] [--json 结果.json] [--compare 上次结果.json]
+
+默认使用uploads/下的示例PDF加上10/100/1000/5000页的合成PDF（benchmarks/synthetic_labels.py，固定种子）。
+每个用例在独立的子进程中运行（串行分类、不使用结果缓存），报告每秒页数、各阶段耗时、
+峰值内存和tesseract调用次数；--json保存结果，--compare与之前保存的结果对比。
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PHASES = ['parse', 'extract', 'ocr', 'match', 'sort', 'write']
+
+
+def run_case(input_pdf, mode):
+    """子进程中运行一次process_pdf，返回计时结果"""
+    # 导入和处理过程中的日志都不输出，只保留表格
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return _run_case(input_pdf, mode)
+
+
+def _run_case(input_pdf, mode):
+    import pdf_logic
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        outputs, report = pdf_logic.process_pdf(input_pdf, output_dir, mode=mode, workers=1, use_cache=False,
+                                                return_report=True)
+    data = report.to_dict()
+    timings = data['timings']
+    phases = {
+        'parse': timings.get('parse', 0.0),
+        'extract': sum(timings.get(name, 0.0) for name in ('extract_text', 'fast_extract_text', 'visual_check')),
+        'ocr': timings.get('ocr', 0.0),
+        'match': timings.get('sku_match', 0.0),
+        'sort': timings.get('sort', 0.0),
+        'write': timings.get('write', 0.0),
+    }
+    return {
+        'seconds': data['info']['total_seconds'],
+        'phases': {name: round(value, 4) for name, value in phases.items()},
+        'peak_rss_mb': pdf_logic.peak_rss_mb(),
+        'ocr_calls': data['counters'].get('tesseract_calls', 0),
+        'outputs': len(outputs),
+        'report': data,
+    }
+
+
+def page_count(path):
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def build_corpus(paths, synthetic_sizes, modes, work_dir):
+    """返回 [(名称, 路径, 模式)]；合成PDF按模式分别生成，内容只由页数和种子决定"""
+    from benchmarks.synthetic_labels import generate
+
+    cases = []
+    for path in paths:
+        for mode in modes:
+            cases.append((os.path.basename(path), path, mode))
+    for size in synthetic_sizes:
+        for mode in modes:
+            path = os.path.join(work_dir, f"synthetic_{mode}_{size}.pdf")
+            if not os.path.exists(path):
+                generate(size, path, mode)
+            cases.append((os.path.basename(path), path, mode))
+    return cases
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(item['name'], item['mode']): item for item in json.load(f)['results']}
+    print(f"\n📊 与 {baseline_path} 对比 (页/秒):")
+    for item in results:
+        before = baseline.get((item['name'], item['mode']))
+        if not before or not before['pages_per_second']:
+            continue
+        change = item['pages_per_second'] / before['pages_per_second'] - 1
+        print(f"   {item['name'][:48]:48s} {item['mode']:9s} "
+              f"{before['pages_per_second']:9.1f} → {item['pages_per_second']:9.1f} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process_pdf基准测试")
+    parser.add_argument('inputs', nargs='*', help="PDF文件或目录（默认uploads/）")
+    parser.add_argument('--synthetic', default='10,100,1000,5000', help="合成PDF的页数，逗号分隔，空字符串表示不生成")
+    parser.add_argument('--modes', default='warehouse,algin')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'pdf_bench'),
+                        help="合成PDF的存放目录，已存在的文件直接复用")
+    parser.add_argument('--json', help="保存结果的JSON文件")
+    parser.add_argument('--compare', help="与之前保存的JSON结果对比")
+    args = parser.parse_args()
+
+    inputs = args.inputs or [os.path.join(ROOT, 'uploads')]
+    paths = []
+    for arg in inputs:
+        paths.extend(sorted(glob.glob(os.path.join(arg, '*.pdf'))) if os.path.isdir(arg) else [arg])
+    sizes = [int(size) for size in args.synthetic.split(',') if size.strip()]
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    os.makedirs(args.work_dir, exist_ok=True)
+    cases = build_corpus(paths, sizes, modes, args.work_dir)
+
+    print(f"{'文件':48s} {'模式':9s} {'页数':>6s} {'页/秒':>9s} "
+          + ' '.join(f"{phase:>8s}" for phase in PHASES) + f" {'峰值MB':>8s} {'OCR':>5s}")
+    results = []
+    # 每个用例一个新的spawn子进程，峰值内存互不影响
+    context = multiprocessing.get_context('spawn')
+    for name, path, mode in cases:
+        pages = page_count(path)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, path, mode).result()
+        result.update({
+            'name': name,
+            'mode': mode,
+            'pages': pages,
+            'pages_per_second': round(pages / result['seconds'], 2) if result['seconds'] else None,
+        })
+        results.append(result)
+        peak = f"{result['peak_rss_mb']:8.1f}" if result['peak_rss_mb'] is not None else f"{'-':>8s}"
+        print(f"{name[:48]:48s} {mode:9s} {pages:6d} {result['pages_per_second'] or 0:9.1f} "
+              + ' '.join(f"{result['phases'][phase]:8.3f}" for phase in PHASES)
+              + f" {peak} {result['ocr_calls']:5d}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存: {args.json}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+ALGIN SKU提取的微基准测试：对比旧的逐模式re.findall写法和预编译模式的写法（仍按模式逐个扫描）
+
+用法:
+    python benchmarks/bench_sku_extraction.py [PDF文件或目录 ...]
+
+默认使用uploads/下的示例PDF，先用pdfplumber提取每页文本，再分别计时两种写法的每页耗时，
+并校验两种写法得到的候选SKU完全一致。
+"""
+import os
+import re
+import sys
+import glob
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfplumber
+from pdf_logic import extract_algin_sku_candidates
+
+# 旧写法：模式以字符串形式写在循环内，每个模式都重新调用text.upper()
+LEGACY_PATTERNS = [
+    r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9]+)\b',
+    r'\b(\d{3})-([A-Z]{2,4})—(\d+)-?([A-Z]*)\b',
+    r'\b([A-Z0-9]{3,5})-([A-Z]{2})\b',
+    r'\b([A-Z0-9]{3,5})—([A-Z]{2})\b',
+    r'\b(\d{3})-([A-Z]{2})—([A-Z0-9]+)\b',
+    r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]+)\b',
+    r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]{2,3})\b',
+    r'\b(014)-([A-Z]{2})-(\d{5})\b',
+    r'\b(050)-([A-Z]{2,3})-(\d{2,5})-?([A-Z]*)\b',
+    r'\b(060)-([A-Z]{3})-(\d{2,3}[A-Z]*)-([A-Z]{2,3})\b',
+    r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]+)',
+    r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]*)',
+    r'([A-Z0-9]{3,5})\s*[-—]\s*([A-Z]{2})',
+    r'(\d{3})\s*[-—]?\s*([A-Z]{2,4})',
+    r'([A-Z0-9]{4,6})\s*[-—]\s*([A-Z]{1,3})',
+    r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9-]+)\b',
+    r'\b([A-Z0-9]{3,6})-([A-Z0-9]{2,6})\b',
+]
+
+def legacy_extract(text):
+    found_skus = []
+    for pattern in LEGACY_PATTERNS:
+        matches = re.findall(pattern, text.upper())
+        if matches:
+            for match in matches:
+                if isinstance(match, tuple):
+                    non_empty_parts = [part for part in match if part]
+                    potential_sku = '-'.join(non_empty_parts)
+                else:
+                    potential_sku = match
+                if (len(potential_sku) >= 5 and
+                    not re.match(r'^\d{4}$', potential_sku) and
+                    not potential_sku.startswith('AGD') and
+                    re.search(r'[A-Z]', potential_sku) and
+                    re.search(r'\d', potential_sku) and
+                    not re.match(r'^\d{3}-[A-Z]{2,4}$', potential_sku) and
+                    not potential_sku.startswith(('101-', '102-', '103-', '104-', '105-')) and
+                    not re.search(r'(AOI|AATT|AI0)', potential_sku)):
+                    found_skus.append(potential_sku)
+    return found_skus
+
+def load_page_texts(paths):
+    texts = []
+    for path in paths:
+        with pdfplumber.open(path) as plumber:
+            for page in plumber.pages:
+                texts.append(page.extract_text() or "")
+    return texts
+
+def bench(func, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            func(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+def main():
+    args = sys.argv[1:] or ['uploads']
+    paths = []
+    for arg in args:
+        paths.extend(sorted(glob.glob(os.path.join(arg, '*.pdf'))) if os.path.isdir(arg) else [arg])
+
+    texts = load_page_texts(paths)
+    text_pages = sum(1 for text in texts if text.strip())
+    print(f"📄 {len(paths)} 个PDF, {len(texts)} 页 (有文本 {text_pages} 页)")
+
+    # 校验结果一致（新写法对候选去重，保留首次出现的顺序）
+    for text in texts:
+        expected = list(dict.fromkeys(legacy_extract(text)))
+        assert extract_algin_sku_candidates(text) == expected, text[:200]
+    print("✅ 两种写法的候选SKU完全一致")
+
+    repeat = max(1, 2000 // max(len(texts), 1))
+    legacy = bench(legacy_extract, texts, repeat)
+    compiled = bench(extract_algin_sku_candidates, texts, repeat)
+    print(f"旧写法:   {legacy * 1e6:8.1f} µs/页")
+    print(f"预编译:   {compiled * 1e6:8.1f} µs/页")
+    print(f"加速:     {legacy / compiled:8.2f}x")
+
+if __name__ == '__main__':
+    main()
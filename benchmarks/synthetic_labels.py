@@ -0,0 +1,100 @@
+"""
+确定性的合成标签PDF生成器：相同的页数和种子总是生成相同的文件，基准测试可以离线复现
+
+用法:
+    python benchmarks/synthetic_labels.py 1000 [输出路径] [--mode warehouse|algin] [--seed 0]
+
+页面为4x6英寸的文本标签，按固定比例混合915/8090/60仓库标签、未知标签、空白页，
+ALGIN模式下再混入目录中的SKU标签和汇总页；没有图像页面，OCR需要用uploads/中的扫描件测试。
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from pdf_logic import WAREHOUSE_PREFIXES, load_algin_sku_order
+
+LABEL_WIDTH = 288   # 4英寸
+LABEL_HEIGHT = 432  # 6英寸
+ROWS_8090 = [f"A{chr(i)}" for i in range(ord("A"), ord("Z") + 1)]
+ROWS_60 = ["AA", "AB", "AC", "AD"]
+
+# (页面类型, 权重)
+WAREHOUSE_MIX = [('915', 30), ('8090', 35), ('60', 25), ('unknown', 7), ('blank', 3)]
+ALGIN_MIX = [('algin', 80), ('summary', 5), ('915', 5), ('unknown', 7), ('blank', 3)]
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _label_lines(kind, rng, catalog):
+    tracking = f"1Z{rng.randrange(10**15):015d}"
+    header = ["UPS GROUND", f"TRACKING #: {tracking}", f"SHIP TO: CUSTOMER {rng.randrange(10000):04d}"]
+    if kind == '915':
+        prefix = rng.choice(WAREHOUSE_PREFIXES["915"])
+        return header + [f"LOC: {prefix}-{rng.randrange(1000):03d}-{rng.choice('ABCDEF')}{rng.randrange(10)}"]
+    if kind == '8090':
+        prefix = rng.choice(WAREHOUSE_PREFIXES["8090"])
+        return header + [f"LOC: {prefix}-{rng.choice(ROWS_8090)}-{rng.randrange(10, 100)}"]
+    if kind == '60':
+        prefix = rng.choice(WAREHOUSE_PREFIXES["60"])
+        return header + [f"LOC: {prefix}-{rng.choice(ROWS_60)}-{rng.randrange(10, 100)}"]
+    if kind == 'algin':
+        return header + ["ALN", f"SO# {rng.randrange(100000, 999999)}", f"SKU: {rng.choice(catalog)} QTY 1"]
+    if kind == 'summary':
+        return ["ALGIN", f"UPS: {rng.randrange(1, 200)} Labels", f"Total {rng.randrange(1, 200)} Labels"]
+    return header + [f"REF: {rng.randrange(10**8):08d}"]
+
+
+def generate(pages, output_path, mode='warehouse', seed=0):
+    """生成pages页的合成标签PDF，返回output_path"""
+    rng = random.Random(f"{mode}:{pages}:{seed}")
+    catalog = load_algin_sku_order()
+    kinds, weights = zip(*(ALGIN_MIX if mode == 'algin' else WAREHOUSE_MIX))
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+
+    writer = PdfWriter()
+    for kind in rng.choices(kinds, weights=weights, k=pages):
+        page = writer.add_blank_page(width=LABEL_WIDTH, height=LABEL_HEIGHT)
+        if kind == 'blank':
+            continue
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font}),
+        })
+        ops = ["BT", "/F1 12 Tf", "14 TL", f"20 {LABEL_HEIGHT - 40} Td"]
+        for line in _label_lines(kind, rng, catalog):
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        content = DecodedStreamObject()
+        content.set_data("\n".join(ops).encode('latin-1'))
+        page.replace_contents(content)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'wb') as f:
+        writer.write(f)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成确定性的合成标签PDF")
+    parser.add_argument('pages', type=int)
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--mode', choices=['warehouse', 'algin'], default='warehouse')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    output = args.output or f"synthetic_{args.mode}_{args.pages}.pdf"
+    print(generate(args.pages, output, args.mode, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+输出文件索引：不透明的文件ID → 路径、大小、内容哈希（ETag）、所属session和任务
+process_pdf写出文件后登记到job_store中（所有worker可见），本进程再缓存一份，下载和重命名按ID直接定位，不扫描目录
+"""
+import os
+import re
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+import job_store
+
+FILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+CACHE_SIZE = 4096  # 本进程缓存的文件条目数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_cache = OrderedDict()  # 文件ID -> 条目
+_path_ids = {}  # 路径 -> 文件ID
+_lock = threading.Lock()
+
+
+def _remember(entry):
+    with _lock:
+        old = _cache.pop(entry['id'], None)
+        if old is not None:
+            _path_ids.pop(old['path'], None)
+        _cache[entry['id']] = entry
+        _path_ids[entry['path']] = entry['id']
+        while len(_cache) > CACHE_SIZE:
+            _, evicted = _cache.popitem(last=False)
+            _path_ids.pop(evicted['path'], None)
+
+
+def _forget(file_id):
+    with _lock:
+        entry = _cache.pop(file_id, None)
+        if entry is not None:
+            _path_ids.pop(entry['path'], None)
+
+
+def content_hash(path):
+    """文件内容的SHA-256（用作强ETag），在后台任务中写出文件后计算，下载时不再读取文件"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _matches(entry, stat):
+    """条目记录的大小和修改时间与文件一致，ETag仍然对应当前内容"""
+    return entry['size'] == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+
+
+def register(paths, session_id=None, job_id=None):
+    """登记输出文件，返回 {路径: 文件ID}；已登记的路径保留原来的ID（提前输出的组重新生成时链接不变）"""
+    entries = []
+    for path in paths:
+        path = os.path.abspath(path)
+        # 先取大小和修改时间再计算哈希：计算期间文件被替换时，下次查找会发现不一致
+        stat = os.stat(path)
+        entries.append({
+            'id': uuid.uuid4().hex,
+            'path': path,
+            'name': os.path.basename(path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'etag': content_hash(path),
+            'session_id': session_id,
+            'job_id': job_id,
+        })
+    ids = job_store.add_files(entries)
+    for entry in entries:
+        _remember(dict(entry, id=ids[entry['path']]))
+    return ids
+
+
+def lookup(file_id):
+    """
+    按ID查找文件条目，文件已被删除或ID无效时返回None
+    每次都用文件的大小和修改时间校验条目：文件被重新生成（提前输出的组）后不会返回旧的ETag和大小
+    """
+    if not FILE_ID_PATTERN.match(file_id or ''):
+        return None
+    entry = _cache.get(file_id)
+    stat = _stat(entry['path']) if entry else None
+    if entry is None or stat is None or not _matches(entry, stat):
+        # 本进程没有缓存，或文件已被其他进程重新生成、重命名、清理
+        entry = job_store.get_file(file_id)
+        stat = _stat(entry['path']) if entry else None
+        if stat is None:
+            _forget(file_id)
+            return None
+        if not _matches(entry, stat):
+            # 文件已被替换但还没有重新登记：不使用旧的ETag，按当前文件发送
+            _forget(file_id)
+            return dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns, etag=None)
+        _remember(entry)
+    return entry
+
+
+def lookup_path(path, session_id=None):
+    """按路径查找文件条目（兼容旧的路径下载链接）；路径不存在时按文件名在session的输出中查找"""
+    path = os.path.abspath(path)
+    file_id = _path_ids.get(path)
+    entry = lookup(file_id) if file_id else None
+    if entry is None:
+        row = job_store.get_file_by_path(path)
+        if row is None and session_id:
+            row = job_store.find_session_file(session_id, os.path.basename(path))
+        entry = lookup(row['id']) if row else None
+    return entry
+
+
+def file_ids(paths):
+    """已登记文件的ID，未登记的路径对应None"""
+    result = []
+    for path in paths:
+        entry = lookup_path(path)
+        result.append(entry['id'] if entry else None)
+    return result
+
+
+def rename(file_id, new_path):
+    """文件重命名后更新索引，ID保持不变"""
+    job_store.rename_file(file_id, new_path)
+    _forget(file_id)
+
+
+def forget(paths):
+    """文件被清理后删除索引"""
+    job_store.delete_files(paths)
+    with _lock:
+        for path in paths:
+            file_id = _path_ids.pop(path, None)
+            if file_id:
+                _cache.pop(file_id, None)
+
+
+def forget_under(directory):
+    """目录被清理后删除其中所有文件的索引"""
+    job_store.delete_files_under(directory)
+    prefix = os.path.join(directory, '')
+    with _lock:
+        for path in [path for path in _path_ids if path.startswith(prefix)]:
+            _cache.pop(_path_ids.pop(path), None)
@@ -1,7 +1,15 @@
+import os
+
 bind = "0.0.0.0:10000"
-workers = 1
+# 任务状态和结果文件信息都在job_store（SQLite）中，多个worker共用；内存充足时可用WEB_CONCURRENCY增加worker。
+# 但排队中和运行中的任务本身属于提交它的worker（其任务线程池和处理进程池），worker退出时这些任务会丢失
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# SSE进度连接会长时间占用一个请求线程，单个worker需要多个线程同时服务其他请求
+threads = 8
 timeout = 600  # 增加到10分钟，支持大文件处理
 keepalive = 2
-max_requests = 1000
-max_requests_jitter = 50
+# 不按请求数回收worker：状态轮询和SSE重连很快就会达到回收阈值，回收会中断该worker上所有排队中和运行中的任务
+max_requests = 0
+# 重启或部署时worker等待正在处理的任务完成后再退出，而不是30秒后被强制结束
+graceful_timeout = timeout
 preload_app = True
\ No newline at end of file
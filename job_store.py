@@ -0,0 +1,291 @@
+"""
+任务和结果存储：任务状态、输出文件、session归属、过期时间和输出文件索引保存在SQLite（WAL模式）中，
+gunicorn多个worker进程和各自的线程可以同时读写，worker被回收后结果也不会丢失
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from sqlite_util import local_connection, pid_alive
+
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(os.getcwd(), 'cache', 'jobs.sqlite3'))
+
+# 以JSON保存的任务字段
+_JSON_FIELDS = ('progress', 'results', 'report', 'profile')
+_JOB_FIELDS = (
+    'id', 'session_id', 'mode', 'filename', 'status', 'progress', 'results', 'error', 'report', 'profile',
+    'version', 'owner_pid', 'created_at', 'started_at', 'finished_at', 'updated_at', 'expires_at',
+    'input_path', 'output_dir',
+)
+
+_local = threading.local()
+
+
+def _create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            session_id TEXT,
+            mode TEXT NOT NULL,
+            filename TEXT,
+            status TEXT NOT NULL,
+            progress TEXT,
+            results TEXT NOT NULL DEFAULT '[]',
+            error TEXT,
+            report TEXT,
+            profile TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            owner_pid INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            updated_at REAL NOT NULL,
+            expires_at REAL,
+            input_path TEXT,
+            output_dir TEXT
+        )
+    ''')
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+    for column in ('input_path', 'output_dir'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_files (
+            session_id TEXT PRIMARY KEY,
+            files TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id TEXT PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER,
+            etag TEXT,
+            session_id TEXT,
+            job_id TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(files)')}
+    for column, column_type in (('etag', 'TEXT'), ('mtime_ns', 'INTEGER')):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE files ADD COLUMN {column} {column_type}')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_session ON files (session_id, name)')
+
+
+def _connect():
+    """每个线程使用独立的SQLite连接（fork之后首次使用时才打开）"""
+    return local_connection(_local, JOB_STORE_PATH, _create_tables, timeout=30, row_factory=sqlite3.Row)
+
+
+def _row_to_job(row):
+    job = dict(row)
+    for field in _JSON_FIELDS:
+        job[field] = json.loads(job[field]) if job[field] is not None else None
+    if job['results'] is None:
+        job['results'] = []
+    return job
+
+
+def _encode(field, value):
+    return json.dumps(value, ensure_ascii=False) if field in _JSON_FIELDS and value is not None else value
+
+
+def create_job(job):
+    """插入新任务，job为包含_JOB_FIELDS中字段的dict（缺少的字段为NULL）"""
+    fields = [field for field in _JOB_FIELDS if field in job]
+    with _connect() as conn:
+        conn.execute(
+            f"INSERT INTO jobs ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+            [_encode(field, job[field]) for field in fields],
+        )
+
+
+def update_job(job_id, **fields):
+    """更新任务字段，同时递增version、刷新updated_at"""
+    unknown = set(fields) - set(_JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"未知的任务字段: {', '.join(sorted(unknown))}")
+    assignments = ', '.join(f"{field} = ?" for field in fields)
+    values = [_encode(field, value) for field, value in fields.items()]
+    with _connect() as conn:
+        conn.execute(
+            f"UPDATE jobs SET {assignments}{', ' if assignments else ''}version = version + 1, updated_at = ? WHERE id = ?",
+            values + [time.time(), job_id],
+        )
+
+
+def get_job(job_id):
+    row = _connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_to_job(row) if row is not None else None
+
+
+def list_jobs(session_id=None, statuses=None, owner_pid=None):
+    """按条件列出任务，最新的在前"""
+    clauses, values = [], []
+    if session_id is not None:
+        clauses.append('session_id = ?')
+        values.append(session_id)
+    if statuses:
+        clauses.append(f"status IN ({', '.join('?' for _ in statuses)})")
+        values.extend(statuses)
+    if owner_pid is not None:
+        clauses.append('owner_pid = ?')
+        values.append(owner_pid)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = _connect().execute(f'SELECT * FROM jobs{where} ORDER BY created_at DESC', values).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+def delete_expired_jobs(now=None):
+    """删除已过期的任务记录，返回删除的条数"""
+    with _connect() as conn:
+        cursor = conn.execute('DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?',
+                              (now or time.time(),))
+        return cursor.rowcount
+
+
+def set_session_files(session_id, files, expires_at):
+    """保存session最近一次的结果文件（覆盖之前的记录）"""
+    with _connect() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO session_files (session_id, files, created_at, expires_at) VALUES (?, ?, ?, ?)',
+            (session_id, json.dumps(files, ensure_ascii=False), time.time(), expires_at),
+        )
+
+
+def get_session_files(session_id):
+    """返回 {'files', 'created_at', 'expires_at'}，不存在时返回None"""
+    row = _connect().execute('SELECT * FROM session_files WHERE session_id = ?', (session_id,)).fetchone()
+    if row is None:
+        return None
+    return {'files': json.loads(row['files']), 'created_at': row['created_at'], 'expires_at': row['expires_at']}
+
+
+def replace_session_file(session_id, old_path, new_path):
+    """重命名后更新session记录中的文件路径；在一个事务中读改写，多个worker同时重命名也不会互相覆盖"""
+    with _connect() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT files FROM session_files WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return False
+        files = [new_path if path == old_path else path for path in json.loads(row['files'])]
+        conn.execute('UPDATE session_files SET files = ? WHERE session_id = ?',
+                     (json.dumps(files, ensure_ascii=False), session_id))
+        return True
+
+
+def delete_session_files(session_id):
+    """删除session记录，返回记录中的文件列表（不存在时为空列表）"""
+    with _connect() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT files FROM session_files WHERE session_id = ?', (session_id,)).fetchone()
+        conn.execute('DELETE FROM session_files WHERE session_id = ?', (session_id,))
+        return json.loads(row['files']) if row is not None else []
+
+
+def expired_sessions(now=None):
+    """已过期的session ID列表"""
+    rows = _connect().execute('SELECT session_id FROM session_files WHERE expires_at < ?',
+                              (now or time.time(),)).fetchall()
+    return [row['session_id'] for row in rows]
+
+
+def next_expiry():
+    """最早的session或已完成任务的过期时间，都没有时返回None"""
+    row = _connect().execute(
+        'SELECT MIN(expires_at) FROM (SELECT expires_at FROM session_files '
+        'UNION ALL SELECT expires_at FROM jobs WHERE expires_at IS NOT NULL)').fetchone()
+    return row[0]
+
+
+def count_sessions(now=None):
+    """未过期的session数"""
+    return _connect().execute('SELECT COUNT(*) FROM session_files WHERE expires_at >= ?',
+                              (now or time.time(),)).fetchone()[0]
+
+
+def active_job_paths():
+    """排队中和运行中任务的输入PDF和输出目录（绝对路径），清理时不能删除"""
+    rows = _connect().execute(
+        "SELECT input_path, output_dir FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+    return {os.path.abspath(path) for row in rows for path in row if path}
+
+
+def fail_orphaned_jobs(expires_at):
+    """
+    所属worker进程已经退出（重启、部署、被强制结束）但仍处于排队中/运行中的任务标记为失败，返回标记的任务ID
+    """
+    orphaned = [job['id'] for job in list_jobs(statuses=('queued', 'running'))
+                if not pid_alive(job['owner_pid'])]
+    now = time.time()
+    for job_id in orphaned:
+        update_job(job_id, status='failed', error='处理进程已退出，请重新上传', finished_at=now, expires_at=expires_at)
+    return orphaned
+
+
+def add_files(entries):
+    """
+    登记输出文件，entries为 [{'id', 'path', 'name', 'size', 'mtime_ns', 'etag', 'session_id', 'job_id'}]；
+    同一路径已登记时保留原来的ID、更新大小、修改时间和ETag，返回 {路径: 文件ID}
+    """
+    now = time.time()
+    with _connect() as conn:
+        conn.executemany(
+            'INSERT INTO files (id, path, name, size, mtime_ns, etag, session_id, job_id, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, etag = excluded.etag',
+            [(entry['id'], entry['path'], entry['name'], entry['size'], entry.get('mtime_ns'), entry.get('etag'),
+              entry.get('session_id'), entry.get('job_id'), now) for entry in entries],
+        )
+        rows = conn.execute(
+            f"SELECT id, path FROM files WHERE path IN ({', '.join('?' for _ in entries)})",
+            [entry['path'] for entry in entries],
+        ).fetchall() if entries else []
+    return {row['path']: row['id'] for row in rows}
+
+
+def get_file(file_id):
+    row = _connect().execute('SELECT * FROM files WHERE id = ?', (file_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def get_file_by_path(path):
+    row = _connect().execute('SELECT * FROM files WHERE path = ?', (path,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def find_session_file(session_id, name):
+    """session中指定文件名的输出文件（同名时取最新的）"""
+    row = _connect().execute(
+        'SELECT * FROM files WHERE session_id = ? AND name = ? ORDER BY created_at DESC LIMIT 1',
+        (session_id, name)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def rename_file(file_id, new_path):
+    """更新文件的路径和名称，ID保持不变"""
+    with _connect() as conn:
+        conn.execute('UPDATE files SET path = ?, name = ? WHERE id = ?',
+                     (new_path, os.path.basename(new_path), file_id))
+
+
+def delete_files(paths):
+    """删除指定路径的文件记录"""
+    with _connect() as conn:
+        conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in paths])
+
+
+def delete_files_under(directory):
+    """删除目录下所有文件的记录"""
+    prefix = os.path.join(directory, '')
+    with _connect() as conn:
+        conn.execute("DELETE FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
@@ -0,0 +1,284 @@
+"""
+后台任务队列：上传后立即返回任务ID，process_pdf在独立的进程池中运行（pdfminer解析是纯Python的CPU密集计算，
+放在线程中会被GIL串行化并拖慢请求线程）；任务状态和进度保存在job_store中，所有worker和处理进程可见
+"""
+import os
+import time
+import uuid
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import job_store
+import file_index
+from pdf_logic import process_pdf
+from profiling import JobProfiler, PROFILE_JOBS, PROFILE_THRESHOLD
+
+# 每个处理进程预留的内存：spawn出的解释器、pdfplumber解析和输出写入，大文件时峰值可达200MB以上
+JOB_PROCESS_MEMORY_MB = int(os.environ.get('JOB_PROCESS_MEMORY_MB', '256'))
+
+
+def _memory_limit_mb():
+    """容器的内存上限（cgroup v2/v1）和物理内存中较小的一个，都读取不到时返回None"""
+    limits = []
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            limits.append(int(value) // (1024 * 1024))
+    try:
+        limits.append(os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        pass  # Windows上没有sysconf
+    return min(limits) if limits else None
+
+
+def _default_job_workers():
+    """
+    按内存估算每个gunicorn worker的并发处理数：内存平分给WEB_CONCURRENCY个worker，
+    每个worker自身留一份JOB_PROCESS_MEMORY_MB，其余每份一个处理进程；至少1个，最多4个且不超过CPU核数
+    （512MB的Render免费实例上为1）
+    """
+    memory_mb = _memory_limit_mb()
+    if memory_mb is None:
+        return 1
+    per_worker = memory_mb // max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    return max(1, min(4, os.cpu_count() or 1, per_worker // JOB_PROCESS_MEMORY_MB - 1))
+
+
+# 后台并发处理的任务数，也是处理进程数；未设置时按可用内存决定，超出的任务排队等待
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or _default_job_workers())
+JOB_RETENTION = 3600  # 已完成任务的状态保留1小时
+JOB_NICE = int(os.environ.get('JOB_NICE', '5'))  # 处理进程降低调度优先级，CPU紧张时请求线程优先
+PROGRESS_WRITE_INTERVAL = 0.5  # 同一阶段内的进度最多每0.5秒写一次存储
+JOB_POLL_INTERVAL = 1.0  # 等待其他worker上的任务更新时，每秒重新读取一次存储
+
+_jobs_changed = threading.Condition()  # 本进程的任务更新时通知等待中的SSE连接
+_executor = None
+_process_pool = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """延迟创建任务线程池（gunicorn preload_app时需在worker进程内创建）；线程只等待处理进程的结果并更新任务状态"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='pdf-job')
+            print(f"🧵 后台任务线程池已启动: {JOB_WORKERS} 个worker", flush=True)
+        return _executor
+
+
+def _get_process_pool():
+    """
+    延迟创建处理进程池；使用spawn，不从带有请求线程的gunicorn worker fork，
+    子进程重新导入模块，不会继承其他线程持有的锁
+    """
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=JOB_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_init_process)
+            print(f"⚙️ 处理进程池已启动: {JOB_WORKERS} 个进程", flush=True)
+        return _process_pool
+
+
+def _init_process():
+    if JOB_NICE and hasattr(os, 'nice'):
+        os.nice(JOB_NICE)
+
+
+def _reset_process_pool(pool):
+    """处理进程异常退出（例如内存不足被杀）后进程池不可再用，下一个任务重新创建"""
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def _update_job(job_id, **fields):
+    job_store.update_job(job_id, **fields)
+    with _jobs_changed:
+        _jobs_changed.notify_all()
+
+
+def prune_jobs():
+    """清理过期的已完成任务记录，把所属worker已经退出的任务标记为失败（由reaper定期调用）"""
+    job_store.delete_expired_jobs()
+    orphaned = job_store.fail_orphaned_jobs(expires_at=time.time() + JOB_RETENTION)
+    for job_id in orphaned:
+        print(f"⚠️ 任务所属进程已退出，标记为失败: {job_id}", flush=True)
+
+
+def _publish_queue_depth():
+    """更新本进程排队中和运行中任务数的仪表值"""
+    statuses = [job['status'] for job in job_store.list_jobs(statuses=('queued', 'running'), owner_pid=os.getpid())]
+    for state in ('queued', 'running'):
+        metrics.set_gauge('job_queue_depth', statuses.count(state), {'state': state})
+
+
+def _record_job_metrics(mode, status, seconds, report=None):
+    metrics.inc('process_pdf_jobs_total', {'mode': mode, 'status': status})
+    metrics.observe('process_pdf_duration_seconds', seconds, {'mode': mode}, buckets=metrics.PROCESS_BUCKETS)
+    if report:
+        metrics.inc('pages_processed_total', {'mode': mode}, report['info'].get('pages') or 0)
+        metrics.inc('ocr_pages_total', {'mode': mode}, report['counters'].get('ocr_pages', 0))
+
+
+def _save_profile(profiler, job_id, output_dir, mode):
+    """耗时超过阈值时保存性能分析结果，返回文件路径列表"""
+    if profiler is None or profiler.seconds < PROFILE_THRESHOLD:
+        return None
+    job = get_job(job_id) or {}
+    try:
+        paths = profiler.save(output_dir, job_id, mode=mode, filename=job.get('filename'),
+                              session_id=job.get('session_id'))
+    except Exception as e:  # 性能分析出错不影响任务结果
+        print(f"⚠️ 保存性能分析失败: {job_id}: {str(e)}", flush=True)
+        return None
+    print(f"🐢 慢任务 {job_id} 用时 {profiler.seconds:.1f}s，性能分析已保存: {os.path.dirname(paths[0])}", flush=True)
+    return paths
+
+
+def _process_job(job_id, input_path, output_dir, mode, profile=False, session_id=None):
+    """
+    在处理进程中执行process_pdf，profile为True时用cProfile和调用栈采样包裹
+    进度直接写入job_store；返回 {'results', 'report', 'profile'}，失败时返回 {'error', 'profile'}
+    """
+    last_write = {'phase': None, 'outputs': 0, 'superseded': 0, 'at': 0.0}
+    registered = set()  # 已登记到文件索引的提前输出文件
+
+    def report_progress(event):
+        event = dict(event)
+        # 仓库模式提前写出的文件在任务完成前就可以下载
+        outputs = event.pop('outputs', None) or []
+        # event['superseded']：提前写出后又要重新生成的文件名，留在进度中供页面提示用户重新下载
+        superseded = len(event.get('superseded', ()))
+        now = time.time()
+        # 阶段变化、有新文件可下载、有文件要重新生成时立即写入，同一阶段内的逐页进度按间隔写入
+        if (event['phase'] == last_write['phase'] and len(outputs) == last_write['outputs']
+                and superseded == last_write['superseded'] and now - last_write['at'] < PROGRESS_WRITE_INTERVAL):
+            return
+        last_write.update(phase=event['phase'], outputs=len(outputs), superseded=superseded, at=now)
+        if outputs:
+            # 只登记新写出的文件，已登记的文件不再重新计算哈希
+            new_outputs = [path for path in outputs if path not in registered]
+            if new_outputs:
+                file_index.register(new_outputs, session_id=session_id, job_id=job_id)
+                registered.update(new_outputs)
+            _update_job(job_id, progress=event, results=outputs)
+        else:
+            _update_job(job_id, progress=event)
+
+    profiler = JobProfiler() if profile else None
+    try:
+        with profiler or contextlib.nullcontext():
+            results, report = process_pdf(input_path, output_dir, mode=mode, progress_callback=report_progress,
+                                          return_report=True)
+        # 输出文件登记到索引后，下载和重命名按文件ID直接定位
+        file_index.register(results, session_id=session_id, job_id=job_id)
+        return {'results': results, 'report': report.to_dict(),
+                'profile': _save_profile(profiler, job_id, output_dir, mode)}
+    except Exception as e:
+        return {'error': str(e), 'profile': _save_profile(profiler, job_id, output_dir, mode)}
+
+
+def _run_job(job_id, input_path, output_dir, mode, on_complete, profile=False, session_id=None):
+    """在任务线程中把process_pdf提交到处理进程池并等待结果，更新任务状态后调用on_complete"""
+    started = time.time()
+    _update_job(job_id, status='running', started_at=started)
+    _publish_queue_depth()
+    print(f"▶️ 任务开始: {job_id} ({mode})", flush=True)
+
+    pool = _get_process_pool()
+    try:
+        outcome = pool.submit(_process_job, job_id, input_path, output_dir, mode, profile, session_id).result()
+    except BrokenProcessPool:
+        _reset_process_pool(pool)
+        outcome = {'error': '处理进程异常退出（可能内存不足），请重新上传'}
+    except Exception as e:
+        outcome = {'error': str(e)}
+
+    finished = time.time()
+    if 'error' not in outcome:
+        report = outcome['report']
+        _update_job(job_id, status='done', results=outcome['results'], report=report, profile=outcome['profile'],
+                    finished_at=finished, expires_at=finished + JOB_RETENTION)
+        _record_job_metrics(mode, 'done', report['info']['total_seconds'], report)
+        print(f"✅ 任务完成: {job_id}，生成了 {len(outcome['results'])} 个文件", flush=True)
+    else:
+        _update_job(job_id, status='failed', error=outcome['error'], profile=outcome.get('profile'),
+                    finished_at=finished, expires_at=finished + JOB_RETENTION)
+        _record_job_metrics(mode, 'failed', finished - started)
+        print(f"❌ 任务失败: {job_id}: {outcome['error']}", flush=True)
+    _publish_queue_depth()
+
+    if on_complete:
+        try:
+            on_complete(get_job(job_id))
+        except Exception as e:
+            print(f"⚠️ 任务回调失败: {job_id}: {str(e)}", flush=True)
+
+
+def submit_job(input_path, output_dir, mode, session_id=None, filename=None, on_complete=None, profile=None):
+    """提交处理任务，立即返回任务ID；profile为None时按PROFILE_JOBS决定是否做性能分析"""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    job_store.create_job({
+        'id': job_id,
+        'session_id': session_id,
+        'mode': mode,
+        'filename': filename or os.path.basename(input_path),
+        'status': 'queued',
+        'progress': {'phase': 'queued', 'processed': 0, 'total': 0},
+        'results': [],
+        'owner_pid': os.getpid(),
+        'input_path': os.path.abspath(input_path),
+        'output_dir': os.path.abspath(output_dir),
+        'created_at': now,
+        'updated_at': now,
+    })
+    profile = PROFILE_JOBS if profile is None else profile
+    _get_executor().submit(_run_job, job_id, input_path, output_dir, mode, on_complete, profile,
+                          session_id)
+    _publish_queue_depth()
+    print(f"📥 任务已排队: {job_id} ({mode})，当前排队数: {queue_depth()}", flush=True)
+    return job_id
+
+
+def get_job(job_id):
+    """获取任务信息，不存在时返回None"""
+    return job_store.get_job(job_id)
+
+
+def wait_for_job(job_id, version, timeout):
+    """
+    等待任务信息在version之后发生变化，返回最新的任务信息；超时也返回当前信息，任务不存在时返回None
+    本进程任务线程的状态更新会立即唤醒；处理进程写入的进度和其他worker上的任务每JOB_POLL_INTERVAL秒重新读取一次
+    """
+    deadline = time.time() + timeout
+    while True:
+        job = get_job(job_id)
+        remaining = deadline - time.time()
+        if job is None or job['version'] != version or remaining <= 0:
+            return job
+        with _jobs_changed:
+            _jobs_changed.wait(min(remaining, JOB_POLL_INTERVAL))
+
+
+def list_jobs(session_id=None):
+    """列出任务（可按session过滤），最新的在前"""
+    return job_store.list_jobs(session_id=session_id)
+
+
+def queue_depth():
+    """所有worker上排队中和运行中的任务数"""
+    return len(job_store.list_jobs(statuses=('queued', 'running')))
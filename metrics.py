@@ -0,0 +1,195 @@
+"""
+Prometheus格式的运行指标：计数器、直方图和仪表值持久化在SQLite中，gunicorn多个worker进程共用同一个文件，
+/metrics无论落到哪个worker都返回所有进程的汇总
+"""
+import os
+import sqlite3
+import threading
+
+from sqlite_util import local_connection, pid_alive
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH', os.path.join(os.getcwd(), 'cache', 'metrics.sqlite3'))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROCESS_BUCKETS = (1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# 指标名 → (类型, 说明)，/metrics按此顺序输出
+FAMILIES = {
+    'http_requests_total': ('counter', 'HTTP请求数（按路由、方法、状态码）'),
+    'http_request_duration_seconds': ('histogram', 'HTTP请求耗时（按路由）'),
+    'process_pdf_jobs_total': ('counter', 'process_pdf任务数（按模式、结果）'),
+    'process_pdf_duration_seconds': ('histogram', 'process_pdf耗时（按模式）'),
+    'pages_processed_total': ('counter', '处理的PDF页数（按模式）'),
+    'ocr_pages_total': ('counter', '需要OCR的页数（按模式）'),
+    'job_queue_depth': ('gauge', '后台任务数（queued排队中 / running运行中，所有worker进程之和）'),
+    'temp_files_sessions': ('gauge', '有未过期结果文件的session数'),
+    'temp_output_bytes': ('gauge', 'temp_output目录占用的磁盘空间'),
+    'reaper_deleted_files_total': ('counter', '后台清理删除的文件数（按原因：expired/age/quota）'),
+    'reaper_reclaimed_bytes_total': ('counter', '后台清理回收的磁盘空间（按原因：expired/age/quota）'),
+}
+
+_local = threading.local()
+_collectors = []
+_warned = False
+
+
+def _create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metrics (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (name, labels)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gauges (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (name, labels, pid)
+        )
+    ''')
+
+
+def _connect():
+    """每个线程使用独立的SQLite连接（fork之后首次使用时才打开）"""
+    return local_connection(_local, METRICS_DB_PATH, _create_tables, timeout=5)
+
+
+def _warn(e):
+    """指标写入失败不影响请求，每个进程只提示一次"""
+    global _warned
+    if not _warned:
+        _warned = True
+        print(f"⚠️ 指标写入失败: {str(e)}", flush=True)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def inc(name, labels=None, n=1):
+    """计数器加n"""
+    if not METRICS_ENABLED:
+        return
+    try:
+        with _connect() as conn:
+            conn.execute(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                (name, _format_labels(labels), n),
+            )
+    except sqlite3.Error as e:
+        _warn(e)
+
+
+def observe(name, value, labels=None, buckets=REQUEST_BUCKETS):
+    """直方图记录一次观测值：全部累积桶（未落入的加0）、_sum、_count在同一个事务中更新"""
+    if not METRICS_ENABLED:
+        return
+    labels = dict(labels or {})
+    label_text = _format_labels(labels)
+    # 每个桶都写入（计数为0的桶也要输出，Prometheus要求直方图的桶完整）；le固定放在最后，输出时据此按桶的上界排序
+    rows = [(f'{name}_bucket', ','.join(filter(None, [label_text, f'le="{_format_bound(bound)}"'])),
+             1 if value <= bound else 0)
+            for bound in (*buckets, float('inf'))]
+    rows.append((f'{name}_sum', label_text, value))
+    rows.append((f'{name}_count', label_text, 1))
+    try:
+        with _connect() as conn:
+            conn.executemany(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                rows,
+            )
+    except sqlite3.Error as e:
+        _warn(e)
+
+
+def set_gauge(name, value, labels=None):
+    """设置本进程的仪表值，输出时对所有存活进程求和"""
+    if not METRICS_ENABLED:
+        return
+    try:
+        with _connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO gauges (name, labels, pid, value) VALUES (?, ?, ?, ?)',
+                (name, _format_labels(labels), os.getpid(), value),
+            )
+    except sqlite3.Error as e:
+        _warn(e)
+
+
+def register_collector(collector):
+    """注册抓取时调用的函数，返回 [(指标名, 标签dict, 值)]，用于目录大小等只需在抓取时计算的值"""
+    _collectors.append(collector)
+
+
+def _bucket_key(labels):
+    """直方图的桶按其他标签分组、组内按le数值排序"""
+    rest, le = labels.rsplit('le="', 1)
+    le = le.rstrip('"')
+    return rest, float('inf') if le == '+Inf' else float(le)
+
+
+def render():
+    """生成Prometheus文本格式的全部指标"""
+    conn = _connect()
+    samples = {}
+    for name, labels, value in conn.execute('SELECT name, labels, value FROM metrics'):
+        samples.setdefault(name, []).append((labels, value))
+
+    # 已退出的worker（重启、部署、被强制结束）的仪表值不再计入
+    gauges = {}
+    dead = set()
+    for name, labels, pid, value in conn.execute('SELECT name, labels, pid, value FROM gauges'):
+        if pid in dead or not pid_alive(pid):
+            dead.add(pid)
+            continue
+        gauges[(name, labels)] = gauges.get((name, labels), 0) + value
+    if dead:
+        with conn:
+            conn.executemany('DELETE FROM gauges WHERE pid = ?', [(pid,) for pid in dead])
+    for collector in _collectors:
+        for name, labels, value in collector():
+            gauges[(name, _format_labels(labels))] = value
+    for (name, labels), value in gauges.items():
+        samples.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for family, (kind, help_text) in FAMILIES.items():
+        names = [f'{family}_bucket', f'{family}_sum', f'{family}_count'] if kind == 'histogram' else [family]
+        if not any(name in samples for name in names):
+            continue
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name in names:
+            rows = samples.get(name, [])
+            rows.sort(key=lambda row: _bucket_key(row[0]) if name.endswith('_bucket') else (row[0], 0))
+            for labels, value in rows:
+                label_text = f'{{{labels}}}' if labels else ''
+                lines.append(f'{name}{label_text} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def record_request(route, method, status, seconds):
+    """一次HTTP请求的计数和耗时"""
+    inc('http_requests_total', {'route': route, 'method': method, 'status': status})
+    observe('http_request_duration_seconds', seconds, {'route': route})
@@ -0,0 +1,123 @@
+"""OCR文本缓存：按页面图像哈希持久化OCR结果（SQLite），重复的标签图像不再调用tesseract"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from sqlite_util import local_connection
+
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', '1') == '1'
+OCR_CACHE_PATH = os.environ.get('OCR_CACHE_PATH', os.path.join(os.getcwd(), 'cache', 'ocr_cache.sqlite3'))
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '50000'))
+# 感知哈希的缩略图边长：太小会让只有SKU文字不同的标签哈希相同
+PHASH_SIZE = 128
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+def _create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            image_hash TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            text TEXT NOT NULL,
+            config TEXT,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (image_hash, engine)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used)')
+
+def _connect():
+    """每个线程使用独立的SQLite连接（fork之后首次使用时才打开）"""
+    return local_connection(_local, OCR_CACHE_PATH, _create_tables, timeout=30)
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def record(hit):
+    """记录一次页面级的缓存查找结果（一个页面可能查找多个哈希键）"""
+    _count('hits' if hit else 'misses')
+
+def xobject_hash(page):
+    """页面中图像XObject原始字节的哈希，无需渲染；页面没有图像时返回None"""
+    digest = hashlib.sha256()
+    found = False
+    for image in page.images:
+        stream = image.get('stream')
+        if stream is None:
+            continue
+        digest.update(stream.get_rawdata() or b'')
+        digest.update(repr((image.get('x0'), image.get('top'), image.get('width'), image.get('height'))).encode())
+        found = True
+    if not found:
+        return None
+    digest.update(repr((page.width, page.height)).encode())
+    return 'x:' + digest.hexdigest()
+
+def perceptual_hash(image):
+    """
+    渲染图像的差值感知哈希（dHash）：重新编码、轻微噪声不影响结果
+    在PHASH_SIZE分辨率下比较相邻像素亮度，得到的位串再做SHA-1作为键
+    """
+    gray = image.convert('L').resize((PHASH_SIZE + 1, PHASH_SIZE))
+    pixels = gray.tobytes()
+    width = PHASH_SIZE + 1
+    bits = bytearray()
+    for row in range(PHASH_SIZE):
+        offset = row * width
+        bits.extend(1 if pixels[offset + col] > pixels[offset + col + 1] else 0 for col in range(PHASH_SIZE))
+    return 'p:' + hashlib.sha1(bytes(bits)).hexdigest()
+
+def get(image_hash, engine):
+    """查找缓存的OCR文本，返回 (文本, 配置)，未命中返回None"""
+    if not OCR_CACHE_ENABLED or not image_hash:
+        return None
+    try:
+        conn = _connect()
+        row = conn.execute(
+            'SELECT text, config FROM ocr_cache WHERE image_hash = ? AND engine = ?',
+            (image_hash, engine)).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            'UPDATE ocr_cache SET last_used = ?, hits = hits + 1 WHERE image_hash = ? AND engine = ?',
+            (time.time(), image_hash, engine))
+        conn.commit()
+        return row[0], row[1]
+    except sqlite3.Error as e:
+        print(f"⚠️ OCR缓存读取失败: {str(e)}")
+        return None
+
+def put(image_hashes, engine, text, config):
+    """保存OCR文本（同一结果可对应多个哈希键），超过上限时淘汰最久未使用的条目"""
+    image_hashes = [h for h in image_hashes if h]
+    if not OCR_CACHE_ENABLED or not image_hashes:
+        return
+    try:
+        conn = _connect()
+        now = time.time()
+        conn.executemany(
+            'INSERT OR REPLACE INTO ocr_cache (image_hash, engine, text, config, created_at, last_used, hits) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0)',
+            [(image_hash, engine, text, config, now, now) for image_hash in image_hashes])
+        count = conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        if count > OCR_CACHE_MAX_ENTRIES:
+            conn.execute(
+                'DELETE FROM ocr_cache WHERE rowid IN '
+                '(SELECT rowid FROM ocr_cache ORDER BY last_used LIMIT ?)',
+                (count - OCR_CACHE_MAX_ENTRIES,))
+        conn.commit()
+        _count('stores')
+    except sqlite3.Error as e:
+        print(f"⚠️ OCR缓存写入失败: {str(e)}")
+
+def stats():
+    """返回命中/未命中计数的快照"""
+    with _stats_lock:
+        return dict(_stats)
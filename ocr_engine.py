@@ -0,0 +1,246 @@
+"""
+OCR引擎：先收集所有纯图像页面，再在有界线程池中并发渲染和识别
+每页按识别级别从便宜到昂贵逐级尝试：先低分辨率只识别SKU所在区域，再整页识别并逐步提高分辨率，
+文本一旦能解析到目录SKU就提前结束
+"""
+import os
+import platform
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pdfplumber
+import ocr_cache
+from run_report import NULL_REPORT
+try:
+    import pytesseract
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+
+# 整页识别的分辨率阶梯：低分辨率识别不出SKU时才升级（120平衡质量和速度）
+OCR_RESOLUTIONS = [int(value) for value in os.environ.get('OCR_RESOLUTIONS', '120,200').split(',')]
+OCR_RESOLUTION = OCR_RESOLUTIONS[0]
+# 每个分辨率下依次尝试的tesseract配置
+OCR_CONFIGS = [
+    '--psm 6 --oem 1',  # 最快的配置，优先使用
+    '--psm 4 --oem 1',  # 备用配置
+]
+# 并发的tesseract进程数，以及每批提交的页数（限制排队和内存中的页面数量）
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(os.cpu_count() or 2)))
+OCR_BATCH_PAGES = int(os.environ.get('OCR_BATCH_PAGES', '16'))
+# 第一级：低分辨率渲染后只识别SKU所在区域，限制为SKU字符集
+OCR_ROI_ENABLED = os.environ.get('OCR_ROI_ENABLED', '1') == '1'
+OCR_ROI_RESOLUTION = int(os.environ.get('OCR_ROI_RESOLUTION', '100'))
+OCR_ROI_CONFIG = '--psm 6 --oem 1 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-'
+# 各客户标签模板中SKU所在区域，按页面宽高的比例 (x0, top, x1, bottom)
+OCR_ROI_TEMPLATES = {
+    'algin': (0.0, 0.5, 1.0, 1.0),  # ALGIN标签的SKU印在下半部分
+}
+OCR_ROI_TEMPLATE = os.environ.get('OCR_ROI_TEMPLATE', 'algin')
+# OCR缓存按引擎配置区分，渲染分辨率或tesseract配置变化后旧缓存不再命中
+OCR_ENGINE_SIGNATURE = f"res={','.join(map(str, OCR_RESOLUTIONS))};configs={'|'.join(OCR_CONFIGS)}"
+
+def roi_box(template=None):
+    """
+    返回SKU区域的比例坐标，环境变量OCR_ROI_BOX（"x0,top,x1,bottom"）优先于模板
+    关闭两级识别或模板不存在时返回None
+    """
+    if not OCR_ROI_ENABLED:
+        return None
+    override = os.environ.get('OCR_ROI_BOX')
+    if override:
+        try:
+            box = tuple(float(value) for value in override.split(','))
+            if len(box) == 4:
+                return box
+        except ValueError:
+            pass
+        print(f"⚠️ OCR_ROI_BOX格式错误，应为 x0,top,x1,bottom: {override}")
+    return OCR_ROI_TEMPLATES.get(template or OCR_ROI_TEMPLATE)
+
+def ocr_levels(box=None):
+    """识别级别列表 [(名称, 分辨率, 区域, tesseract配置)]，从便宜到昂贵排列"""
+    levels = []
+    if box:
+        levels.append((f"roi@{OCR_ROI_RESOLUTION}", OCR_ROI_RESOLUTION, box, OCR_ROI_CONFIG))
+    for resolution in OCR_RESOLUTIONS:
+        for config in OCR_CONFIGS:
+            psm = config.split()[1]
+            levels.append((f"full@{resolution}/psm{psm}", resolution, None, config))
+    return levels
+
+def engine_signature(box=None):
+    """OCR缓存的引擎签名；带区域识别时缓存的可能是区域文本，与只做整页识别分开"""
+    if box is None:
+        return OCR_ENGINE_SIGNATURE
+    return f"{OCR_ENGINE_SIGNATURE};roi={box}@{OCR_ROI_RESOLUTION};{OCR_ROI_CONFIG}"
+
+# 动态检测Tesseract路径
+def setup_tesseract():
+    if platform.system() == "Windows":
+        tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+        if os.path.exists(tesseract_cmd):
+            return tesseract_cmd
+
+    # Linux/Unix系统（包括Render）
+    tesseract_cmd = shutil.which('tesseract')
+    if tesseract_cmd:
+        return tesseract_cmd
+
+    # 尝试常见路径
+    common_paths = [
+        '/usr/bin/tesseract',
+        '/usr/local/bin/tesseract',
+        '/opt/homebrew/bin/tesseract'
+    ]
+
+    for path in common_paths:
+        if os.path.exists(path):
+            return path
+
+    print("⚠️ 警告: 未找到Tesseract，OCR功能可能不可用")
+    return None
+
+# 设置Tesseract命令路径
+tesseract_path = setup_tesseract()
+if tesseract_path and OCR_AVAILABLE:
+    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    print(f"✅ Tesseract路径设置为: {tesseract_path}")
+else:
+    print("⚠️ Tesseract未找到，OCR功能不可用，但应用仍可处理文本PDF")
+    OCR_AVAILABLE = False
+
+# pdfium渲染不是线程安全的：渲染串行，tesseract子进程并发
+_render_lock = threading.Lock()
+
+def ocr_image(image, config, box=None):
+    """用一个tesseract配置识别图像，box给出时只识别该比例区域"""
+    if box:
+        width, height = image.size
+        image = image.crop((int(box[0] * width), int(box[1] * height),
+                            int(box[2] * width), int(box[3] * height)))
+    return pytesseract.image_to_string(image, config=config)
+
+def _render(page, resolution, report=NULL_REPORT):
+    with _render_lock, report.timer('ocr_render'):
+        image = page.to_image(resolution=resolution).original
+        page.close()
+    return image
+
+def _ocr_page(plumber, idx, levels, accept=None, report=NULL_REPORT):
+    """
+    渲染并识别单个页面，返回 (页码, OCR文本, 错误信息, 是否命中缓存, 成功的级别, 尝试次数)
+    按levels逐级识别，accept(文本)为True（没有accept时为文本非空）即提前结束；
+    所有级别都没有解析到SKU时，返回第一个非空的整页识别结果，成功的级别为None
+    """
+    signature = engine_signature(levels[0][2])
+    try:
+        # 先按图像XObject字节查缓存，命中时连渲染都可以跳过
+        with _render_lock:
+            page = plumber.pages[idx]
+            xobject_key = ocr_cache.xobject_hash(page)
+        cached = ocr_cache.get(xobject_key, signature)
+        images = {}
+        if cached is None:
+            # 用最低一级的渲染结果计算感知哈希
+            first_resolution = levels[0][1]
+            images[first_resolution] = _render(page, first_resolution, report)
+            phash_key = ocr_cache.perceptual_hash(images[first_resolution])
+            cached = ocr_cache.get(phash_key, signature)
+            if cached is not None:
+                # 重新编码过的相同图像，补充XObject键
+                ocr_cache.put([xobject_key], signature, *cached)
+        if cached is not None:
+            ocr_cache.record(hit=True)
+            print(f"♻️ 页面{idx+1} 使用OCR缓存 [{cached[1]}]: {cached[0][:50]}...")
+            return idx, cached[0], None, True, None, 0
+
+        ocr_cache.record(hit=False)
+        fallback = None
+        attempts = 0
+        for name, resolution, box, config in levels:
+            if resolution not in images:
+                images[resolution] = _render(page, resolution, report)
+            attempts += 1
+            report.count('tesseract_calls')
+            try:
+                with report.timer('tesseract'):
+                    ocr_text = ocr_image(images[resolution], config, box)
+            except Exception as ocr_e:
+                print(f"❌ 页面{idx+1} OCR失败 [{name}]: {str(ocr_e)[:50]}")
+                continue
+            if not ocr_text.strip():
+                continue
+            if accept is None or accept(ocr_text):
+                print(f"🔍 页面{idx+1} OCR成功 [{name}]: {ocr_text[:50]}...")
+                # 缓存的配置列记录成功的级别
+                ocr_cache.put([xobject_key, phash_key], signature, ocr_text, name)
+                return idx, ocr_text, None, False, name, attempts
+            if fallback is None and box is None:
+                fallback = (ocr_text, name)
+
+        if fallback is None:
+            print(f"⚠️  页面{idx+1} 所有OCR级别均失败")
+            return idx, "", None, False, None, attempts
+        print(f"⚠️  页面{idx+1} 所有OCR级别均未解析到SKU，使用 [{fallback[1]}] 的结果")
+        ocr_cache.put([xobject_key, phash_key], signature, *fallback)
+        return idx, fallback[0], None, False, None, attempts
+    except Exception as e:
+        print(f"❌ 页面{idx+1} OCR失败: {str(e)}")
+        return idx, "", str(e), False, None, 0
+
+def run_ocr_batch(input_pdf, page_indices, workers=None, batch_pages=None, on_page=None, plumber=None, accept=None,
+                  report=NULL_REPORT):
+    """
+    并发OCR多个纯图像页面，返回 {页码: (OCR文本, 错误信息)}
+    workers: 并发识别的线程数（每个线程驱动一个tesseract进程）
+    batch_pages: 每批提交的页数
+    on_page: 可选，每完成一页时以已完成页数调用
+    plumber: 可选，已打开的pdfplumber文档（分类阶段共用的解析结果），为None时单独打开input_pdf
+    accept: 可选，判断识别文本能否解析到目录SKU；给出时先做区域识别，并在解析成功的级别提前结束
+    report: 可选，记录渲染/tesseract耗时（各线程累加）和OCR计数器
+    """
+    workers = workers or OCR_WORKERS
+    batch_pages = max(batch_pages or OCR_BATCH_PAGES, workers)
+    levels = ocr_levels(roi_box() if accept else None)
+    print(f"🔍 并发OCR: {len(page_indices)} 个图像页面, {workers} 个线程, "
+          f"识别级别 {' → '.join(level[0] for level in levels)}")
+
+    results = {}
+    cache_hits = 0
+    level_counts = {level[0]: 0 for level in levels}
+    attempts = 0
+    saved = 0
+    own_plumber = plumber is None
+    if own_plumber:
+        plumber = pdfplumber.open(input_pdf)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr') as executor:
+            for start in range(0, len(page_indices), batch_pages):
+                batch = page_indices[start:start + batch_pages]
+                for idx, text, error, cache_hit, level, page_attempts in executor.map(
+                        lambda i: _ocr_page(plumber, i, levels, accept, report), batch):
+                    results[idx] = (text, error)
+                    cache_hits += cache_hit
+                    attempts += page_attempts
+                    if level:
+                        level_counts[level] += 1
+                        # 提前结束省下的后续级别
+                        saved += len(levels) - page_attempts
+                    if on_page:
+                        on_page(len(results))
+    finally:
+        if own_plumber:
+            plumber.close()
+    print(f"♻️ OCR缓存: 命中 {cache_hits}/{len(page_indices)} 页, "
+          f"跳过 {cache_hits} 次tesseract调用 (累计 {ocr_cache.stats()})")
+    print("🎯 OCR级别: " + ", ".join(f"{name} {count}页" for name, count in level_counts.items())
+          + f", 未解析 {len(page_indices) - cache_hits - sum(level_counts.values())}页")
+    print(f"⏩ tesseract调用 {attempts} 次, 提前结束节省 {saved} 次 (每页最多 {len(levels)} 级)")
+    report.count('ocr_cache_hits', cache_hits)
+    report.count('ocr_attempts_saved', saved)
+    for name, count in level_counts.items():
+        if count:
+            report.count(f"ocr_level:{name}", count)
+    return results
@@ -1,19 +1,29 @@
-import os, re
-import pdfplumber
-from pypdf import PdfReader, PdfWriter
-try:
-    import pytesseract
-    from PIL import Image
-    import io
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
+import os, re, gc, time, platform, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfWriter
+from ocr_engine import OCR_AVAILABLE, run_ocr_batch, engine_signature, roi_box
+from pdf_source import PdfSource
+from run_report import RunReport, NULL_REPORT
+import result_cache
+from sku_index import get_sku_index
+from sku_index import is_sku_match  # noqa: F401  保持 pdf_logic.is_sku_match 的旧导入路径可用
 
 try:
-    import pandas as pd
-    PANDAS_AVAILABLE = True
+    import resource  # Windows上没有
+    RESOURCE_AVAILABLE = True
 except ImportError:
-    PANDAS_AVAILABLE = False
+    RESOURCE_AVAILABLE = False
+
+# 并行页面分类配置
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '1'))  # 8核机器建议设置为7
+PARALLEL_MIN_PAGES = 40  # 页数太少时进程池启动开销大于收益
+PARALLEL_MIN_CHUNK = 10
+# 仓库模式快速分类：先用pypdf提取文本（不做pdfminer版面分析），匹配不到仓库标签的页面再交给pdfplumber
+PDF_FAST_TEXT = os.environ.get('PDF_FAST_TEXT', '1') == '1'
+# 低内存模式：串行分类，每个输出组单独解析PdfReader并在写完后释放（适合512MB实例处理大文件）
+PDF_LOW_MEMORY = os.environ.get('PDF_LOW_MEMORY', '0') == '1'
+# 仓库模式提前输出：快速路径预扫描后，某个仓库组不再可能有新页面时立即写出该组，不等其余页面分类完成
+PDF_EARLY_OUTPUT = os.environ.get('PDF_EARLY_OUTPUT', '1') == '1'
 
 WAREHOUSE_PREFIXES = {
     "915": ["WZ", "WX"] + [f"X{chr(i)}" for i in range(ord("A"), ord("X")+1)],
@@ -21,46 +31,6 @@ WAREHOUSE_PREFIXES = {
     "60": ["GA", "GB", "GC"]
 }
 
-# 动态设置Tesseract路径以适配不同环境
-import platform
-import shutil
-import sys
-
-# 动态检测Tesseract路径
-def setup_tesseract():
-    if platform.system() == "Windows":
-        tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-        if os.path.exists(tesseract_cmd):
-            return tesseract_cmd
-    
-    # Linux/Unix系统（包括Render）
-    tesseract_cmd = shutil.which('tesseract')
-    if tesseract_cmd:
-        return tesseract_cmd
-    
-    # 尝试常见路径
-    common_paths = [
-        '/usr/bin/tesseract',
-        '/usr/local/bin/tesseract',
-        '/opt/homebrew/bin/tesseract'
-    ]
-    
-    for path in common_paths:
-        if os.path.exists(path):
-            return path
-    
-    print("⚠️ 警告: 未找到Tesseract，OCR功能可能不可用")
-    return None
-
-# 设置Tesseract命令路径
-tesseract_path = setup_tesseract()
-if tesseract_path and OCR_AVAILABLE:
-    pytesseract.pytesseract.tesseract_cmd = tesseract_path
-    print(f"✅ Tesseract路径设置为: {tesseract_path}")
-else:
-    print("⚠️ Tesseract未找到，OCR功能不可用，但应用仍可处理文本PDF")
-    OCR_AVAILABLE = False
-
 def extract_sku_sort_key(sku_text):
     """从SKU文本中提取排序键，实现智能排序逻辑"""
     
@@ -96,145 +66,6 @@ def extract_sku_sort_key(sku_text):
     # 如果没有匹配任何模式，使用字母排序
     return (9999, sku_text.upper(), 0)
 
-def is_sku_match(ocr_sku, excel_sku):
-    """
-    大幅增强的SKU匹配逻辑，专门优化OCR识别准确率
-    """
-    # 标准化处理
-    ocr_clean = ocr_sku.upper().strip()
-    excel_clean = excel_sku.upper().strip()
-    
-    # 1. 完全匹配
-    if ocr_clean == excel_clean:
-        return True
-    
-    # 2. 标准化处理 - 增强版
-    def normalize_sku(sku):
-        import re
-        # 统一所有破折号和空格
-        sku = sku.replace('—', '-').replace('_', '-').replace('–', '-')
-        # 去除多余空格，但保留必要的分隔符
-        sku = re.sub(r'\s+', '', sku)  # 去除所有空格
-        # 处理常见OCR错误的字符替换
-        replacements = {
-            'TF01S': 'TFO1S',  # 关键修复：OCR常把TFO1S识别为TF01S
-            'TFO15': 'TFO1S',  # S被识别为5
-            'TF015': 'TFO1S',  # 综合错误
-            'OPAC—': 'OPAC-', # 长破折号
-            'OPAC_': 'OPAC-', # 下划线
-        }
-        for wrong, correct in replacements.items():
-            sku = sku.replace(wrong, correct)
-        return sku
-    
-    ocr_norm = normalize_sku(ocr_clean)
-    excel_norm = normalize_sku(excel_clean)
-    
-    if ocr_norm == excel_norm:
-        return True
-    
-    # 3. 数字/字母常见OCR错误纠正
-    def apply_ocr_corrections(sku):
-        corrections = {
-            '0': 'O', 'O': '0',  # 数字0和字母O互换
-            '1': 'I', 'I': '1',  # 数字1和字母I互换
-            '5': 'S', 'S': '5',  # 数字5和字母S互换
-            '8': 'B', 'B': '8',  # 数字8和字母B互换
-            '6': '9', '9': '6',  # 数字6和9互换
-            'G': '6', '6': 'G',  # 字母G和数字6互换
-            'Q': 'O', 'O': 'Q',  # 字母Q和O互换
-        }
-        result = sku
-        for wrong, correct in corrections.items():
-            result = result.replace(wrong, correct)
-        return result
-    
-    ocr_corrected = apply_ocr_corrections(ocr_norm)
-    if ocr_corrected == excel_norm:
-        return True
-    
-    # 双向纠错：也对Excel进行OCR纠错尝试
-    excel_corrected = apply_ocr_corrections(excel_norm)
-    if ocr_norm == excel_corrected:
-        return True
-    
-    # 4. 智能前缀/后缀匹配（处理截断问题）
-    # OCR可能截断，检查核心部分是否匹配
-    if len(ocr_norm) >= 6 and len(excel_norm) >= 6:
-        # 前缀匹配：OCR可能被截断
-        if excel_norm.startswith(ocr_norm) and len(ocr_norm) >= len(excel_norm) * 0.7:
-            return True
-        # 反向：Excel在OCR中被截断
-        if ocr_norm.startswith(excel_norm) and len(excel_norm) >= len(ocr_norm) * 0.7:
-            return True
-    
-    # 5. 核心SKU提取匹配
-    def extract_core_components(sku):
-        import re
-        # 提取主要的字母数字组件
-        parts = re.findall(r'[A-Z0-9]+', sku)
-        return parts
-    
-    ocr_parts = extract_core_components(ocr_norm)
-    excel_parts = extract_core_components(excel_norm)
-    
-    # 检查主要组件是否匹配（允许部分缺失）
-    if len(ocr_parts) >= 2 and len(excel_parts) >= 2:
-        # 至少前两个主要组件匹配
-        if len(ocr_parts) >= 2 and len(excel_parts) >= 2:
-            if (ocr_parts[0] == excel_parts[0] and ocr_parts[1] == excel_parts[1]):
-                return True
-    
-    # 6. 特殊SKU系列优化匹配
-    
-    # OPAC系列特殊处理
-    if 'OPAC' in ocr_norm and 'OPAC' in excel_norm:
-        import re
-        ocr_num = re.search(r'OPAC-?(\d+)', ocr_norm)
-        excel_num = re.search(r'OPAC-?(\d+)', excel_norm)
-        if ocr_num and excel_num:
-            ocr_n = ocr_num.group(1)
-            excel_n = excel_num.group(1)
-            # 处理5/6/9的常见混淆
-            number_equivalents = {'5': '9', '9': '5', '6': '9', '9': '6'}
-            if ocr_n == excel_n or number_equivalents.get(ocr_n) == excel_n:
-                return True
-    
-    # TFO1S系列特殊处理
-    if ('TFO1S' in ocr_norm or 'TF01S' in ocr_norm or 'TFO15' in ocr_norm) and 'TFO1S' in excel_norm:
-        return True
-    
-    # TL系列特殊处理
-    if 'TL' in ocr_norm and 'TL' in excel_norm:
-        # 提取W后面的部分
-        import re
-        ocr_w_part = re.search(r'TL-?W(\w+)', ocr_norm)
-        excel_w_part = re.search(r'TL-?W(\w+)', excel_norm)
-        if ocr_w_part and excel_w_part:
-            if ocr_w_part.group(1)[:3] == excel_w_part.group(1)[:3]:  # 前3个字符匹配
-                return True
-    
-    # 7. 容错匹配：相似度计算
-    def calculate_similarity(s1, s2):
-        # 简单的编辑距离相似度
-        if len(s1) == 0 or len(s2) == 0:
-            return 0
-        
-        # 计算相同字符的比例
-        min_len = min(len(s1), len(s2))
-        max_len = max(len(s1), len(s2))
-        
-        same_chars = sum(1 for i in range(min_len) if s1[i] == s2[i])
-        similarity = same_chars / max_len
-        return similarity
-    
-    # 如果相似度很高（85%以上），认为匹配
-    similarity = calculate_similarity(ocr_norm, excel_norm)
-    if similarity >= 0.85 and len(ocr_norm) >= 6 and len(excel_norm) >= 6:
-        return True
-    
-    return False
-
 def load_algin_sku_order(excel_path="uploads/ALGIN.xlsx"):
     """加载ALGIN SKU的正确排序顺序"""
     # 使用硬编码的正确SKU顺序（用户提供的准确顺序）
@@ -365,316 +196,646 @@ def get_warehouse_sort_key(item):
             )
     return (999, 999, 999)
 
-def process_pdf(input_pdf, output_dir, mode="warehouse"):
+# 仓库标签模式
+WAREHOUSE_915_PATTERN = re.compile(r"\b([A-Z]{2})-(\d{3})-([A-Z0-9]+)\b")     # 915格式
+WAREHOUSE_ROW_PATTERN = re.compile(r"\b([A-Z]{2})-([A-Z]{2})-(\d{2,3})\b")    # 8090/60格式
+
+# ALGIN SKU识别模式（按优先级排列），模块加载时编译一次
+# 不合并成一个交替正则：交替只返回互不重叠的最左匹配，同一段文本被多个模式匹配到的候选会丢失，候选顺序也会改变
+ALGIN_SKU_PATTERNS = [re.compile(pattern) for pattern in (
+    # 标准完整格式
+    r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9]+)\b',                    # 048-OPAC-5, 048-TL-W6KWD
+    r'\b(\d{3})-([A-Z]{2,4})—(\d+)-?([A-Z]*)\b',                # 048-OPAC—5, 014-HG—17061-B
+    r'\b([A-Z0-9]{3,5})-([A-Z]{2})\b',                          # TFO1S-BK
+    r'\b([A-Z0-9]{3,5})—([A-Z]{2})\b',                          # TFO1S—BK
+    r'\b(\d{3})-([A-Z]{2})—([A-Z0-9]+)\b',                      # 048-TL—W6KWD
+
+    # 014-HG系列格式
+    r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]+)\b',                   # 014-HG-17061-A
+    r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]{2,3})\b',               # 014-HG-17061-BRO
+    r'\b(014)-([A-Z]{2})-(\d{5})\b',                            # 014-HG-41023
+
+    # 050系列格式
+    r'\b(050)-([A-Z]{2,3})-(\d{2,5})-?([A-Z]*)\b',              # 050-HA-50028, 050-LMT-23-GY
+
+    # 060系列格式
+    r'\b(060)-([A-Z]{3})-(\d{2,3}[A-Z]*)-([A-Z]{2,3})\b',       # 060-ROT-11L-WH, 060-ROT-15V2-DG
+
+    # 处理截断和空格问题的模式
+    r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]+)',        # 带空格的格式: "048 -TL-W..."
+    r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]*)',        # 可能截断的格式
+    r'([A-Z0-9]{3,5})\s*[-—]\s*([A-Z]{2})',                     # TF01S —BK 格式
+
+    # 非常宽松的模式（处理严重OCR错误）
+    r'(\d{3})\s*[-—]?\s*([A-Z]{2,4})',                          # 最基本的数字-字母格式
+    r'([A-Z0-9]{4,6})\s*[-—]\s*([A-Z]{1,3})',                   # 字母数字-字母格式
+
+    # 通用灵活格式（最后匹配）
+    r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9-]+)\b',                   # 通用数字-字母-字母数字格式
+    r'\b([A-Z0-9]{3,6})-([A-Z0-9]{2,6})\b',                     # 通用字母数字-字母数字格式
+)]
+
+# SKU候选验证用的模式
+_FOUR_DIGITS_PATTERN = re.compile(r'^\d{4}$')
+_HAS_LETTER_PATTERN = re.compile(r'[A-Z]')
+_HAS_DIGIT_PATTERN = re.compile(r'\d')
+_TIMESTAMP_PATTERN = re.compile(r'^\d{3}-[A-Z]{2,4}$')
+_TIME_MARK_PATTERN = re.compile(r'(AOI|AATT|AI0)')
+_PAGE_NUMBER_PREFIXES = ('101-', '102-', '103-', '104-', '105-')
+_KNOWN_SKU_SERIES_PATTERN = re.compile(r'048-(OPAC|TL)|TFO1S|060-ROT|014-HG|050-(HA|LMT)')
+
+def is_valid_sku_candidate(potential_sku):
+    """更严格的SKU验证 - 增强版"""
+    return bool(
+        len(potential_sku) >= 5 and
+        not _FOUR_DIGITS_PATTERN.match(potential_sku) and
+        not potential_sku.startswith('AGD') and
+        # 确保包含至少一个字母和一个数字
+        _HAS_LETTER_PATTERN.search(potential_sku) and
+        _HAS_DIGIT_PATTERN.search(potential_sku) and
+        # 排除明显的错误模式
+        not _TIMESTAMP_PATTERN.match(potential_sku) and  # 排除时间戳格式
+        not potential_sku.startswith(_PAGE_NUMBER_PREFIXES) and  # 排除页面编号
+        not _TIME_MARK_PATTERN.search(potential_sku))  # 排除时间标记
+
+def extract_algin_sku_candidates(text):
+    """
+    只做一次大写转换，按优先级依次用每个已编译的SKU模式扫描（每个模式一次findall）
+    返回去重后的候选SKU列表，排在前面的优先级更高
+    """
+    text_upper = text.upper()
+    # 所有合法候选都必须包含数字，没有数字的页面无需扫描
+    if not _HAS_DIGIT_PATTERN.search(text_upper):
+        return []
+
+    candidates = []
+    seen = set()
+    for pattern in ALGIN_SKU_PATTERNS:
+        for match in pattern.findall(text_upper):
+            # 过滤掉空字符串，然后重新组合
+            potential_sku = '-'.join(part for part in match if part)
+            if potential_sku in seen:
+                continue
+            seen.add(potential_sku)
+            if is_valid_sku_candidate(potential_sku):
+                candidates.append(potential_sku)
+    return candidates
+
+def sku_priority(sku):
+    """没有匹配到Excel SKU时，选择最可能的SKU（分数越高越靠前）"""
+    score = 0
+    # 优先选择包含已知SKU模式的
+    if _KNOWN_SKU_SERIES_PATTERN.match(sku):
+        score += 100
+
+    # 长度奖励
+    score += len(sku)
+
+    # 分隔符奖励
+    if '-' in sku or '—' in sku:
+        score += 10
+
+    return -score
+
+def resolves_to_catalog_sku(text, algin_sku_order):
+    """文本中是否有候选SKU能在目录中解析到（两级OCR判断是否需要升级为整页识别）"""
+    candidates = extract_algin_sku_candidates(text)
+    return bool(candidates) and get_sku_index(algin_sku_order).resolve_first(candidates) is not None
+
+def classify_page(page, idx, mode, algin_sku_order=None, report=NULL_REPORT):
+    """
+    对单个页面分类，返回 (分组名, 分组条目)
+    需要OCR的纯图像页面返回 ("ocr_pending", (页码,))，由run_ocr_batch统一处理
+    """
+    with report.timer('extract_text'):
+        text = page.extract_text() or ""
+
+    # Check if page is truly blank (no text, no images, no visual elements)
+    with report.timer('visual_check'):
+        has_visual_content = (
+            len(page.images) > 0 or 
+            len(page.rects) > 0 or 
+            len(page.lines) > 0 or
+            len(page.chars) > 0
+        )
+
+    # Only consider it blank if there's no text AND no visual content
+    if not text.strip() and not has_visual_content:
+        return "blank", (idx, "")
+
+    # If no extractable text but has visual content, try OCR (for ALGIN mode)
+    if mode == "algin" and not text.strip() and has_visual_content:
+        if OCR_AVAILABLE:
+            # 先收集所有纯图像页面，之后统一并发OCR
+            return "ocr_pending", (idx,)
+        print(f"⚠️  页面{idx+1} OCR不可用，有视觉内容但无法处理")
+        # 如果OCR不可用，但页面有视觉内容，我们假设这可能是ALGIN标签
+        return "algin_unscanned", (idx, "[ALGIN Label - OCR不可用]")
+    
+    return classify_text(text, idx, mode, algin_sku_order, report)
+
+def classify_ocr_result(idx, ocr_text, error, mode, algin_sku_order=None, report=NULL_REPORT):
+    """根据OCR结果对纯图像页面分类，返回 (分组名, 分组条目)"""
+    if error:
+        return "algin_unscanned", (idx, f"[ALGIN Label - OCR异常: {error[:30]}]")
+    if ocr_text.strip():
+        # OCR成功，继续处理
+        return classify_text(ocr_text, idx, mode, algin_sku_order, report)
+    # 检查是否是未能扫出SKU的label
+    if is_unscanned_sku_label(ocr_text):
+        sort_key = extract_sort_key_for_unscanned(ocr_text)
+        return "algin_summary", (idx, sort_key, ocr_text[:100])
+    # 假设这是ALGIN标签但无法识别
+    return "algin_unscanned", (idx, "[ALGIN Label - OCR失败]")
+
+def match_algin_sku(found_skus, algin_sku_order, report=NULL_REPORT):
+    """为页面的候选SKU选择最终SKU：目录解析 → 部分匹配 → 按优先级推断"""
+    # 首先尝试与Excel SKU列表精确匹配
+    # 使用Excel中的标准格式；按候选优先级依次在目录索引中查找
+    sku_index = get_sku_index(algin_sku_order)
+    matched_sku = sku_index.resolve_first(found_skus)
+    if matched_sku:
+        report.count('sku_match:catalog')
+        return matched_sku
+
+    # 如果没有精确匹配，尝试部分匹配Excel SKU
+    for potential_sku in found_skus:
+        matched_sku = sku_index.partial_match(potential_sku)
+        if matched_sku:
+            report.count('sku_match:partial')
+            return matched_sku
+
+    # 如果仍然没有匹配，选择最可能的SKU
+    report.count('sku_match:guessed')
+    found_skus.sort(key=sku_priority)
+    return found_skus[0]
+
+def classify_text(text, idx, mode, algin_sku_order=None, report=NULL_REPORT):
+    """根据页面文本分类，返回 (分组名, 分组条目)"""
+    # First, check if this is a summary page (for ALGIN mode)
+    if mode == "algin" and is_unscanned_sku_label(text):
+        sort_key = extract_sort_key_for_unscanned(text)
+        return "algin_summary", (idx, sort_key, text[:100])
+
+    # 根据模式决定处理逻辑
+    if mode == "algin":
+        # ALGIN排序模式 - 非常积极的识别策略
+        # 根据用户反馈，几乎所有页面都应该是ALGIN标签页面
+
+        # 首先检查是否明确不是ALGIN标签（仓库标签等）
+        is_definitely_not_algin = False
+
+        # 检查仓库模式匹配
+        for pattern in (WAREHOUSE_915_PATTERN, WAREHOUSE_ROW_PATTERN):
+            if pattern.search(text):
+                is_definitely_not_algin = True
+                break
+
+        # 如果不是明确的仓库标签，就假设是ALGIN标签
+        is_algin_label = not is_definitely_not_algin
+
+        if is_algin_label:
+            # 使用智能SKU识别和排序逻辑 - 大幅增强模式匹配
+            with report.timer('sku_match'):
+                found_skus = extract_algin_sku_candidates(text)
+                # 选择最佳SKU - 增强匹配逻辑
+                matched_sku = match_algin_sku(found_skus, algin_sku_order, report) if found_skus else None
+
+            if found_skus:
+                print(f"🔗 页面{idx+1} 匹配成功 → Excel='{matched_sku}'")
+                return "algin_sorted", (idx, matched_sku, text[:200])
+
+            report.count('sku_match:none')
+            return "algin_unscanned", (idx, "[ALGIN Label - 未扫描出来的label]", text[:200])
+
+    # Look for 915 warehouse pattern
+    m_915 = WAREHOUSE_915_PATTERN.search(text)
+    if m_915:
+        prefix, num, suffix = m_915.group(1), int(m_915.group(2)), m_915.group(3)
+        if prefix in WAREHOUSE_PREFIXES["915"]:
+            return "915", (idx, prefix, num, suffix)
+        else:
+            return "unknown", (idx, text[:100])
+
+    # Look for other warehouse patterns
+    m_other = WAREHOUSE_ROW_PATTERN.search(text)
+    if m_other:
+        prefix, row, num = m_other.group(1), m_other.group(2), int(m_other.group(3))
+        if prefix in WAREHOUSE_PREFIXES["8090"]:
+            return "8090", (idx, prefix, row, num)
+        elif prefix in WAREHOUSE_PREFIXES["60"]:
+            return "60", (idx, prefix, row, num)
+        else:
+            return "unknown", (idx, text[:100])
+
+    # If no patterns found, add to unknown
+    return "unknown", (idx, text[:100])
+
+def fast_page_text(page, report=NULL_REPORT):
+    """用pypdf的页面对象提取原始文本，不触发pdfplumber的字符/图形分析；提取失败时返回None"""
+    try:
+        with report.timer('fast_extract_text'):
+            return page.extract_text() or ""
+    except Exception:
+        return None
+
+def classify_fast_text(text, idx, mode):
+    """
+    仓库模式的快速分类：只有文本里能匹配到已知仓库的标签时才返回 (分组名, 分组条目)，
+    其余情况（空白、未知、无文本层、提取失败）返回None交给classify_page
+    """
+    if mode != "warehouse" or text is None:
+        return None
+    if not (WAREHOUSE_915_PATTERN.search(text) or WAREHOUSE_ROW_PATTERN.search(text)):
+        return None
+    group, item = classify_text(text, idx, mode)
+    if group == "unknown":
+        return None
+    return group, item
+
+def classify_page_fast(page, idx, mode, report=NULL_REPORT):
+    """仓库模式下用pypdf文本快速分类单个页面，判断不了时返回None"""
+    if mode != "warehouse":
+        return None
+    return classify_fast_text(fast_page_text(page, report), idx, mode)
+
+def warehouse_candidates(text):
+    """
+    快速路径判断不了的页面，经pdfplumber完整分析后可能归入的仓库组
+    两种提取方式的字符相同、只有空白和换行不同，所以去掉空白后的pypdf文本里出现 "前缀-" 才算候选；
+    提取失败（text为None）时所有仓库组都是候选
+    """
+    if text is None:
+        return set(WAREHOUSE_PREFIXES)
+    compact = re.sub(r"\s+", "", text)
+    return {
+        warehouse for warehouse, prefixes in WAREHOUSE_PREFIXES.items()
+        if any(f"{prefix}-" in compact for prefix in prefixes)
+    }
+
+def prescan_warehouse_pages(source, total_pages, report=NULL_REPORT):
+    """
+    仓库模式的预扫描：对所有页面走一遍快速路径
+    返回 (快速路径已分类的 [(页码, 分组名, 分组条目)], 需要完整分析的 {页码: 候选仓库组集合})
+    """
+    classified = []
+    pending = {}
+    for idx in range(total_pages):
+        text = fast_page_text(source.reader.pages[idx], report)
+        result = classify_fast_text(text, idx, "warehouse")
+        if result is not None:
+            report.count('fast_text_pages')
+            classified.append((idx,) + result)
+        else:
+            pending[idx] = warehouse_candidates(text)
+    return classified, pending
+
+def classify_source_page(source, idx, mode, algin_sku_order=None, fast_text=False, report=NULL_REPORT):
+    """对source中的单个页面分类，返回 (分组名, 分组条目, 是否走了快速路径)"""
+    if fast_text:
+        result = classify_page_fast(source.reader.pages[idx], idx, mode, report)
+        if result is not None:
+            report.count('fast_text_pages')
+            return result + (True,)
+    report.count('pdfplumber_pages')
+    page = source.plumber.pages[idx]
+    group, item = classify_page(page, idx, mode, algin_sku_order, report)
+    # 分类后释放页面解析缓存（字符、图形对象等，以及flush_cache不会清除的get_textmap缓存）
+    page.close()
+    return group, item, False
+
+def _classify_page_range(input_pdf, page_indices, mode, algin_sku_order, fast_text):
+    """进程池worker：独立映射并解析PDF，对page_indices中的页面分类，返回 (分类结果, 本块的报告)"""
+    results = []
+    report = RunReport()
+    with PdfSource(input_pdf) as source:
+        for idx in page_indices:
+            results.append((idx,) + classify_source_page(source, idx, mode, algin_sku_order, fast_text, report))
+    return results, report.to_dict()
+
+def iter_classified_pages(source, total_pages, mode, algin_sku_order=None, workers=1, fast_text=False, report=NULL_REPORT, pages=None):
+    """
+    按pages的顺序（默认全部页面按页码顺序）逐页产出分类结果 (idx, 分组名, 分组条目, 是否走了快速路径)
+    串行时直接使用source共用的pdfplumber文档
+    fast_text: 仓库模式下先尝试classify_page_fast，pdfplumber只用于它判断不了的页面
+    workers > 1 且页数足够时，将页面分块后交给进程池并行分类
+    """
+    if pages is None:
+        pages = range(total_pages)
+    if workers <= 1 or len(pages) < PARALLEL_MIN_PAGES:
+        for idx in pages:
+            yield (idx,) + classify_source_page(source, idx, mode, algin_sku_order, fast_text, report)
+        return
+    
+    # 每个worker分多个块，避免个别慢页面（OCR）拖慢整体
+    chunk_size = max(PARALLEL_MIN_CHUNK, -(-len(pages) // (workers * 4)))
+    chunks = [list(pages[start:start + chunk_size]) for start in range(0, len(pages), chunk_size)]
+    print(f"⚡ 并行分类: {workers} 个进程, {len(chunks)} 个分块 (每块 {chunk_size} 页)")
+    
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [
+            executor.submit(_classify_page_range, source.path, chunk, mode, algin_sku_order, fast_text)
+            for chunk in chunks
+        ]
+        # 按分块顺序合并，保证页面顺序与串行处理一致
+        for future in futures:
+            results, chunk_report = future.result()
+            report.merge(chunk_report)
+            for result in results:
+                yield result
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），平台不支持时返回None"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / 1024 / 1024 if platform.system() == 'Darwin' else peak / 1024
+
+def write_output_pdf(source, output_path, page_indices, low_memory=False, report=NULL_REPORT):
+    """
+    把原PDF中的指定页面按顺序写入新文件
+    默认所有输出组共用source的PdfReader；low_memory时为本组单独解析，写完即释放，内存只与本组页面有关
+    先写入同目录下的临时文件再os.replace：提前输出的组重新生成时，正在下载旧文件的请求不会读到被截断的文件
+    """
+    reader = source.open_reader() if low_memory else source.reader
+    writer = PdfWriter()
+    for page_idx in page_indices:
+        writer.add_page(reader.pages[page_idx])
+    with report.timer('write'):
+        fd, temp_path = tempfile.mkstemp(prefix='.writing_', suffix='.pdf', dir=os.path.dirname(output_path) or '.')
+        try:
+            with os.fdopen(fd, "wb") as f:
+                writer.write(f)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    del writer
+    if low_memory:
+        del reader
+        gc.collect()
+
+def process_pdf(input_pdf, output_dir, mode="warehouse", progress_callback=None, workers=None, use_cache=None, low_memory=None, fast_text=None, report_path=None, return_report=False):
+    """
+    处理PDF并按模式输出分组后的文件，返回输出文件路径列表
+    return_report为True时返回 (输出文件路径列表, RunReport)，报告包含各阶段计时和计数器
+    progress_callback: 可选，接收进度事件dict {'phase', 'processed', 'total', 'ocr_pages', 'elapsed', 'eta'}
+        ocr_pages为目前发现的需要OCR的页数，elapsed为已用秒数，eta为按本阶段速度估算的本阶段剩余秒数（未知时为None）
+    workers: 页面分类的并行进程数，默认读取环境变量PDF_WORKERS（1为串行）
+    use_cache: 是否使用结果缓存，默认读取环境变量RESULT_CACHE_ENABLED
+    low_memory: 低内存模式，默认读取环境变量PDF_LOW_MEMORY
+    fast_text: 仓库模式下先用pypdf快速提取文本分类，默认读取环境变量PDF_FAST_TEXT
+    report_path: 可选，把处理报告写成JSON文件
+    """
+    if workers is None:
+        workers = PDF_WORKERS
+    if use_cache is None:
+        use_cache = result_cache.RESULT_CACHE_ENABLED
+    if low_memory is None:
+        low_memory = PDF_LOW_MEMORY
+    if fast_text is None:
+        fast_text = PDF_FAST_TEXT
+    # 快速路径只认仓库标签，ALGIN模式需要pdfplumber的文本和视觉内容判断
+    fast_text = fast_text and mode == "warehouse"
+    if low_memory:
+        # 每个子进程都会完整解析一遍PDF，低内存模式下串行分类
+        workers = 1
+    
+    report = RunReport(file=os.path.basename(input_pdf), mode=mode, workers=workers,
+                       low_memory=low_memory, fast_text=fast_text)
+    # 文件只映射一次，分类、OCR渲染和输出都从这份映射读取
+    with report.timer('parse'):
+        source = PdfSource(input_pdf)
+    with source:
+        outputs = _process_source(source, output_dir, mode, progress_callback, workers, use_cache, low_memory, fast_text, report)
+    
+    report.update_info(outputs=[os.path.basename(path) for path in outputs])
+    report.finish()
+    timings = report.to_dict()['timings']
+    print("⏱️ 阶段耗时: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    if report_path:
+        report.write_json(report_path)
+    return (outputs, report) if return_report else outputs
+
+def _process_source(source, output_dir, mode, progress_callback, workers, use_cache, low_memory, fast_text, report):
+    """process_pdf的主体，参数已解析为最终值"""
+    input_pdf = source.path
     print(f"🔄 开始处理PDF: {os.path.basename(input_pdf)}")
     
-    reader = PdfReader(input_pdf)
-    total_pages = len(reader.pages)
+    progress_started = time.perf_counter()
+    phase_started = {}  # 阶段 → (开始时间, 开始时的已处理数)
+    progress_state = {'ocr_pages': 0}
+    ready_outputs = []  # 已提前写出、可以下载的文件
+    superseded = []  # 提前写出后又要重新生成的文件名（用户可能已经下载了不完整的版本）
+    
+    def report_progress(phase, processed, total=None, ocr_pages=None):
+        if not progress_callback:
+            return
+        total = total_pages if total is None else total
+        if ocr_pages is not None:
+            progress_state['ocr_pages'] = ocr_pages
+        now = time.perf_counter()
+        start, start_processed = phase_started.setdefault(phase, (now, processed))
+        eta = None
+        if phase == 'done':
+            eta = 0
+        elif processed > start_processed and total:
+            eta = round((total - processed) * (now - start) / (processed - start_processed), 1)
+        event = {'phase': phase, 'processed': processed, 'total': total,
+                 'ocr_pages': progress_state['ocr_pages'],
+                 'elapsed': round(now - progress_started, 1), 'eta': eta}
+        if ready_outputs:
+            event['outputs'] = list(ready_outputs)
+        if superseded:
+            event['superseded'] = list(superseded)
+        progress_callback(event)
+    
+    # 快速路径本来就要用PdfReader，页数直接从它取，不为计数触发pdfminer解析
+    with report.timer('parse'):
+        total_pages = len(source.reader.pages) if fast_text else source.page_count
+    report.update_info(pages=total_pages)
     print(f"📄 总页数: {total_pages}")
+    if low_memory:
+        # 输出时每组单独解析，不在整个处理过程中持有已解析的页面对象
+        print("🪶 低内存模式")
     
     # 根据模式决定是否加载ALGIN SKU顺序
     if mode == "algin":
         algin_sku_order = load_algin_sku_order()
+        # 目录索引和候选SKU的LRU缓存在分类和排序之间共用
+        sku_index = get_sku_index(algin_sku_order)
+        memo_before = sku_index.memo_stats()
+        tiers_before = sku_index.tier_stats()
         groups = {"915": [], "8090": [], "60": [], "algin_sorted": [], "algin_unscanned": [], "algin_summary": [], "unknown": [], "blank": []}
     else:
         algin_sku_order = None
+        sku_index = None
         groups = {"915": [], "8090": [], "60": [], "unknown": [], "blank": []}
     
+    # 相同文件+相同配置直接返回缓存的结果
+    cache_key = None
+    if use_cache:
+        with report.timer('result_cache'):
+            cache_key = result_cache.make_key(
+                input_pdf, mode, sku_order=algin_sku_order, prefix_table=WAREHOUSE_PREFIXES,
+                extra={'ocr_available': OCR_AVAILABLE, 'fast_text': fast_text,
+                       # OCR分辨率、识别区域、tesseract配置变化后旧结果不再命中
+                       'ocr_engine': engine_signature(roi_box())})
+            cached_outputs = result_cache.lookup(cache_key, input_pdf, output_dir)
+        if cached_outputs is not None:
+            report.count('result_cache_hits')
+            report_progress('done', total_pages)
+            return cached_outputs
+    
     # 统计变量
     ocr_pages = 0
     processed_pages = 0
+    fast_pages = 0
     
     # 重要：跟踪所有页面，确保没有页面丢失
     all_processed_pages = set()
     
-    with pdfplumber.open(input_pdf) as plumber:
-        for idx, page in enumerate(plumber.pages):
-            processed_pages += 1
-            
-            # 每处理5页显示一次进度（更频繁的反馈）
-            if processed_pages % 5 == 0:
-                print(f"📊 处理进度: {processed_pages}/{total_pages} ({processed_pages/total_pages*100:.1f}%)")
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}  # 分组 → (输出路径, 文件名, 原PDF页码列表)，空组为None
+    rewrite = set()  # 提前写出后又有页面加入的组，最后重新生成
+    
+    def write_group(warehouse):
+        """排序并写出一个非ALGIN分组"""
+        pages = groups[warehouse]
+        # 先按页码排，排序键相同的页面保持原PDF中的顺序（分类顺序可能与页码顺序不同）
+        pages.sort(key=lambda item: item[0])
+        if warehouse in WAREHOUSE_PREFIXES:
+            pages.sort(key=get_warehouse_sort_key)
+        if not pages:
+            print(f"⚠️  {warehouse} 组为空，跳过")
+            written[warehouse] = None
+            return
             
-            text = page.extract_text() or ""
+        # Determine output filename
+        if warehouse == "unknown":
+            # 检查是否包含大量ALGIN标签
+            algin_count = 0
+            for item in pages:
+                page_content = item[1] if len(item) > 1 else ""
+                if any(keyword in str(page_content).upper() for keyword in ['ALN', 'ALGIN', 'ALIGN']):
+                    algin_count += 1
             
-            # Check if page is truly blank (no text, no images, no visual elements)
-            has_visual_content = (
-                len(page.images) > 0 or 
-                len(page.rects) > 0 or 
-                len(page.lines) > 0 or
-                len(page.chars) > 0
-            )
+            if algin_count > len(pages) * 0.5:  # 如果超过50%的页面包含ALGIN标签
+                output_name = "ALGIN标签页面_请使用ALGIN排序功能.pdf"
+                print(f"🔍 检测到 {algin_count}/{len(pages)} 页包含ALGIN标签")
+                print(f"💡 建议：请使用'ALGIN客户的Label排序'功能处理此文件")
+            else:
+                output_name = "未找到仓库.pdf"
+        elif warehouse == "blank":
+            output_name = "空白页.pdf"
+        else:
+            output_name = f"{warehouse}_Sorted.pdf"
             
-            # 记录页面已处理
+        output_path = os.path.join(output_dir, output_name)
+        write_output_pdf(source, output_path, [item[0] for item in pages], low_memory, report)
+        written[warehouse] = (output_path, output_name, [item[0] for item in pages])
+        print(f"✅ 生成文件: {output_name} ({len(pages)} 页)")
+    
+    def finish_early(warehouse):
+        """仓库组不会再有新页面，立即写出供下载"""
+        write_group(warehouse)
+        if written[warehouse]:
+            ready_outputs.append(written[warehouse][0])
+            report.count('early_outputs')
+            report_progress('classify', processed_pages)
+    
+    # 仓库模式提前输出：先预扫描，快速路径确定的页面直接入组，其余页面按可能归入的仓库组排序后再完整分析，
+    # 某个仓库组的候选页面全部分析完（或本来就没有候选页面）时立即写出该组
+    early_output = mode == "warehouse" and fast_text and PDF_EARLY_OUTPUT
+    pages_to_classify = None
+    candidates = {}
+    remaining = {}  # 仓库组 → 还未分析的候选页数
+    if early_output:
+        classified, candidates = prescan_warehouse_pages(source, total_pages, report)
+        for idx, group, item in classified:
+            groups[group].append(item)
             all_processed_pages.add(idx)
-            
-            # Only consider it blank if there's no text AND no visual content
-            if not text.strip() and not has_visual_content:
-                groups["blank"].append((idx, ""))
-                continue
-            
-            # If no extractable text but has visual content, try OCR (for ALGIN mode)
-            if mode == "algin" and not text.strip() and has_visual_content:
-                ocr_pages += 1
-                ocr_text = ""
-                if OCR_AVAILABLE:
-                    try:
-                        # Convert page to image and run OCR with optimized resolution
-                        page_image = page.to_image(resolution=120)  # 平衡质量和速度
-                        # 优化的OCR配置（减少尝试次数）
-                        ocr_configs = [
-                            '--psm 6 --oem 1',  # 最快的配置，优先使用
-                            '--psm 4 --oem 1',  # 备用配置
-                        ]
-                        for config in ocr_configs:
-                            try:
-                                ocr_text = pytesseract.image_to_string(page_image.original, config=config)
-                                if ocr_text.strip():
-                                    text = ocr_text
-                                    print(f"🔍 页面{idx+1} OCR成功: {text[:50]}...")
-                                    break
-                            except Exception as ocr_e:
-                                print(f"❌ 页面{idx+1} OCR失败: {str(ocr_e)[:50]}")
-                                continue
-                        if text.strip():
-                            # OCR成功，继续处理
-                            pass
-                        else:
-                            print(f"⚠️  页面{idx+1} 所有OCR配置均失败")
-                            # 检查是否是未能扫出SKU的label
-                            if is_unscanned_sku_label(ocr_text):
-                                sort_key = extract_sort_key_for_unscanned(ocr_text)
-                                groups["algin_summary"].append((idx, sort_key, ocr_text[:100]))
-                                continue
-                            # 假设这是ALGIN标签但无法识别
-                            groups["algin_unscanned"].append((idx, "[ALGIN Label - OCR失败]"))
-                            continue
-                    except Exception as e:
-                        print(f"❌ 页面{idx+1} OCR失败: {str(e)}")
-                        groups["algin_unscanned"].append((idx, f"[ALGIN Label - OCR异常: {str(e)[:30]}]"))
-                        continue
-                else:
-                    print(f"⚠️  页面{idx+1} OCR不可用，有视觉内容但无法处理")
-                    # 如果OCR不可用，但页面有视觉内容，我们假设这可能是ALGIN标签
-                    groups["algin_unscanned"].append((idx, "[ALGIN Label - OCR不可用]"))
-                    continue
-            
-            # First, check if this is a summary page (for ALGIN mode)
-            if mode == "algin" and is_unscanned_sku_label(text):
-                sort_key = extract_sort_key_for_unscanned(text)
-                groups["algin_summary"].append((idx, sort_key, text[:100]))
-                continue
-            
-            # 根据模式决定处理逻辑
-            if mode == "algin":
-                # ALGIN排序模式 - 非常积极的识别策略
-                # 根据用户反馈，几乎所有页面都应该是ALGIN标签页面
-                text_upper = text.upper()
-                
-                # 首先检查是否明确不是ALGIN标签（仓库标签等）
-                is_definitely_not_algin = False
-                
-                # 检查仓库模式匹配
-                warehouse_patterns = [
-                    r"\b([A-Z]{2})-(\d{3})-([A-Z0-9]+)\b",  # 915格式
-                    r"\b([A-Z]{2})-([A-Z]{2})-(\d{2,3})\b"  # 8090/60格式
-                ]
-                
-                for pattern in warehouse_patterns:
-                    if re.search(pattern, text):
-                        is_definitely_not_algin = True
-                        break
-                
-                # 如果不是明确的仓库标签，就假设是ALGIN标签
-                is_algin_label = not is_definitely_not_algin
-                
-                if is_algin_label:
-                    # 使用智能SKU识别和排序逻辑 - 大幅增强模式匹配
-                    algin_sku_patterns = [
-                        # 标准完整格式
-                        r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9]+)\b',                    # 048-OPAC-5, 048-TL-W6KWD
-                        r'\b(\d{3})-([A-Z]{2,4})—(\d+)-?([A-Z]*)\b',                # 048-OPAC—5, 014-HG—17061-B  
-                        r'\b([A-Z0-9]{3,5})-([A-Z]{2})\b',                          # TFO1S-BK
-                        r'\b([A-Z0-9]{3,5})—([A-Z]{2})\b',                          # TFO1S—BK
-                        r'\b(\d{3})-([A-Z]{2})—([A-Z0-9]+)\b',                      # 048-TL—W6KWD
-                        
-                        # 014-HG系列格式
-                        r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]+)\b',                   # 014-HG-17061-A
-                        r'\b(014)-([A-Z]{2})-(\d{5})-([A-Z]{2,3})\b',               # 014-HG-17061-BRO
-                        r'\b(014)-([A-Z]{2})-(\d{5})\b',                            # 014-HG-41023
-                        
-                        # 050系列格式
-                        r'\b(050)-([A-Z]{2,3})-(\d{2,5})-?([A-Z]*)\b',              # 050-HA-50028, 050-LMT-23-GY
-                        
-                        # 060系列格式
-                        r'\b(060)-([A-Z]{3})-(\d{2,3}[A-Z]*)-([A-Z]{2,3})\b',       # 060-ROT-11L-WH, 060-ROT-15V2-DG
-                        
-                        # 处理截断和空格问题的模式
-                        r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]+)',        # 带空格的格式: "048 -TL-W..."
-                        r'(\d{3})\s*-\s*([A-Z]{2,4})\s*[-—]\s*([A-Z0-9]*)',        # 可能截断的格式
-                        r'([A-Z0-9]{3,5})\s*[-—]\s*([A-Z]{2})',                     # TF01S —BK 格式
-                        
-                        # 非常宽松的模式（处理严重OCR错误）
-                        r'(\d{3})\s*[-—]?\s*([A-Z]{2,4})',                          # 最基本的数字-字母格式
-                        r'([A-Z0-9]{4,6})\s*[-—]\s*([A-Z]{1,3})',                   # 字母数字-字母格式
-                        
-                        # 通用灵活格式（最后匹配）
-                        r'\b(\d{3})-([A-Z]{2,4})-([A-Z0-9-]+)\b',                   # 通用数字-字母-字母数字格式
-                        r'\b([A-Z0-9]{3,6})-([A-Z0-9]{2,6})\b',                     # 通用字母数字-字母数字格式
-                    ]
-                    
-                    sku_found = False
-                    found_skus = []
-                    
-                    # 查找完整SKU格式
-                    for pattern in algin_sku_patterns:
-                        matches = re.findall(pattern, text.upper())
-                        if matches:
-                            for match in matches:
-                                if isinstance(match, tuple):
-                                    # 过滤掉空字符串，然后重新组合
-                                    non_empty_parts = [part for part in match if part]
-                                    potential_sku = '-'.join(non_empty_parts)
-                                else:
-                                    potential_sku = match
-                                
-                                # 更严格的SKU验证 - 增强版
-                                if (len(potential_sku) >= 5 and 
-                                    not re.match(r'^\d{4}$', potential_sku) and
-                                    not potential_sku.startswith('AGD') and
-                                    # 确保包含至少一个字母和一个数字
-                                    re.search(r'[A-Z]', potential_sku) and
-                                    re.search(r'\d', potential_sku) and
-                                    # 排除明显的错误模式
-                                    not re.match(r'^\d{3}-[A-Z]{2,4}$', potential_sku) and  # 排除时间戳格式
-                                    not potential_sku.startswith(('101-', '102-', '103-', '104-', '105-')) and  # 排除页面编号
-                                    not re.search(r'(AOI|AATT|AI0)', potential_sku)):  # 排除时间标记
-                                    found_skus.append(potential_sku)
-                    
-                    # 选择最佳SKU - 增强匹配逻辑
-                    if found_skus:
-                        # 首先尝试与Excel SKU列表精确匹配
-                        matched_sku = None
-                        best_match_score = 0
-                        
-                        for potential_sku in found_skus:
-                            for excel_sku in algin_sku_order:
-                                if is_sku_match(potential_sku, excel_sku):
-                                    matched_sku = excel_sku  # 使用Excel中的标准格式
-                                    best_match_score = 1.0
-                                    break
-                            if matched_sku:
-                                break
-                        
-                        # 如果没有精确匹配，尝试部分匹配和智能推断
-                        if not matched_sku and found_skus:
-                            # 尝试部分匹配Excel SKU
-                            for potential_sku in found_skus:
-                                best_partial_match = None
-                                best_match_score = 0
-                                
-                                for excel_sku in algin_sku_order:
-                                    # 计算相似度分数
-                                    similarity = 0
-                                    
-                                    # 前缀匹配（最重要）
-                                    if potential_sku.startswith('048') and excel_sku.startswith('048'):
-                                        similarity += 50
-                                        if 'OPAC' in potential_sku and 'OPAC' in excel_sku:
-                                            similarity += 30
-                                        elif 'TL' in potential_sku and 'TL' in excel_sku:
-                                            similarity += 30
-                                    elif potential_sku.startswith('TF') and excel_sku.startswith('TF'):
-                                        similarity += 50
-                                    elif potential_sku.startswith('060') and excel_sku.startswith('060'):
-                                        similarity += 50
-                                    elif potential_sku.startswith('014') and excel_sku.startswith('014'):
-                                        similarity += 50
-                                    elif potential_sku.startswith('050') and excel_sku.startswith('050'):
-                                        similarity += 50
-                                    
-                                    # 关键词匹配
-                                    if 'OPAC' in potential_sku and 'OPAC' in excel_sku:
-                                        similarity += 20
-                                    if 'ROT' in potential_sku and 'ROT' in excel_sku:
-                                        similarity += 20
-                                    if 'HG' in potential_sku and 'HG' in excel_sku:
-                                        similarity += 20
-                                    
-                                    if similarity > best_match_score:
-                                        best_match_score = similarity
-                                        best_partial_match = excel_sku
-                                
-                                if best_partial_match and best_match_score >= 50:
-                                    matched_sku = best_partial_match
-                                    break
-                            
-                            # 如果仍然没有匹配，选择最可能的SKU
-                            if not matched_sku:
-                                def sku_priority(sku):
-                                    score = 0
-                                    # 优先选择包含已知SKU模式的
-                                    if re.match(r'048-(OPAC|TL)', sku):
-                                        score += 100
-                                    elif re.match(r'TFO1S', sku):
-                                        score += 100
-                                    elif re.match(r'060-ROT', sku):
-                                        score += 100
-                                    elif re.match(r'014-HG', sku):
-                                        score += 100
-                                    elif re.match(r'050-(HA|LMT)', sku):
-                                        score += 100
-                                    
-                                    # 长度奖励
-                                    score += len(sku)
-                                    
-                                    # 分隔符奖励
-                                    if '-' in sku or '—' in sku:
-                                        score += 10
-                                    
-                                    return -score
-                                
-                                found_skus.sort(key=sku_priority)
-                                matched_sku = found_skus[0]
-                        
-                        groups["algin_sorted"].append((idx, matched_sku, text[:200]))
-                        print(f"🔗 页面{idx+1} 匹配成功 → Excel='{matched_sku}'")
-                        sku_found = True
-                    
-                    if not sku_found:
-                        groups["algin_unscanned"].append((idx, "[ALGIN Label - 未扫描出来的label]", text[:200]))
-                    continue
-                
-            # Look for 915 warehouse pattern
-            m_915 = re.search(r"\b([A-Z]{2})-(\d{3})-([A-Z0-9]+)\b", text)
-            if m_915:
-                prefix, num, suffix = m_915.group(1), int(m_915.group(2)), m_915.group(3)
-                if prefix in WAREHOUSE_PREFIXES["915"]:
-                    groups["915"].append((idx, prefix, num, suffix))
-                else:
-                    groups["unknown"].append((idx, text[:100]))
-                continue
-                
-            # Look for other warehouse patterns
-            m_other = re.search(r"\b([A-Z]{2})-([A-Z]{2})-(\d{2,3})\b", text)
-            if m_other:
-                prefix, row, num = m_other.group(1), m_other.group(2), int(m_other.group(3))
-                if prefix in WAREHOUSE_PREFIXES["8090"]:
-                    groups["8090"].append((idx, prefix, row, num))
-                elif prefix in WAREHOUSE_PREFIXES["60"]:
-                    groups["60"].append((idx, prefix, row, num))
-                else:
-                    groups["unknown"].append((idx, text[:100]))
-                continue
-                
-            # If no patterns found, add to unknown
-            groups["unknown"].append((idx, text[:100]))
+        processed_pages = fast_pages = len(classified)
+        report_progress('prescan', processed_pages)
+        warehouse_order = list(WAREHOUSE_PREFIXES)
+        remaining = {warehouse: sum(warehouse in page_candidates for page_candidates in candidates.values())
+                     for warehouse in warehouse_order}
+        pages_to_classify = sorted(candidates, key=lambda idx: (
+            min((warehouse_order.index(warehouse) for warehouse in candidates[idx]), default=len(warehouse_order)), idx))
+        print(f"🔎 预扫描: {fast_pages}/{total_pages} 页已确定仓库, {len(candidates)} 页需要完整分析 "
+              f"(候选: {', '.join(f'{warehouse} {count}页' for warehouse, count in remaining.items())})")
+        for warehouse in warehouse_order:
+            if remaining[warehouse] == 0:
+                finish_early(warehouse)
+    
+    page_results = iter_classified_pages(source, total_pages, mode, algin_sku_order, workers,
+                                         fast_text and not early_output, report, pages=pages_to_classify)
+    pending_ocr = []
+    for idx, group, item, fast in page_results:
+        processed_pages += 1
+        fast_pages += fast
+        
+        # 每处理5页显示一次进度（更频繁的反馈）
+        if processed_pages % 5 == 0:
+            print(f"📊 处理进度: {processed_pages}/{total_pages} ({processed_pages/total_pages*100:.1f}%)")
+        
+        # 记录页面已处理
+        all_processed_pages.add(idx)
+        if group == "ocr_pending":
+            pending_ocr.append(idx)
+        else:
+            groups[group].append(item)
+            if group in written:
+                # 预扫描没有把它列为候选，但完整分析归入了已写出的组：最后重新生成该组，不丢页面
+                print(f"⚠️  页面{idx+1} 在 {group} 组提前输出后才归入该组，将重新生成")
+                if written[group] and group not in rewrite:
+                    superseded.append(written[group][1])
+                    report.count('early_output_rewrites')
+                rewrite.add(group)
+        report_progress('classify', processed_pages, ocr_pages=len(pending_ocr))
+        for warehouse in candidates.get(idx, ()):
+            remaining[warehouse] -= 1
+            if remaining[warehouse] == 0 and warehouse not in written:
+                finish_early(warehouse)
+    
+    # 统一并发OCR所有纯图像页面
+    if pending_ocr:
+        ocr_pages = len(pending_ocr)
+        report.count('ocr_pages', ocr_pages)
+        with report.timer('ocr'):
+            ocr_results = run_ocr_batch(
+                input_pdf, pending_ocr, plumber=source.plumber,
+                accept=lambda text: resolves_to_catalog_sku(text, algin_sku_order),
+                on_page=lambda done: report_progress('ocr', done, ocr_pages), report=report)
+        for idx in pending_ocr:
+            ocr_text, error = ocr_results[idx]
+            group, item = classify_ocr_result(idx, ocr_text, error, mode, algin_sku_order, report)
+            groups[group].append(item)
+        # 恢复各组内的页面顺序（OCR页面是最后追加的）
+        for items in groups.values():
+            items.sort(key=lambda item: item[0])
+    
+    if fast_text:
+        print(f"⚡ 快速文本分类: {fast_pages}/{total_pages} 页, 其余 {total_pages - fast_pages} 页使用pdfplumber")
+    
+    # 分类和OCR已结束，释放pdfminer的解析结果，输出阶段只用pypdf
+    source.release_plumber()
+    if low_memory:
+        # 快速路径提取过文本的页面对象不再保留，输出时按组重新解析
+        source.release_reader()
     
     # 显示最终处理进度
     print(f"📊 处理完成: {processed_pages}/{total_pages} (100.0%)")
+    report_progress('sort', processed_pages)
+    sort_started = time.perf_counter()
     
     # Sort each warehouse group
     for warehouse in ["915", "8090", "60"]:
+        groups[warehouse].sort(key=lambda item: item[0])
         groups[warehouse].sort(key=get_warehouse_sort_key)
     
     # Sort ALGIN labels by Excel SKU order
@@ -689,13 +850,14 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
             # 在Excel SKU列表中查找位置
             if algin_sku_order:
                 # 首先尝试精确匹配（对于已经匹配过的SKU）
-                if sku_string in algin_sku_order:
-                    return (0, algin_sku_order.index(sku_string))
+                position = sku_index.position(sku_string)
+                if position is not None:
+                    return (0, position)
                 
                 # 如果不是精确匹配，再尝试模糊匹配
-                for i, excel_sku in enumerate(algin_sku_order):
-                    if is_sku_match(sku_string, excel_sku):
-                        return (0, i)
+                position = sku_index.lookup_position(sku_string)
+                if position is not None:
+                    return (0, position)
                 
                 # 在Excel中没找到，但是有SKU，放在Excel SKU后面
                 return (1, sku_string)
@@ -707,6 +869,10 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
     
     if mode == "algin":
         groups["algin_sorted"].sort(key=get_algin_sort_key)
+    report.add_time('sort', time.perf_counter() - sort_started)
+    report.update_info(groups={name: len(items) for name, items in groups.items()})
+    
+    if mode == "algin":
         print(f"\n📋 ALGIN排序结果预览:")
         
         # 统计每种SKU的数量
@@ -718,7 +884,8 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
         # 显示SKU统计
         print(f"📊 SKU分布统计:")
         for sku, count in sorted(sku_counts.items()):
-            excel_index = algin_sku_order.index(sku) if sku in algin_sku_order else -1
+            excel_index = sku_index.position(sku)
+            excel_index = -1 if excel_index is None else excel_index
             print(f"   {sku}: {count}页 (Excel第{excel_index+1}位)")
         
         # 显示前15个排序结果
@@ -726,7 +893,8 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
         for i, item in enumerate(groups["algin_sorted"][:15]):
             sku = item[1] if len(item) > 1 else "未知"
             page_num = item[0] + 1
-            excel_index = algin_sku_order.index(sku) if sku in algin_sku_order else -1
+            excel_index = sku_index.position(sku)
+            excel_index = -1 if excel_index is None else excel_index
             print(f"   {i+1:2d}. 页面{page_num:3d} → {sku} (Excel第{excel_index+1}位)")
         if len(groups["algin_sorted"]) > 15:
             print(f"   ... 还有 {len(groups['algin_sorted']) - 15} 个SKU")
@@ -738,14 +906,24 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
         print(f"   ALGIN已排序: {len(groups['algin_sorted'])}")
         print(f"   ALGIN未扫描: {len(groups['algin_unscanned'])}")
         print(f"   ALGIN汇总页: {len(groups['algin_summary'])}")
+        # 多进程分类时子进程各有自己的缓存，这里只统计本进程内的查找
+        memo_after = sku_index.memo_stats()
+        memo_hits = memo_after['hits'] - memo_before['hits']
+        memo_lookups = memo_hits + memo_after['misses'] - memo_before['misses']
+        hit_rate = memo_hits / memo_lookups * 100 if memo_lookups else 0
+        print(f"   SKU解析缓存: 命中 {memo_hits}/{memo_lookups} ({hit_rate:.1f}%), 缓存条目 {memo_after['size']}")
+        report.count('sku_memo_hits', memo_hits)
+        report.count('sku_memo_lookups', memo_lookups)
+        for tier, count in sku_index.tier_stats().items():
+            if count - tiers_before.get(tier, 0):
+                report.count(f"sku_tier:{tier}", count - tiers_before.get(tier, 0))
     print(f"   915仓库: {len(groups['915'])}")
     print(f"   8090仓库: {len(groups['8090'])}")
     print(f"   60仓库: {len(groups['60'])}")
     print(f"   未知类型: {len(groups['unknown'])}")
     print(f"   空白页: {len(groups['blank'])}")
     
-    outputs = []
-    os.makedirs(output_dir, exist_ok=True)
+    report_progress('write', processed_pages)
     
     # Process groups in order based on mode
     if mode == "algin":
@@ -793,16 +971,10 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
                     print(f"❌ 错误: 没有找到任何ALGIN页面！")
                     continue
                 
-            writer = PdfWriter()
-            for item in all_pages:
-                page_idx = item[0]
-                writer.add_page(reader.pages[page_idx])
-            
             output_name = "ALGIN_Label_已排序.pdf"
             output_path = os.path.join(output_dir, output_name)
-            with open(output_path, "wb") as f:
-                writer.write(f)
-            outputs.append(output_path)
+            write_output_pdf(source, output_path, [item[0] for item in all_pages], low_memory, report)
+            written[warehouse] = (output_path, output_name, [item[0] for item in all_pages])
             print(f"✅ 生成文件: {output_name} ({len(all_pages)} 页)")
             print(f"   包含: {len(algin_with_sku)} 个SKU标签 (已跳过 {len(algin_summary_pages)} 个汇总页面)")
             
@@ -815,41 +987,31 @@ def process_pdf(input_pdf, output_dir, mode="warehouse"):
             if total_algin_pages != len(all_pages):
                 print(f"📊 未包含的页面: {total_algin_pages - len(all_pages)} 页 (可能是未扫描的标签页面)")
             continue
-            
-        pages = groups[warehouse]
-        if not pages:
-            print(f"⚠️  {warehouse} 组为空，跳过")
-            continue
-            
-        writer = PdfWriter()
-        for item in pages:
-            page_idx = item[0]
-            writer.add_page(reader.pages[page_idx])
         
-        # Determine output filename
-        if warehouse == "unknown":
-            # 检查是否包含大量ALGIN标签
-            algin_count = 0
-            for item in pages:
-                page_content = item[1] if len(item) > 1 else ""
-                if any(keyword in str(page_content).upper() for keyword in ['ALN', 'ALGIN', 'ALIGN']):
-                    algin_count += 1
-            
-            if algin_count > len(pages) * 0.5:  # 如果超过50%的页面包含ALGIN标签
-                output_name = "ALGIN标签页面_请使用ALGIN排序功能.pdf"
-                print(f"🔍 检测到 {algin_count}/{len(pages)} 页包含ALGIN标签")
-                print(f"💡 建议：请使用'ALGIN客户的Label排序'功能处理此文件")
-            else:
-                output_name = "未找到仓库.pdf"
-        elif warehouse == "blank":
-            output_name = "空白页.pdf"
-        else:
-            output_name = f"{warehouse}_Sorted.pdf"
-            
-        output_path = os.path.join(output_dir, output_name)
-        with open(output_path, "wb") as f:
-            writer.write(f)
-        outputs.append(output_path)
-        print(f"✅ 生成文件: {output_name} ({len(pages)} 页)")
+        if warehouse in written and warehouse not in rewrite:
+            continue  # 已提前输出
+        write_group(warehouse)
+    
+    # 按处理顺序汇总输出文件（提前输出的组也按原来的顺序排列）
+    outputs = []
+    output_pages = []  # [(文件名, [原PDF页码, ...])]，用于结果缓存清单
+    for warehouse in processing_order:
+        if written.get(warehouse):
+            output_path, output_name, page_indices = written[warehouse]
+            outputs.append(output_path)
+            output_pages.append((output_name, page_indices))
+    
+    if superseded:
+        report.update_info(superseded_outputs=list(superseded))
+    
+    if cache_key:
+        with report.timer('result_cache'):
+            result_cache.store(cache_key, outputs, output_pages)
+    
+    peak_mb = peak_rss_mb()
+    if peak_mb is not None:
+        print(f"📈 进程峰值内存: {peak_mb:.1f}MB")
+        report.update_info(peak_rss_mb=round(peak_mb, 1))
     
+    report_progress('done', processed_pages)
     return outputs
\ No newline at end of file
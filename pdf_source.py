@@ -0,0 +1,115 @@
+"""PDF源文件：整个文件只读内存映射一次，pdfplumber（分类、OCR渲染）和pypdf（输出）从同一份映射读取"""
+import gc
+import io
+import mmap
+
+import pdfplumber
+from pypdf import PdfReader
+
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class _MappedStream(io.RawIOBase):
+    """内存映射上的独立读取位置，多个解析器共用映射但互不干扰各自的seek"""
+
+    def __init__(self, mapping):
+        self._map = mapping
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        end = min(self._pos + len(buffer), len(self._map))
+        size = max(end - self._pos, 0)
+        buffer[:size] = self._map[self._pos:end]
+        self._pos += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class PdfSource:
+    """
+    打开一次的PDF源文件
+    plumber和reader都是按需创建、在多个阶段之间共用的解析结果；
+    文件字节只从磁盘读入页缓存一次，不再在进程内复制
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._plumber = None
+        self._reader = None
+
+    @property
+    def size(self):
+        return len(self._map)
+
+    def stream(self):
+        """返回映射上的一个新的只读文件对象"""
+        return io.BufferedReader(_MappedStream(self._map), buffer_size=STREAM_BUFFER_SIZE)
+
+    @property
+    def plumber(self):
+        """共用的pdfplumber文档，分类和OCR渲染都用它"""
+        if self._plumber is None:
+            self._plumber = pdfplumber.open(self.stream())
+        return self._plumber
+
+    @property
+    def page_count(self):
+        return len(self.plumber.pages)
+
+    def release_plumber(self):
+        """分类和OCR结束后释放pdfminer的解析结果，只保留输出阶段需要的pypdf"""
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+
+    @property
+    def reader(self):
+        """共用的PdfReader，所有输出组从同一次解析取页面"""
+        if self._reader is None:
+            self._reader = self.open_reader()
+        return self._reader
+
+    def release_reader(self):
+        if self._reader is not None:
+            self._reader = None
+            gc.collect()
+
+    def open_reader(self):
+        """单独的PdfReader，由调用方用完即丢（低内存模式按组释放）"""
+        return PdfReader(self.stream())
+
+    def close(self):
+        self.release_plumber()
+        self.release_reader()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
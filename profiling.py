@@ -0,0 +1,135 @@
+"""
+慢任务性能分析：可选地用cProfile包裹process_pdf，同时按固定间隔采样调用栈；
+耗时超过PROFILE_THRESHOLD的任务把pstats和折叠调用栈（flamegraph.pl / speedscope可直接读取）保存到输出目录下
+"""
+import os
+import sys
+import glob
+import json
+import time
+import cProfile
+import threading
+from collections import Counter
+
+PROFILE_JOBS = os.environ.get('PROFILE_JOBS', '0') == '1'
+PROFILE_THRESHOLD = float(os.environ.get('PROFILE_THRESHOLD', '60'))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.01'))
+PROFILE_SUBDIR = 'profile'
+
+# Python 3.12起每个进程同时只能有一个cProfile处于启用状态，并发的任务只做调用栈采样
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class JobProfiler:
+    """
+    只分析调用线程：cProfile提供函数级累计耗时，采样线程提供完整调用栈
+    进程池中的页面分类和OCR线程不在分析范围内，它们的耗时体现为主线程上的等待
+    同一进程中已有任务在用cProfile时只做采样（profile为None）；分析本身出错不影响任务
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.profile = None
+        self.stacks = Counter()
+        self.started = None
+        self.seconds = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def _enable_cprofile(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            print("⚠️ 已有任务在使用cProfile，本任务只做调用栈采样", flush=True)
+            return
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except Exception as e:  # 例如其他分析工具已经启用
+            _cprofile_lock.release()
+            print(f"⚠️ 无法启用cProfile，本任务只做调用栈采样: {str(e)}", flush=True)
+            return
+        self.profile = profile
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        # 先启用cProfile再启动采样线程，启用失败时采样线程也能在退出时正常停止
+        self._enable_cprofile()
+        try:
+            self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(),),
+                                             name='job-profiler', daemon=True)
+            self._sampler.start()
+        except Exception as e:
+            self._sampler = None
+            print(f"⚠️ 无法启动调用栈采样: {str(e)}", flush=True)
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.disable()
+            _cprofile_lock.release()
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.seconds = time.perf_counter() - self.started
+        return False
+
+    def save(self, output_dir, job_id, **info):
+        """保存到 <output_dir>/profile/，返回保存的文件路径列表"""
+        profile_dir = os.path.join(output_dir, PROFILE_SUBDIR)
+        os.makedirs(profile_dir, exist_ok=True)
+        base = os.path.join(profile_dir, f"profile_{job_id}")
+        paths = []
+        if self.profile is not None:
+            self.profile.dump_stats(base + '.pstats')
+            paths.append(base + '.pstats')
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'job_id': job_id, 'seconds': round(self.seconds, 3), 'samples': sum(self.stacks.values()),
+                       'cprofile': self.profile is not None, 'created_at': time.time(), **info}, f, ensure_ascii=False)
+        return paths + [base + '.collapsed', base + '.json']
+
+
+def _load_info(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # 正在写入或已被清理
+
+
+def list_profiles(root, session_id, limit=50):
+    """列出root（temp_output）下各任务输出目录中保存的、属于session_id的分析结果，最新的在前"""
+    profiles = []
+    for path in glob.glob(os.path.join(root, '*', PROFILE_SUBDIR, 'profile_*.json')):
+        info = _load_info(path)
+        if info is not None and info.get('session_id') == session_id:
+            profiles.append(info)
+    profiles.sort(key=lambda item: item.get('created_at', 0), reverse=True)
+    return profiles[:limit]
+
+
+def find_profile(root, job_id, kind, session_id):
+    """按任务ID查找属于session_id的分析文件（kind为pstats或collapsed），不存在时返回None"""
+    if kind not in ('pstats', 'collapsed') or not job_id.isalnum():
+        return None
+    for path in glob.glob(os.path.join(root, '*', PROFILE_SUBDIR, f"profile_{job_id}.{kind}")):
+        info = _load_info(os.path.splitext(path)[0] + '.json')
+        if info is not None and info.get('session_id') == session_id:
+            return path
+    return None
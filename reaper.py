@@ -0,0 +1,220 @@
+"""
+后台清理：每个进程一个清理线程，按过期时间堆等待，到期后批量删除过期的结果文件、任务记录、旧的临时目录和上传文件，
+并把temp_output和uploads/限制在磁盘配额内；多个gunicorn worker通过文件锁选出一个负责清理，不在请求路径上做任何扫描
+"""
+import os
+import re
+import time
+import heapq
+import shutil
+import threading
+
+import metrics
+import job_store
+import jobs
+import file_index
+
+try:
+    import fcntl  # Windows上没有，此时每个进程各自清理（本地开发只有一个进程）
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', '60'))  # 没有更早的到期时间时，每60秒检查一次
+TEMP_DISK_QUOTA_MB = int(os.environ.get('TEMP_DISK_QUOTA_MB', '2048'))  # temp_output和uploads/的总配额
+TEMP_DIR_MAX_AGE = 7200  # 超过2小时的临时输出目录直接删除
+UPLOAD_MAX_AGE = 3600  # 上传的PDF处理完后保留1小时
+MIN_AGE = 600  # 配额清理不删除10分钟内的文件（上传后可能还没有登记任务）
+# 只清理enqueue_upload保存的文件（时间戳_随机串_文件名.pdf），不动uploads/中的SKU目录和示例文件
+UPLOAD_NAME_PATTERN = re.compile(r'^\d+_[0-9a-f]{8}_.+\.pdf$', re.IGNORECASE)
+
+TEMP_ROOT = os.path.join(os.getcwd(), 'temp_output')
+UPLOAD_ROOT = os.path.join(os.getcwd(), 'uploads')
+LOCK_PATH = os.path.join(os.path.dirname(job_store.JOB_STORE_PATH) or '.', 'reaper.lock')
+
+_deadlines = []  # 过期时间的最小堆
+_wakeup = threading.Condition()
+_thread = None
+_lock_file = None
+
+
+def schedule(deadline):
+    """登记一个到期时间，清理线程会在该时间醒来"""
+    with _wakeup:
+        heapq.heappush(_deadlines, deadline)
+        _wakeup.notify()
+
+
+def ensure_started():
+    """延迟启动清理线程（gunicorn preload_app时需在worker进程内启动）"""
+    global _thread
+    with _wakeup:
+        if _thread is None or _thread.pid != os.getpid():
+            _thread = threading.Thread(target=_run, name='reaper', daemon=True)
+            _thread.pid = os.getpid()
+            _thread.start()
+
+
+def _is_leader():
+    """非阻塞地获取清理锁：拿到锁的进程负责清理，进程退出后锁自动释放，由其他worker接替"""
+    global _lock_file
+    if not FCNTL_AVAILABLE:
+        return True
+    if _lock_file is not None:
+        return True
+    os.makedirs(os.path.dirname(LOCK_PATH) or '.', exist_ok=True)
+    lock_file = open(LOCK_PATH, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True
+
+
+def _run():
+    last_sweep = time.time()
+    while True:
+        with _wakeup:
+            now = time.time()
+            # schedule()登记新的到期时间时也会唤醒，只有最早的到期时间或检查间隔已到时才清理
+            if now - last_sweep < REAPER_INTERVAL and not (_deadlines and _deadlines[0] <= now):
+                wait = REAPER_INTERVAL - (now - last_sweep)
+                if _deadlines:
+                    wait = min(wait, _deadlines[0] - now)
+                _wakeup.wait(max(wait, 1))
+                continue
+            while _deadlines and _deadlines[0] <= now:
+                heapq.heappop(_deadlines)
+        last_sweep = now
+        if not _is_leader():
+            continue
+        try:
+            sweep()
+            next_expiry = job_store.next_expiry()
+            if next_expiry is not None:
+                schedule(next_expiry)
+        except Exception as e:
+            print(f"⚠️ 后台清理失败: {str(e)}", flush=True)
+
+
+def _size(path):
+    """文件或目录的字节数"""
+    if not os.path.isdir(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def remove_files(paths):
+    """删除文件和随之变空的临时目录，同时删除文件索引，返回 (文件数, 字节数)"""
+    file_index.forget(paths)
+    count = size = 0
+    for file_path in paths:
+        try:
+            if os.path.exists(file_path):
+                size += os.path.getsize(file_path)
+                os.remove(file_path)
+                count += 1
+            # 清理空的临时目录
+            temp_dir = os.path.dirname(file_path)
+            if os.path.exists(temp_dir) and not os.listdir(temp_dir):
+                os.rmdir(temp_dir)
+        except Exception as e:
+            print(f"清理文件失败 {file_path}: {e}")
+    return count, size
+
+
+def _remove_entry(path):
+    """删除临时输出目录或上传文件，返回 (文件数, 字节数)"""
+    if os.path.isdir(path):
+        count = sum(len(files) for _, _, files in os.walk(path))
+        size = _size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        file_index.forget_under(path)
+        return count, size
+    return remove_files([path])
+
+
+def _managed_entries():
+    """配额管理的条目 [(修改时间, 路径)]：temp_output下的每个任务目录和enqueue_upload保存的上传文件"""
+    entries = []
+    if os.path.isdir(TEMP_ROOT):
+        for name in os.listdir(TEMP_ROOT):
+            path = os.path.join(TEMP_ROOT, name)
+            if os.path.isdir(path):
+                entries.append(path)
+    if os.path.isdir(UPLOAD_ROOT):
+        entries.extend(os.path.join(UPLOAD_ROOT, name) for name in os.listdir(UPLOAD_ROOT)
+                       if UPLOAD_NAME_PATTERN.match(name))
+    result = []
+    for path in entries:
+        try:
+            result.append((os.path.getmtime(path), path))
+        except OSError:
+            continue  # 已被删除
+    return sorted(result)
+
+
+def sweep(now=None):
+    """执行一轮清理，返回 {原因: (文件数, 字节数)}"""
+    now = now or time.time()
+    reclaimed = {}
+
+    def record(reason, result):
+        count, size = reclaimed.get(reason, (0, 0))
+        reclaimed[reason] = (count + result[0], size + result[1])
+
+    # 过期session的结果文件、过期的任务记录、所属worker已退出的任务
+    for session_id in job_store.expired_sessions(now):
+        record('expired', remove_files(job_store.delete_session_files(session_id)))
+    jobs.prune_jobs()
+
+    # 排队中和运行中任务的输入PDF和输出目录（包括已提前写出的文件）计入配额，但处理时间再长也不删除
+    active = job_store.active_job_paths()
+
+    # 超过保留时间的临时输出目录和上传文件
+    entries = _managed_entries()
+    remaining = []
+    for mtime, path in entries:
+        if os.path.abspath(path) in active:
+            remaining.append((mtime, path))
+            continue
+        max_age = TEMP_DIR_MAX_AGE if path.startswith(TEMP_ROOT) else UPLOAD_MAX_AGE
+        if now - mtime > max_age:
+            record('age', _remove_entry(path))
+        else:
+            remaining.append((mtime, path))
+
+    # 超出配额时从最旧的开始删除
+    quota = TEMP_DISK_QUOTA_MB * 1024 * 1024
+    sizes = [(mtime, path, _size(path)) for mtime, path in remaining]
+    total = sum(size for _, _, size in sizes)
+    for mtime, path, size in sizes:
+        if total <= quota:
+            break
+        if now - mtime < MIN_AGE or os.path.abspath(path) in active:
+            continue
+        record('quota', _remove_entry(path))
+        total -= size
+    if total > quota:
+        print(f"⚠️ 临时文件 {total / 1024 / 1024:.1f}MB 超出配额 {TEMP_DISK_QUOTA_MB}MB，剩余文件都在处理中或刚刚上传", flush=True)
+
+    for reason, (count, size) in reclaimed.items():
+        metrics.inc('reaper_deleted_files_total', {'reason': reason}, count)
+        metrics.inc('reaper_reclaimed_bytes_total', {'reason': reason}, size)
+    if any(count for count, _ in reclaimed.values()):
+        summary = ', '.join(f"{reason} {count}个文件 {size / 1024 / 1024:.1f}MB"
+                            for reason, (count, size) in reclaimed.items())
+        print(f"🧹 后台清理: {summary}，剩余 {total / 1024 / 1024:.1f}MB", flush=True)
+    return reclaimed
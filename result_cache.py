@@ -0,0 +1,193 @@
+"""结果缓存：按上传文件内容的SHA-256 + 处理模式 + SKU顺序/仓库前缀表版本缓存输出PDF"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from pypdf import PdfReader, PdfWriter
+
+from sku_index import SKU_INDEX_VERSION
+
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(os.getcwd(), 'cache', 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))  # 500MB
+RESULT_CACHE_MAX_AGE = int(os.environ.get('RESULT_CACHE_MAX_AGE', str(7 * 24 * 3600)))  # 7天
+RESULT_CACHE_VERSION = 2  # 处理逻辑或缓存格式变化时递增，使旧缓存失效（2: SKU按分层索引解析）
+
+MANIFEST_NAME = 'manifest.json'
+
+_evict_lock = threading.Lock()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_key(input_pdf, mode, sku_order=None, prefix_table=None, extra=None):
+    """生成缓存键：文件内容哈希 + 模式 + SKU顺序 + 仓库前缀表 + SKU解析规则版本 + 其他影响结果的参数"""
+    config = json.dumps({
+        'version': RESULT_CACHE_VERSION,
+        'sku_index_version': SKU_INDEX_VERSION,
+        'mode': mode,
+        'sku_order': sku_order,
+        'prefix_table': prefix_table,
+        'extra': extra,
+    }, sort_keys=True, ensure_ascii=False)
+    config_hash = hashlib.sha256(config.encode('utf-8')).hexdigest()[:16]
+    return f"{file_sha256(input_pdf)}_{mode}_{config_hash}"
+
+def _entry_dir(key):
+    return os.path.join(RESULT_CACHE_DIR, key)
+
+def lookup(key, input_pdf, output_dir):
+    """
+    查找缓存，命中时把输出PDF复制到output_dir并返回路径列表，未命中返回None
+    缓存的PDF文件缺失时，根据页面分类清单从原文件重建
+    """
+    entry_dir = _entry_dir(key)
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - manifest.get('created_at', 0) > RESULT_CACHE_MAX_AGE:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    reader = None
+    try:
+        for output in manifest['outputs']:
+            cached_path = os.path.join(entry_dir, output['name'])
+            output_path = os.path.join(output_dir, output['name'])
+            outputs.append(output_path)
+            if os.path.exists(cached_path):
+                shutil.copyfile(cached_path, output_path)
+            else:
+                # 从页面分类清单重建
+                if reader is None:
+                    reader = PdfReader(input_pdf)
+                writer = PdfWriter()
+                for page_idx in output['pages']:
+                    writer.add_page(reader.pages[page_idx])
+                with open(output_path, 'wb') as f:
+                    writer.write(f)
+    except Exception as e:
+        # 条目在复制过程中被替换或淘汰等，按未命中处理，删除已复制的部分文件
+        print(f"⚠️ 读取结果缓存失败，重新处理: {str(e)}")
+        for output_path in outputs:
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+        return None
+
+    # 更新访问时间，供按大小淘汰时使用（LRU）
+    try:
+        os.utime(manifest_path, None)
+    except OSError:
+        pass
+    print(f"⚡ 命中结果缓存: {key[:16]}... ({len(outputs)} 个文件)")
+    return outputs
+
+def store(key, outputs, output_pages):
+    """
+    保存处理结果到缓存
+    output_pages: [(文件名, [原PDF页码, ...]), ...]，与outputs一一对应
+    """
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        # 先写入临时目录再原子重命名，避免并发任务读到不完整的缓存
+        staging_dir = tempfile.mkdtemp(prefix='.staging_', dir=RESULT_CACHE_DIR)
+        for output_path in outputs:
+            shutil.copyfile(output_path, os.path.join(staging_dir, os.path.basename(output_path)))
+        manifest = {
+            'key': key,
+            'created_at': time.time(),
+            'outputs': [{'name': name, 'pages': pages} for name, pages in output_pages],
+        }
+        with open(os.path.join(staging_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        entry_dir = _entry_dir(key)
+        # 目录不能原子地覆盖非空目录：先把旧条目原子地移开再换入新条目，不在原位置删除，
+        # 正在从旧条目复制的lookup()会失败并按未命中处理，而不会读到删了一半的条目
+        stale_dir = None
+        if os.path.exists(entry_dir):
+            stale_dir = tempfile.mkdtemp(prefix='.stale_', dir=RESULT_CACHE_DIR)
+            try:
+                os.replace(entry_dir, os.path.join(stale_dir, 'entry'))
+            except OSError:
+                pass  # 其他任务已移开或替换
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # 其他任务已写入相同的缓存
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        if stale_dir:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+    except Exception as e:
+        print(f"⚠️ 写入结果缓存失败: {str(e)}")
+        return
+
+    evict()
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+def evict(max_bytes=None, max_age=None):
+    """按年龄和总大小淘汰缓存条目，返回 (删除条目数, 释放字节数)"""
+    max_bytes = RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = RESULT_CACHE_MAX_AGE if max_age is None else max_age
+    if not os.path.isdir(RESULT_CACHE_DIR):
+        return 0, 0
+
+    with _evict_lock:
+        now = time.time()
+        entries = []
+        for name in os.listdir(RESULT_CACHE_DIR):
+            entry_dir = os.path.join(RESULT_CACHE_DIR, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            try:
+                # 目录mtime为创建时间，manifest的mtime为最后访问时间
+                created_at = os.path.getmtime(entry_dir)
+                if name.startswith('.'):
+                    # 清理中断遗留的临时目录
+                    if now - created_at > 3600:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                last_access = os.path.getmtime(os.path.join(entry_dir, MANIFEST_NAME))
+            except OSError:
+                continue
+            entries.append((last_access, created_at, entry_dir, _dir_size(entry_dir)))
+
+        removed = 0
+        reclaimed = 0
+        total_size = sum(size for _, _, _, size in entries)
+        # 最久未访问的在前
+        for last_access, created_at, entry_dir, size in sorted(entries):
+            if now - created_at <= max_age and total_size <= max_bytes:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            removed += 1
+            reclaimed += size
+
+    if removed:
+        print(f"🗑️ 结果缓存淘汰: {removed} 个条目, 释放 {reclaimed / 1024 / 1024:.1f}MB")
+    return removed, reclaimed
@@ -0,0 +1,83 @@
+"""处理报告：process_pdf各阶段的计时和计数器，随输出文件一起返回，可写成JSON"""
+import json
+import time
+import threading
+import contextlib
+
+
+class RunReport:
+    """
+    一次process_pdf运行的报告
+    timings: 阶段名 → 累计秒数（OCR线程池中的计时按线程累加，可能超过墙钟时间）
+    counters: 计数器名 → 次数
+    info: 文件名、模式、页数、各组页数等描述信息
+    """
+
+    def __init__(self, **info):
+        self.info = dict(info)
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def update_info(self, **info):
+        with self._lock:
+            self.info.update(info)
+
+    def merge(self, data):
+        """合并子进程报告的to_dict()结果（只合并计时和计数器）"""
+        for name, seconds in data.get('timings', {}).items():
+            self.add_time(name, seconds)
+        for name, n in data.get('counters', {}).items():
+            self.count(name, n)
+
+    def finish(self):
+        self.update_info(total_seconds=round(time.perf_counter() - self._started, 4))
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'info': dict(self.info),
+                'timings': {name: round(seconds, 4) for name, seconds in self.timings.items()},
+                'counters': dict(self.counters),
+            }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+class _NullReport:
+    """不需要报告时的空实现，调用方不用判断report是否存在"""
+
+    def timer(self, name):
+        return contextlib.nullcontext()
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def update_info(self, **info):
+        pass
+
+
+NULL_REPORT = _NullReport()
@@ -0,0 +1,483 @@
+"""SKU目录索引：按目录一次性构建哈希表、OCR混淆字符表和前缀树，候选SKU查找不再逐个扫描目录"""
+import os
+import re
+import itertools
+import threading
+from collections import OrderedDict
+
+# 标准化时修正的常见OCR错误
+_NORMALIZE_REPLACEMENTS = {
+    'TF01S': 'TFO1S',  # 关键修复：OCR常把TFO1S识别为TF01S
+    'TFO15': 'TFO1S',  # S被识别为5
+    'TF015': 'TFO1S',  # 综合错误
+    'OPAC—': 'OPAC-', # 长破折号
+    'OPAC_': 'OPAC-', # 下划线
+}
+# 数字/字母常见OCR错误纠正（按顺序依次替换）
+_OCR_CORRECTIONS = {
+    '0': 'O', 'O': '0',  # 数字0和字母O互换
+    '1': 'I', 'I': '1',  # 数字1和字母I互换
+    '5': 'S', 'S': '5',  # 数字5和字母S互换
+    '8': 'B', 'B': '8',  # 数字8和字母B互换
+    '6': '9', '9': '6',  # 数字6和9互换
+    'G': '6', '6': 'G',  # 字母G和数字6互换
+    'Q': 'O', 'O': 'Q',  # 字母Q和O互换
+}
+# OCR易混淆字符归一到同一个代表字符，混淆后的SKU得到相同的键
+_CONFUSION_TABLE = str.maketrans({
+    'O': '0', 'Q': '0',
+    'I': '1',
+    'S': '5',
+    'B': '8',
+    'G': '6', '9': '6',
+})
+# OPAC编号中5/6/9的常见混淆
+_OPAC_NUMBER_EQUIVALENTS = {'5': '9', '9': '5', '6': '9', '9': '6'}
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_COMPONENT_PATTERN = re.compile(r'[A-Z0-9]+')
+_OPAC_NUMBER_PATTERN = re.compile(r'OPAC-?(\d+)')
+_TL_W_PART_PATTERN = re.compile(r'TL-?W(\w+)')
+
+# 候选SKU → 目录解析结果的LRU缓存容量（同一文件中相同的SKU会出现在几十个页面上）
+# 解析规则（分层顺序、纠错表、阈值）变化时递增，结果缓存的键包含此版本
+SKU_INDEX_VERSION = 2
+
+SKU_MEMO_SIZE = int(os.environ.get('SKU_MEMO_SIZE', '4096'))
+# 部分匹配的最低分数
+PARTIAL_MATCH_MIN_SCORE = 50
+
+# 前缀截断匹配和相似度匹配的阈值
+MIN_FUZZY_LENGTH = 6
+PREFIX_MIN_RATIO = 0.7
+SIMILARITY_THRESHOLD = 0.85
+# 相似度索引每个键包含的块数：越多键越有区分度，但每个SKU登记的键也越多
+SIMILARITY_KEY_BLOCKS = 3
+
+def normalize_sku(sku):
+    """统一破折号、去除空格并修正常见OCR错误"""
+    # 统一所有破折号和空格
+    sku = sku.replace('—', '-').replace('_', '-').replace('–', '-')
+    # 去除多余空格，但保留必要的分隔符
+    sku = _WHITESPACE_PATTERN.sub('', sku)  # 去除所有空格
+    # 处理常见OCR错误的字符替换
+    for wrong, correct in _NORMALIZE_REPLACEMENTS.items():
+        sku = sku.replace(wrong, correct)
+    return sku
+
+def apply_ocr_corrections(sku):
+    result = sku
+    for wrong, correct in _OCR_CORRECTIONS.items():
+        result = result.replace(wrong, correct)
+    return result
+
+def confusion_key(sku_norm):
+    """OCR混淆字符归一后的键，如 TF01S / TFOIS / TFO1S 得到相同的键"""
+    return sku_norm.translate(_CONFUSION_TABLE)
+
+def calculate_similarity(s1, s2):
+    # 简单的编辑距离相似度
+    if len(s1) == 0 or len(s2) == 0:
+        return 0
+
+    # 计算相同字符的比例
+    min_len = min(len(s1), len(s2))
+    max_len = max(len(s1), len(s2))
+
+    same_chars = sum(1 for i in range(min_len) if s1[i] == s2[i])
+    similarity = same_chars / max_len
+    return similarity
+
+def _max_mismatches(length):
+    """比较length个字符时，相似度仍可能≥阈值的最多不同字符数（比较的另一方更长时允许的只会更少）"""
+    same = length
+    while same > 0 and (same - 1) / length >= SIMILARITY_THRESHOLD:
+        same -= 1
+    return length - same
+
+def _similarity_block_keys(text, length):
+    """
+    相似度索引的键：把前length个字符等分为(最多不同字符数k + SIMILARITY_KEY_BLOCKS)块，每SIMILARITY_KEY_BLOCKS块组成一个键
+    最多k个字符不同时至少有SIMILARITY_KEY_BLOCKS块完全相同，所以相似的两个SKU至少共享一个键；
+    每个键包含多块，同系列SKU共同的开头（如014-HG-）不会让一个键对应整个系列
+    """
+    blocks = _max_mismatches(length) + SIMILARITY_KEY_BLOCKS
+    bounds = [length * i // blocks for i in range(blocks + 1)]
+    parts = [text[bounds[i]:bounds[i + 1]] for i in range(blocks)]
+    return [(length, chosen, tuple(parts[i] for i in chosen))
+            for chosen in itertools.combinations(range(blocks), SIMILARITY_KEY_BLOCKS)]
+
+def _partial_signature(sku):
+    """partial_match_score只看系列前缀和关键词，特征相同的目录SKU得分相同"""
+    return (tuple(sku.startswith(prefix) for prefix in ('048', 'TF', '060', '014', '050')),
+            tuple(keyword in sku for keyword in ('OPAC', 'TL', 'ROT', 'HG')))
+
+def _opac_number_matches(ocr_n, excel_n):
+    return ocr_n == excel_n or _OPAC_NUMBER_EQUIVALENTS.get(ocr_n) == excel_n
+
+def _tfo1s_in(sku_norm):
+    return 'TFO1S' in sku_norm or 'TF01S' in sku_norm or 'TFO15' in sku_norm
+
+def is_sku_match(ocr_sku, excel_sku):
+    """
+    大幅增强的SKU匹配逻辑，专门优化OCR识别准确率
+    """
+    # 标准化处理
+    ocr_clean = ocr_sku.upper().strip()
+    excel_clean = excel_sku.upper().strip()
+
+    # 1. 完全匹配
+    if ocr_clean == excel_clean:
+        return True
+
+    # 2. 标准化处理 - 增强版
+    ocr_norm = normalize_sku(ocr_clean)
+    excel_norm = normalize_sku(excel_clean)
+
+    if ocr_norm == excel_norm:
+        return True
+
+    # 3. 数字/字母常见OCR错误纠正
+    ocr_corrected = apply_ocr_corrections(ocr_norm)
+    if ocr_corrected == excel_norm:
+        return True
+
+    # 双向纠错：也对Excel进行OCR纠错尝试
+    excel_corrected = apply_ocr_corrections(excel_norm)
+    if ocr_norm == excel_corrected:
+        return True
+
+    # 4. 智能前缀/后缀匹配（处理截断问题）
+    # OCR可能截断，检查核心部分是否匹配
+    if len(ocr_norm) >= MIN_FUZZY_LENGTH and len(excel_norm) >= MIN_FUZZY_LENGTH:
+        # 前缀匹配：OCR可能被截断
+        if excel_norm.startswith(ocr_norm) and len(ocr_norm) >= len(excel_norm) * PREFIX_MIN_RATIO:
+            return True
+        # 反向：Excel在OCR中被截断
+        if ocr_norm.startswith(excel_norm) and len(excel_norm) >= len(ocr_norm) * PREFIX_MIN_RATIO:
+            return True
+
+    # 5. 核心SKU提取匹配
+    ocr_parts = _COMPONENT_PATTERN.findall(ocr_norm)
+    excel_parts = _COMPONENT_PATTERN.findall(excel_norm)
+
+    # 检查主要组件是否匹配（允许部分缺失）：至少前两个主要组件匹配
+    if len(ocr_parts) >= 2 and len(excel_parts) >= 2:
+        if ocr_parts[0] == excel_parts[0] and ocr_parts[1] == excel_parts[1]:
+            return True
+
+    # 6. 特殊SKU系列优化匹配
+
+    # OPAC系列特殊处理
+    if 'OPAC' in ocr_norm and 'OPAC' in excel_norm:
+        ocr_num = _OPAC_NUMBER_PATTERN.search(ocr_norm)
+        excel_num = _OPAC_NUMBER_PATTERN.search(excel_norm)
+        if ocr_num and excel_num:
+            # 处理5/6/9的常见混淆
+            if _opac_number_matches(ocr_num.group(1), excel_num.group(1)):
+                return True
+
+    # TFO1S系列特殊处理
+    if _tfo1s_in(ocr_norm) and 'TFO1S' in excel_norm:
+        return True
+
+    # TL系列特殊处理
+    if 'TL' in ocr_norm and 'TL' in excel_norm:
+        # 提取W后面的部分
+        ocr_w_part = _TL_W_PART_PATTERN.search(ocr_norm)
+        excel_w_part = _TL_W_PART_PATTERN.search(excel_norm)
+        if ocr_w_part and excel_w_part:
+            if ocr_w_part.group(1)[:3] == excel_w_part.group(1)[:3]:  # 前3个字符匹配
+                return True
+
+    # 7. 容错匹配：相似度计算
+    # 如果相似度很高（85%以上），认为匹配
+    similarity = calculate_similarity(ocr_norm, excel_norm)
+    if similarity >= SIMILARITY_THRESHOLD and len(ocr_norm) >= MIN_FUZZY_LENGTH and len(excel_norm) >= MIN_FUZZY_LENGTH:
+        return True
+
+    return False
+
+def partial_match_score(potential_sku, excel_sku):
+    """按系列前缀和关键词给候选SKU与目录SKU打分，用于没有精确匹配时的推断"""
+    similarity = 0
+
+    # 前缀匹配（最重要）
+    if potential_sku.startswith('048') and excel_sku.startswith('048'):
+        similarity += 50
+        if 'OPAC' in potential_sku and 'OPAC' in excel_sku:
+            similarity += 30
+        elif 'TL' in potential_sku and 'TL' in excel_sku:
+            similarity += 30
+    elif potential_sku.startswith('TF') and excel_sku.startswith('TF'):
+        similarity += 50
+    elif potential_sku.startswith('060') and excel_sku.startswith('060'):
+        similarity += 50
+    elif potential_sku.startswith('014') and excel_sku.startswith('014'):
+        similarity += 50
+    elif potential_sku.startswith('050') and excel_sku.startswith('050'):
+        similarity += 50
+
+    # 关键词匹配
+    if 'OPAC' in potential_sku and 'OPAC' in excel_sku:
+        similarity += 20
+    if 'ROT' in potential_sku and 'ROT' in excel_sku:
+        similarity += 20
+    if 'HG' in potential_sku and 'HG' in excel_sku:
+        similarity += 20
+    return similarity
+
+class SkuIndex:
+    """
+    SKU目录索引，每个目录构建一次
+    resolve() 按匹配可信度分层查找：标准化完全匹配 → OCR纠错/混淆字符 → 前缀截断 → 系列规则 → 相似度，
+    每层都用预先构建的哈希表或前缀树，查找不扫描目录：前缀树节点只保存每种长度最靠前的SKU，
+    相似度按分块键索引，部分匹配按系列特征分组
+    """
+
+    def __init__(self, catalog):
+        self.catalog = list(catalog)
+        self._positions = {}       # 目录SKU → 位置（O(1)替代list.index）
+        self._by_norm = {}         # 标准化形式 → 位置
+        self._by_corrected = {}    # OCR纠错后的标准化形式 → 位置
+        self._by_confusion = {}    # 混淆字符归一键 → 位置
+        self._by_components = {}   # 前两个组件 → 位置
+        self._by_opac_number = {}  # OPAC编号 → 位置
+        self._by_tl_w_part = {}    # TL系列W后前3个字符 → 位置
+        self._first_tfo1s = None   # 第一个TFO1S系列SKU的位置
+        self._norms = []           # 位置 → 标准化形式
+        self._by_block = {}        # 相似度分块键 → [位置]（升序）
+        self._by_partial = {}      # 部分匹配特征 → 第一个位置
+        self._trie = {}            # 标准化形式的前缀树，处理OCR截断
+        # 候选SKU解析结果的LRU缓存，分类和排序共用；多个任务线程共享同一索引
+        self._memo = OrderedDict()
+        self._memo_size = SKU_MEMO_SIZE
+        self._memo_lock = threading.Lock()
+        self._memo_stats = {'hits': 0, 'misses': 0}
+        # 实际计算（未命中LRU）的查找按命中的匹配层计数
+        self._tier_stats = {}
+
+        for position, sku in enumerate(self.catalog):
+            self._positions.setdefault(sku, position)
+            sku_norm = normalize_sku(sku.upper().strip())
+            self._by_norm.setdefault(sku_norm, position)
+            self._by_corrected.setdefault(apply_ocr_corrections(sku_norm), position)
+            self._by_confusion.setdefault(confusion_key(sku_norm), position)
+
+            parts = _COMPONENT_PATTERN.findall(sku_norm)
+            if len(parts) >= 2:
+                self._by_components.setdefault((parts[0], parts[1]), position)
+            if 'OPAC' in sku_norm:
+                opac_num = _OPAC_NUMBER_PATTERN.search(sku_norm)
+                if opac_num:
+                    self._by_opac_number.setdefault(opac_num.group(1), position)
+            if 'TL' in sku_norm:
+                w_part = _TL_W_PART_PATTERN.search(sku_norm)
+                if w_part:
+                    self._by_tl_w_part.setdefault(w_part.group(1)[:3], position)
+            if 'TFO1S' in sku_norm and self._first_tfo1s is None:
+                self._first_tfo1s = position
+            self._by_partial.setdefault(_partial_signature(sku), position)
+
+            self._norms.append(sku_norm)
+            if len(sku_norm) >= MIN_FUZZY_LENGTH:
+                self._trie_insert(sku_norm, position)
+                self._block_insert(sku_norm, position)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def _trie_insert(self, sku_norm, position):
+        node = self._trie
+        length = len(sku_norm)
+        for char in sku_norm:
+            node = node.setdefault(char, {})
+            # 子树中每种长度最靠前的SKU {长度: 位置}，条目数只取决于SKU长度的种类，与目录大小无关
+            shortest = node.setdefault('*', {})
+            if length not in shortest:
+                shortest[length] = position
+        if '$' not in node:
+            node['$'] = position
+
+    def _block_insert(self, sku_norm, position):
+        """
+        登记相似度分块键：与长度为n的OCR文本比较时只比较前min(n, 长度)个字符，
+        相似度≥阈值要求n不小于长度的85%，所以为这些比较长度各登记一组键
+        """
+        length = len(sku_norm)
+        for compared in range(max(int(length * SIMILARITY_THRESHOLD), MIN_FUZZY_LENGTH), length + 1):
+            for key in _similarity_block_keys(sku_norm, compared):
+                self._by_block.setdefault(key, []).append(position)
+
+    def _prefix_lookup(self, sku_norm):
+        """前缀截断匹配：OCR被截断（目录SKU以其开头），或目录SKU在OCR中被截断"""
+        best = None
+        length = len(sku_norm)
+        node = self._trie
+        for depth, char in enumerate(sku_norm, 1):
+            node = node.get(char)
+            if node is None:
+                return best
+            # 反向：Excel在OCR中被截断
+            if '$' in node and depth >= MIN_FUZZY_LENGTH and depth >= length * PREFIX_MIN_RATIO:
+                if best is None or node['$'] < best:
+                    best = node['$']
+        # 前缀匹配：OCR可能被截断
+        for sku_length, position in node.get('*', {}).items():
+            if length >= sku_length * PREFIX_MIN_RATIO and (best is None or position < best):
+                best = position
+        return best
+
+    def _series_lookup(self, sku_norm):
+        """核心组件和特殊SKU系列规则（OPAC / TFO1S / TL）"""
+        candidates = []
+        parts = _COMPONENT_PATTERN.findall(sku_norm)
+        if len(parts) >= 2:
+            candidates.append(self._by_components.get((parts[0], parts[1])))
+        if 'OPAC' in sku_norm:
+            opac_num = _OPAC_NUMBER_PATTERN.search(sku_norm)
+            if opac_num:
+                ocr_n = opac_num.group(1)
+                candidates.append(self._by_opac_number.get(ocr_n))
+                equivalent = _OPAC_NUMBER_EQUIVALENTS.get(ocr_n)
+                if equivalent:
+                    candidates.append(self._by_opac_number.get(equivalent))
+        if _tfo1s_in(sku_norm):
+            candidates.append(self._first_tfo1s)
+        if 'TL' in sku_norm:
+            w_part = _TL_W_PART_PATTERN.search(sku_norm)
+            if w_part:
+                candidates.append(self._by_tl_w_part.get(w_part.group(1)[:3]))
+        candidates = [position for position in candidates if position is not None]
+        return min(candidates) if candidates else None
+
+    def _similarity_lookup(self, sku_norm):
+        """
+        相似度≥85%的目录SKU中位置最靠前的一个：按比较长度（目录SKU更长时为本身长度，更短时为目录SKU长度）
+        取出共享分块键的目录SKU，再逐个计算相似度确认
+        """
+        length = len(sku_norm)
+        candidates = set()
+        for compared in range(max(int(length * SIMILARITY_THRESHOLD), MIN_FUZZY_LENGTH), length + 1):
+            for key in _similarity_block_keys(sku_norm, compared):
+                candidates.update(self._by_block.get(key, ()))
+        for position in sorted(candidates):
+            if calculate_similarity(sku_norm, self._norms[position]) >= SIMILARITY_THRESHOLD:
+                return position
+        return None
+
+    def _memoized(self, kind, candidate, compute):
+        """按 (查找类型, 候选SKU) 缓存查找结果，超过容量时淘汰最久未使用的条目"""
+        key = (kind, candidate)
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self._memo_stats['hits'] += 1
+                return self._memo[key]
+            self._memo_stats['misses'] += 1
+        result = compute(candidate)
+        with self._memo_lock:
+            self._memo[key] = result
+            self._memo.move_to_end(key)
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def memo_stats(self):
+        """返回LRU缓存命中/未命中计数的快照"""
+        with self._memo_lock:
+            return dict(self._memo_stats, size=len(self._memo))
+
+    def tier_stats(self):
+        """返回各匹配层的计数快照"""
+        with self._memo_lock:
+            return dict(self._tier_stats)
+
+    def lookup_position(self, candidate):
+        """查找候选SKU匹配的目录位置，没有匹配返回None（结果经LRU缓存）"""
+        return self._memoized('exact', candidate, self._lookup_position)
+
+    def _lookup_position(self, candidate):
+        position, tier = self._lookup_tier(candidate)
+        with self._memo_lock:
+            self._tier_stats[tier] = self._tier_stats.get(tier, 0) + 1
+        return position
+
+    def _lookup_tier(self, candidate):
+        """返回 (目录位置, 匹配层)，没有匹配时为 (None, 'none')"""
+        sku_norm = normalize_sku(candidate.upper().strip())
+
+        # 1. 标准化后完全匹配
+        position = self._by_norm.get(sku_norm)
+        if position is not None:
+            return position, 'exact'
+
+        # 2. 数字/字母常见OCR错误纠正（双向），以及混淆字符归一
+        for position in (self._by_norm.get(apply_ocr_corrections(sku_norm)),
+                         self._by_corrected.get(sku_norm),
+                         self._by_confusion.get(confusion_key(sku_norm))):
+            if position is not None:
+                return position, 'ocr_corrected'
+
+        # 3. 智能前缀/后缀匹配（处理截断问题）
+        if len(sku_norm) >= MIN_FUZZY_LENGTH:
+            position = self._prefix_lookup(sku_norm)
+            if position is not None:
+                return position, 'prefix'
+
+        # 4. 核心组件和特殊SKU系列
+        position = self._series_lookup(sku_norm)
+        if position is not None:
+            return position, 'series'
+
+        # 5. 容错匹配：相似度计算
+        if len(sku_norm) >= MIN_FUZZY_LENGTH:
+            position = self._similarity_lookup(sku_norm)
+            if position is not None:
+                return position, 'similarity'
+        return None, 'none'
+
+    def resolve(self, candidate):
+        """返回候选SKU对应的目录标准SKU，没有匹配返回None"""
+        position = self.lookup_position(candidate)
+        return self.catalog[position] if position is not None else None
+
+    def resolve_first(self, candidates):
+        """按优先级依次解析候选SKU，返回第一个匹配到的目录标准SKU"""
+        for candidate in candidates:
+            matched = self.resolve(candidate)
+            if matched is not None:
+                return matched
+        return None
+
+    def partial_match(self, candidate):
+        """没有精确匹配时按系列前缀和关键词打分，返回得分最高的目录SKU，得分不足返回None"""
+        return self._memoized('partial', candidate, self._partial_match)
+
+    def _partial_match(self, candidate):
+        """只给每组特征最靠前的目录SKU打分，结果与逐个打分相同（得分相同时取最靠前的）"""
+        best_position = None
+        best_match_score = 0
+        for position in sorted(self._by_partial.values()):
+            similarity = partial_match_score(candidate, self.catalog[position])
+            if similarity > best_match_score:
+                best_match_score = similarity
+                best_position = position
+        if best_position is not None and best_match_score >= PARTIAL_MATCH_MIN_SCORE:
+            return self.catalog[best_position]
+        return None
+
+    def position(self, sku):
+        """目录SKU的位置（精确匹配），不在目录中返回None"""
+        return self._positions.get(sku)
+
+_index_cache = {}
+
+def get_sku_index(catalog):
+    """按目录内容复用已构建的索引"""
+    key = tuple(catalog)
+    index = _index_cache.get(key)
+    if index is None:
+        index = SkuIndex(key)
+        _index_cache[key] = index
+    return index
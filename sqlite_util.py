@@ -0,0 +1,34 @@
+"""SQLite存储的公共部分：job_store、metrics和ocr_cache共用的按线程、按进程打开的WAL连接，以及进程存活检查"""
+import os
+import sqlite3
+
+
+def local_connection(local, path, init, timeout=30, row_factory=None):
+    """
+    返回local（threading.local）中保存的本线程连接；首次使用或fork之后在本进程中重新打开，
+    打开时设置WAL模式并调用init(conn)建表
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None or getattr(local, 'pid', None) != os.getpid():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=timeout)
+        if row_factory is not None:
+            conn.row_factory = row_factory
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        init(conn)
+        conn.commit()
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
+
+
+def pid_alive(pid):
+    """pid对应的进程是否仍在运行（同一台机器上）"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
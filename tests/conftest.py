@@ -0,0 +1,5 @@
+"""测试公共设置：从仓库根目录导入被测模块（与benchmarks/相同的方式）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
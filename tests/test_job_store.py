@@ -0,0 +1,121 @@
+"""SQLite任务存储：任务、session结果文件和输出文件索引"""
+import os
+import time
+import threading
+import subprocess
+import sys
+
+import pytest
+
+import job_store
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, 'JOB_STORE_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(job_store, '_local', threading.local())  # 每个测试打开新的数据库
+
+
+def _create(job_id, status='queued', owner_pid=None, **fields):
+    now = time.time()
+    job_store.create_job(dict({
+        'id': job_id, 'mode': 'warehouse', 'status': status, 'owner_pid': owner_pid or os.getpid(),
+        'progress': {'phase': 'queued'}, 'results': [], 'created_at': now, 'updated_at': now,
+    }, **fields))
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_update_bumps_version_and_round_trips_json():
+    _create('j1', session_id='s1')
+    job = job_store.get_job('j1')
+    assert job['version'] == 0 and job['progress'] == {'phase': 'queued'} and job['results'] == []
+
+    job_store.update_job('j1', status='running', progress={'phase': 'classify', 'processed': 3})
+    job = job_store.get_job('j1')
+    assert job['version'] == 1
+    assert job['status'] == 'running'
+    assert job['progress'] == {'phase': 'classify', 'processed': 3}
+
+    with pytest.raises(ValueError):
+        job_store.update_job('j1', nonsense=1)
+    assert job_store.get_job('missing') is None
+
+
+def test_list_jobs_filters_by_session_and_status():
+    _create('a', session_id='s1', created_at=1, updated_at=1)
+    _create('b', session_id='s1', status='done', created_at=2, updated_at=2)
+    _create('c', session_id='s2', created_at=3, updated_at=3)
+
+    assert [job['id'] for job in job_store.list_jobs(session_id='s1')] == ['b', 'a']
+    assert [job['id'] for job in job_store.list_jobs(statuses=('queued', 'running'))] == ['c', 'a']
+
+
+def test_active_job_paths_cover_only_queued_and_running_jobs(tmp_path):
+    _create('q', input_path='uploads/q.pdf', output_dir=str(tmp_path / 'q'))
+    _create('r', status='running', input_path=str(tmp_path / 'r.pdf'), output_dir=str(tmp_path / 'r'))
+    _create('d', status='done', input_path=str(tmp_path / 'd.pdf'), output_dir=str(tmp_path / 'd'))
+
+    assert job_store.active_job_paths() == {
+        os.path.abspath('uploads/q.pdf'), str(tmp_path / 'q'), str(tmp_path / 'r.pdf'), str(tmp_path / 'r'),
+    }
+
+
+def test_fail_orphaned_jobs_marks_jobs_of_exited_workers():
+    _create('mine', status='running')
+    _create('orphan', status='running', owner_pid=_dead_pid())
+    _create('finished', status='done', owner_pid=_dead_pid())
+
+    assert job_store.fail_orphaned_jobs(expires_at=123.0) == ['orphan']
+    orphan = job_store.get_job('orphan')
+    assert orphan['status'] == 'failed' and orphan['expires_at'] == 123.0
+    assert job_store.get_job('mine')['status'] == 'running'
+    assert job_store.get_job('finished')['status'] == 'done'
+
+
+def test_expired_jobs_and_sessions():
+    now = time.time()
+    _create('old', status='done', expires_at=now - 10)
+    _create('new', status='done', expires_at=now + 10)
+    job_store.set_session_files('s-old', ['/tmp/a.pdf'], now - 10)
+    job_store.set_session_files('s-new', ['/tmp/b.pdf'], now + 10)
+
+    assert job_store.next_expiry() == now - 10
+    assert job_store.delete_expired_jobs() == 1
+    assert job_store.get_job('old') is None and job_store.get_job('new') is not None
+    assert job_store.expired_sessions() == ['s-old']
+    assert job_store.count_sessions() == 1
+
+
+def test_session_files_rename_and_delete():
+    job_store.set_session_files('s1', ['/out/a.pdf', '/out/b.pdf'], time.time() + 60)
+
+    assert job_store.replace_session_file('s1', '/out/a.pdf', '/out/c.pdf')
+    assert job_store.get_session_files('s1')['files'] == ['/out/c.pdf', '/out/b.pdf']
+    assert not job_store.replace_session_file('missing', '/out/a.pdf', '/out/c.pdf')
+
+    assert job_store.delete_session_files('s1') == ['/out/c.pdf', '/out/b.pdf']
+    assert job_store.get_session_files('s1') is None
+    assert job_store.delete_session_files('s1') == []
+
+
+def test_files_keep_their_id_when_registered_again_or_renamed():
+    entry = {'id': 'f' * 32, 'path': '/out/job/915_Sorted.pdf', 'name': '915_Sorted.pdf', 'size': 10,
+             'mtime_ns': 1, 'etag': 'e1', 'session_id': 's1', 'job_id': 'j1'}
+    assert job_store.add_files([entry]) == {entry['path']: entry['id']}
+    # 提前输出的组重新生成后再次登记：保留原ID，更新大小和ETag
+    ids = job_store.add_files([dict(entry, id='0' * 32, size=20, etag='e2')])
+    assert ids == {entry['path']: entry['id']}
+    row = job_store.get_file(entry['id'])
+    assert (row['size'], row['etag']) == (20, 'e2')
+
+    job_store.rename_file(entry['id'], '/out/job/renamed.pdf')
+    assert job_store.get_file_by_path('/out/job/renamed.pdf')['id'] == entry['id']
+    assert job_store.find_session_file('s1', 'renamed.pdf')['id'] == entry['id']
+
+    job_store.delete_files_under('/out/job')
+    assert job_store.get_file(entry['id']) is None
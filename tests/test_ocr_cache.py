@@ -0,0 +1,65 @@
+"""OCR文本缓存：按 (图像哈希, 引擎配置) 存取、LRU淘汰和感知哈希"""
+import threading
+
+import pytest
+
+import ocr_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_PATH', str(tmp_path / 'ocr_cache.sqlite3'))
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_ENABLED', True)
+    monkeypatch.setattr(ocr_cache, '_local', threading.local())  # 每个测试打开新的数据库
+
+
+def test_put_then_get_by_any_hash_and_engine():
+    assert ocr_cache.get('p:1', 'tess-a') is None
+    ocr_cache.put(['x:1', 'p:1', None], 'tess-a', '048-OPAC-5', '--psm 6')
+
+    assert ocr_cache.get('x:1', 'tess-a') == ('048-OPAC-5', '--psm 6')
+    assert ocr_cache.get('p:1', 'tess-a') == ('048-OPAC-5', '--psm 6')
+    # 引擎配置不同（分辨率、区域、tesseract版本）时不命中
+    assert ocr_cache.get('p:1', 'tess-b') is None
+    assert ocr_cache.get(None, 'tess-a') is None
+
+
+def test_put_replaces_text_for_same_key():
+    ocr_cache.put(['p:1'], 'tess', 'old', None)
+    ocr_cache.put(['p:1'], 'tess', 'new', '--psm 4')
+    assert ocr_cache.get('p:1', 'tess') == ('new', '--psm 4')
+
+
+def test_evicts_least_recently_used_over_limit(monkeypatch):
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_MAX_ENTRIES', 2)
+    clock = iter(range(100, 200))
+    monkeypatch.setattr(ocr_cache.time, 'time', lambda: next(clock))
+
+    ocr_cache.put(['a'], 'tess', 'A', None)
+    ocr_cache.put(['b'], 'tess', 'B', None)
+    assert ocr_cache.get('a', 'tess') == ('A', None)  # a变为最近使用
+    ocr_cache.put(['c'], 'tess', 'C', None)
+
+    assert ocr_cache.get('b', 'tess') is None
+    assert ocr_cache.get('a', 'tess') == ('A', None)
+    assert ocr_cache.get('c', 'tess') == ('C', None)
+
+
+def test_disabled_cache_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(ocr_cache, 'OCR_CACHE_ENABLED', False)
+    ocr_cache.put(['p:1'], 'tess', 'text', None)
+    assert ocr_cache.get('p:1', 'tess') is None
+
+
+def test_perceptual_hash_depends_on_content_not_encoding():
+    Image = pytest.importorskip('PIL.Image')
+    image = Image.new('L', (400, 300), 255)
+    for x in range(50, 350):
+        for y in range(100, 140):
+            image.putpixel((x, y), 0 if (x // 20) % 2 else 255)
+    blank = Image.new('L', (400, 300), 255)
+
+    # 同一页面重新渲染成RGB等其他格式时键不变
+    assert ocr_cache.perceptual_hash(image) == ocr_cache.perceptual_hash(image.convert('RGB'))
+    assert ocr_cache.perceptual_hash(image) != ocr_cache.perceptual_hash(blank)
+    assert ocr_cache.perceptual_hash(image).startswith('p:')
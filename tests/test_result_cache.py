@@ -0,0 +1,105 @@
+"""结果缓存的键、暂存目录换入和淘汰"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip('pypdf')  # result_cache在缓存文件缺失时用pypdf重建输出
+
+import result_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'results'
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def input_pdf(tmp_path):
+    path = tmp_path / 'input.pdf'
+    path.write_bytes(b'%PDF-1.4 sample')
+    return str(path)
+
+
+def _outputs(directory, contents):
+    directory.mkdir(exist_ok=True)
+    paths = []
+    for name, data in contents.items():
+        path = directory / name
+        path.write_bytes(data)
+        paths.append(str(path))
+    return paths
+
+
+def test_key_depends_on_content_mode_and_tables(tmp_path, input_pdf):
+    key = result_cache.make_key(input_pdf, 'warehouse', prefix_table={'915': ['WZ']})
+    assert key == result_cache.make_key(input_pdf, 'warehouse', prefix_table={'915': ['WZ']})
+    assert key.startswith(result_cache.file_sha256(input_pdf))
+    assert key != result_cache.make_key(input_pdf, 'algin', prefix_table={'915': ['WZ']})
+    assert key != result_cache.make_key(input_pdf, 'warehouse', prefix_table={'915': ['WX']})
+    assert key != result_cache.make_key(input_pdf, 'warehouse', prefix_table={'915': ['WZ']},
+                                        extra={'ocr_engine': 'other'})
+
+    # 同样内容的文件得到同样的键，内容不同则不同
+    copy = tmp_path / 'copy.pdf'
+    copy.write_bytes(b'%PDF-1.4 sample')
+    assert result_cache.make_key(str(copy), 'warehouse') == result_cache.make_key(input_pdf, 'warehouse')
+    copy.write_bytes(b'%PDF-1.4 changed')
+    assert result_cache.make_key(str(copy), 'warehouse') != result_cache.make_key(input_pdf, 'warehouse')
+
+
+def test_store_then_lookup_copies_outputs(tmp_path, cache_dir, input_pdf):
+    outputs = _outputs(tmp_path / 'out', {'915_Sorted.pdf': b'a' * 10, '空白页.pdf': b'b' * 5})
+    result_cache.store('k1', outputs, [('915_Sorted.pdf', [0, 2]), ('空白页.pdf', [1])])
+
+    # 条目经暂存目录整体换入，不留下临时目录
+    assert sorted(os.listdir(cache_dir)) == ['k1']
+
+    restored = result_cache.lookup('k1', input_pdf, str(tmp_path / 'again'))
+    assert [os.path.basename(path) for path in restored] == ['915_Sorted.pdf', '空白页.pdf']
+    assert open(restored[0], 'rb').read() == b'a' * 10
+    assert result_cache.lookup('missing', input_pdf, str(tmp_path / 'again')) is None
+
+
+def test_store_replaces_existing_entry(tmp_path, cache_dir, input_pdf):
+    result_cache.store('k1', _outputs(tmp_path / 'v1', {'915_Sorted.pdf': b'old'}), [('915_Sorted.pdf', [0])])
+    result_cache.store('k1', _outputs(tmp_path / 'v2', {'8090_Sorted.pdf': b'new'}), [('8090_Sorted.pdf', [0])])
+
+    assert sorted(os.listdir(cache_dir)) == ['k1']
+    restored = result_cache.lookup('k1', input_pdf, str(tmp_path / 'out'))
+    assert [os.path.basename(path) for path in restored] == ['8090_Sorted.pdf']
+    assert open(restored[0], 'rb').read() == b'new'
+
+
+def test_expired_entry_is_a_miss(tmp_path, cache_dir, input_pdf, monkeypatch):
+    result_cache.store('k1', _outputs(tmp_path / 'out', {'a.pdf': b'x'}), [('a.pdf', [0])])
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_MAX_AGE', -1)
+    assert result_cache.lookup('k1', input_pdf, str(tmp_path / 'again')) is None
+
+
+def test_evict_removes_least_recently_used_over_quota(tmp_path, cache_dir, input_pdf):
+    for key in ('old', 'used', 'new'):
+        result_cache.store(key, _outputs(tmp_path / key, {'a.pdf': b'x' * 100}), [('a.pdf', [0])])
+    now = time.time()
+    for offset, key in enumerate(('old', 'used', 'new')):
+        os.utime(cache_dir / key / result_cache.MANIFEST_NAME, (now - 300 + offset, now - 300 + offset))
+    # 命中会刷新访问时间，'used'变为最近使用
+    assert result_cache.lookup('used', input_pdf, str(tmp_path / 'hit')) is not None
+
+    manifest_size = os.path.getsize(cache_dir / 'old' / result_cache.MANIFEST_NAME)
+    removed, reclaimed = result_cache.evict(max_bytes=2 * (100 + manifest_size), max_age=3600)
+
+    assert removed == 1
+    assert reclaimed == 100 + manifest_size
+    assert sorted(os.listdir(cache_dir)) == ['new', 'used']
+
+
+def test_evict_drops_entries_older_than_max_age(tmp_path, cache_dir):
+    result_cache.store('k1', _outputs(tmp_path / 'out', {'a.pdf': b'x'}), [('a.pdf', [0])])
+    old = time.time() - 7200
+    os.utime(cache_dir / 'k1', (old, old))
+
+    assert result_cache.evict(max_age=3600)[0] == 1
+    assert os.listdir(cache_dir) == []
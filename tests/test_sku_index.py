@@ -0,0 +1,122 @@
+"""SkuIndex与原来逐个调用is_sku_match扫描目录的结果对比"""
+import random
+
+import pytest
+
+from sku_index import (
+    SkuIndex, is_sku_match, normalize_sku, calculate_similarity, partial_match_score,
+    MIN_FUZZY_LENGTH, PREFIX_MIN_RATIO, SIMILARITY_THRESHOLD, PARTIAL_MATCH_MIN_SCORE,
+)
+
+SAMPLE_CATALOG = [
+    '048-OPAC-5', '048-OPAC-9', '048-TL-W6KWD', '048-TL-W6KBK', 'TFO1S-BK', 'TFO1S-WH',
+    '014-HG-17061-A', '014-HG-17061-BRO', '014-HG-41023', '050-HA-50028', '050-LMT-23-GY',
+    '060-ROT-11L-WH', '060-ROT-15V2-DG',
+]
+_CHARS = 'ABCDEFGHJKLMNPRTUVWXYZ0123456789'
+
+
+def _synthetic_catalog(rng, size):
+    """带有共同系列前缀的合成目录（真实目录中同系列SKU只有末尾不同）"""
+    skus = list(SAMPLE_CATALOG)
+    while len(skus) < size:
+        kind = rng.random()
+        if kind < 0.3:
+            sku = f"048-OPAC-{rng.randint(1, 999)}{rng.choice(['', '-BK', '-WH'])}"
+        elif kind < 0.5:
+            sku = f"014-HG-{rng.randint(10000, 99999)}-{rng.choice(['A', 'B', 'BRO', 'GY'])}"
+        else:
+            sku = (''.join(rng.choice(_CHARS) for _ in range(rng.randint(3, 5))) + '-'
+                   + ''.join(rng.choice(_CHARS) for _ in range(rng.randint(2, 8))))
+        skus.append(sku)
+    return list(dict.fromkeys(skus))
+
+
+def _ocr_variants(rng, catalog, count):
+    """模拟OCR错误：替换一个字符、截断、多读出几个字符，外加完全不相关的文本"""
+    variants = []
+    for _ in range(count):
+        chars = list(rng.choice(catalog))
+        kind = rng.random()
+        if kind < 0.4:
+            chars[rng.randrange(len(chars))] = rng.choice(_CHARS)
+        elif kind < 0.7:
+            chars = chars[:rng.randint(max(1, len(chars) - 4), len(chars))]
+        else:
+            chars += [rng.choice(_CHARS) for _ in range(rng.randint(1, 3))]
+        variants.append(''.join(chars))
+    variants += [''.join(rng.choice(_CHARS) for _ in range(rng.randint(6, 14))) for _ in range(count // 4)]
+    return variants
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return _synthetic_catalog(random.Random(7), 1500)
+
+
+@pytest.fixture(scope='module')
+def index(catalog):
+    return SkuIndex(catalog)
+
+
+@pytest.fixture(scope='module')
+def queries(catalog):
+    return _ocr_variants(random.Random(11), catalog, 400)
+
+
+def _norm(sku):
+    return normalize_sku(sku.upper().strip())
+
+
+def test_catalog_skus_resolve_to_themselves(index, catalog):
+    for sku in catalog:
+        assert index.resolve(sku) == sku
+
+
+def test_unresolved_exactly_when_is_sku_match_finds_nothing(index, catalog, queries):
+    for query in queries:
+        matched = any(is_sku_match(query, sku) for sku in catalog)
+        assert (index.resolve(query) is not None) == matched, query
+
+
+def test_prefix_tier_matches_is_sku_match_prefix_rule(index, catalog, queries):
+    """is_sku_match第4步（截断前缀）在整个目录中最靠前的匹配"""
+    norms = [_norm(sku) for sku in catalog]
+    for query in map(_norm, queries):
+        if len(query) < MIN_FUZZY_LENGTH:
+            continue
+        expected = next((position for position, sku in enumerate(norms) if len(sku) >= MIN_FUZZY_LENGTH and (
+            sku.startswith(query) and len(query) >= len(sku) * PREFIX_MIN_RATIO
+            or query.startswith(sku) and len(sku) >= len(query) * PREFIX_MIN_RATIO)), None)
+        assert index._prefix_lookup(query) == expected, query
+
+
+def test_similarity_tier_matches_is_sku_match_similarity_rule(index, catalog, queries):
+    """is_sku_match第7步（相似度≥85%）在整个目录中最靠前的匹配"""
+    norms = [_norm(sku) for sku in catalog]
+    for query in map(_norm, queries):
+        if len(query) < MIN_FUZZY_LENGTH:
+            continue
+        expected = next((position for position, sku in enumerate(norms) if len(sku) >= MIN_FUZZY_LENGTH
+                         and calculate_similarity(query, sku) >= SIMILARITY_THRESHOLD), None)
+        assert index._similarity_lookup(query) == expected, query
+
+
+def test_partial_match_matches_full_catalog_scan(index, catalog, queries):
+    for query in queries + ['048-XYZ', 'TF-123', '060-Q', '014HG', 'NOTHING1']:
+        best, best_score = None, 0
+        for sku in catalog:
+            score = partial_match_score(query, sku)
+            if score > best_score:
+                best, best_score = sku, score
+        expected = best if best and best_score >= PARTIAL_MATCH_MIN_SCORE else None
+        assert index.partial_match(query) == expected, query
+
+
+def test_exact_read_wins_over_shared_components():
+    # 原来按目录顺序逐个is_sku_match时，所有014-HG-*都会落到第一个014-HG SKU上
+    index = SkuIndex(SAMPLE_CATALOG)
+    assert index.resolve('014-HG-41023') == '014-HG-41023'
+    assert index.resolve('014-HG-99999') == '014-HG-17061-A'
+    assert index.resolve('TF01S-BK') == 'TFO1S-BK'
+    assert index.resolve('ZZZZZZ') is None
@@ -0,0 +1,39 @@
+"""流式ZIP生成的数据能被zipfile完整读回"""
+import io
+import zipfile
+
+import zip_stream
+
+
+def test_round_trip_through_zipfile(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_stream, 'CHUNK_SIZE', 1000)  # 让文件跨多个读取块
+    contents = {
+        '915_Sorted.pdf': bytes(range(256)) * 20,
+        '空白页.pdf': b'%PDF-1.4\n',
+        'empty.pdf': b'',
+    }
+    files = []
+    for name, data in contents.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        files.append((name, str(path)))
+
+    chunks = list(zip_stream.iter_zip(files))
+
+    assert all(chunks)  # 不发送空块
+    assert len(chunks) > len(files)
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(contents)
+        for name, data in contents.items():
+            assert archive.getinfo(name).compress_type == zipfile.ZIP_STORED
+            assert archive.read(name) == data
+
+
+def test_archive_name_may_differ_from_path(tmp_path):
+    path = tmp_path / 'tmp_8090.pdf'
+    path.write_bytes(b'data')
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_stream.iter_zip([('8090_Sorted.pdf', str(path))]))))
+
+    assert archive.read('8090_Sorted.pdf') == b'data'
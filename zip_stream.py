@@ -0,0 +1,61 @@
+"""
+流式ZIP：把多个文件按存储模式（不压缩）打包，边生成边发送，不在磁盘上创建临时压缩包，
+内存占用只有一个读取块，与文件大小和数量无关
+"""
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkBuffer:
+    """zipfile写入的不可seek输出流，生成器每次取走已写入的数据"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile用tell()记录每个文件头的偏移，不需要seek
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(files):
+    """
+    files为 [(压缩包内的文件名, 文件路径)]，逐块生成ZIP数据
+    输出流不可seek，zipfile会在每个文件后写数据描述符（CRC和大小），因此无需预先读一遍文件
+    """
+    for data in _iter_zip(files):
+        if data:  # 空块在分块传输编码中表示结束，不能发送
+            yield data
+
+
+def _iter_zip(files):
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, path in files:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(os.path.getmtime(path))[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            # 预先给出大小，zipfile据此决定是否使用ZIP64头
+            info.file_size = os.path.getsize(path)
+            with open(path, 'rb') as src, archive.open(info, 'w') as dest:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    dest.write(chunk)
+                    yield buffer.take()
+            yield buffer.take()
+    # 中央目录在关闭压缩包时写出
+    yield buffer.take()